@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from question_keys import normalize_question
+from search_filters import source_files
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerStore:
+    """
+    Precomputed answers to frequently asked questions, written by `precompute_answers.py`.
+
+    Answers are keyed by the normalized question and were generated without filters, so they
+    are only served to unfiltered questions outside a conversation session. Request threads,
+    the suggestion refresh and cache invalidation use the store concurrently, so the answers
+    are only read and changed under a lock.
+    """
+
+    def __init__(self, collection_name: str):
+        self.collection_name = collection_name
+        self.top_k = 0
+        self._answers: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self, path: Path) -> bool:
+        """Load a store file; stores built for another collection are ignored"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load answer store {path}: {str(e)}")
+            return False
+        if data.get("collection") != self.collection_name:
+            logger.warning(f"Answer store {path} was built for collection '{data.get('collection')}', ignoring it")
+            return False
+        answers = data.get("answers", {})
+        with self._lock:
+            self.top_k = data.get("top_k", 0)
+            self._answers = answers
+        logger.info(f"Loaded {len(answers)} precomputed answers from {path}")
+        return True
+
+    def get(self, question: str, top_k: int) -> Optional[Dict]:
+        """Return {"answer", "sources"} for a known question, or None"""
+        if top_k > self.top_k:
+            return None
+        with self._lock:
+            entry = self._answers.get(normalize_question(question))
+        if entry is None:
+            return None
+        return {"answer": entry["answer"], "sources": entry["sources"][:top_k]}
+
+    def add(self, question: str, answer: str, sources: List[Dict[str, str]]):
+        with self._lock:
+            self._answers[normalize_question(question)] = {"question": question, "answer": answer, "sources": sources}
+
+    def questions(self) -> List[str]:
+        """The original wording of every stored question"""
+        with self._lock:
+            return [entry["question"] for entry in self._answers.values()]
+
+    def invalidate_sources(self, sources: Iterable[str]):
+        """
+        Stop serving answers that were generated from any of the given (re-ingested) sources,
+        including chunks kept for duplicates in those sources
+        """
+        changed = set(sources)
+        with self._lock:
+            stale = [key for key, entry in self._answers.items()
+                     if any(source_files(source) & changed for source in entry["sources"])]
+            for key in stale:
+                del self._answers[key]
+        if stale:
+            logger.info(f"Dropped {len(stale)} precomputed answers citing changed sources")
+
+    def clear(self):
+        with self._lock:
+            self._answers = {}
+
+    def save(self, path: Path, top_k: int):
+        """Write the store compactly via a temporary file, so a running backend never reads half a file"""
+        self.top_k = top_k
+        with self._lock:
+            answers = dict(self._answers)
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"collection": self.collection_name, "top_k": top_k, "answers": answers},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def __len__(self) -> int:
+        return len(self._answers)
@@ -1,29 +1,62 @@
-import os
-from dotenv import load_dotenv
-from dotenv import dotenv_values
+import hmac
+import threading
+from functools import lru_cache
+from pathlib import Path
 import logging
 from typing import Dict, List, Optional
 
+from rag_pipeline import (
+    HFChatGenerator,
+    QdrantRetriever,
+    RagPipeline,
+    load_config,
+    query_log_from_config,
+    router_from_config,
+    scheduler_from_config,
+    shape_sources,
+    shared_cache_from_config,
+    source_from_payload,
+)
+
 # Load environment variables
-config = dotenv_values(".env")
-if not config:
-    config = os.environ
+config = load_config()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Import after loading env vars to avoid circular import issues
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Response
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import QdrantVectorStore
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 from huggingface_hub import InferenceClient
 import uvicorn
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+
+# Optional brotli compression, used when the package is installed
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+from storage_profiles import build_search_params, get_storage_profile
+from search_filters import build_filter_conditions
+from session_store import SessionStore, normalize_embedding
+from shared_cache import SharedCache
+from question_keys import answer_key
+from answer_store import AnswerStore
+from query_log import QueryLog, QueryTrace
+from profiling import RequestProfiler, allocation_snapshot, sample_stacks
+from local_index import LocalIndex
+from index_artifact import index_path, model_path, read_manifest
+from book_registry import BookIndex, IndexRegistry, load_books
+from suggest_index import SuggestIndex, docs_headings, suggestible_cached_answer
+from request_scheduler import QueueFull, classify_request, request_priority
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -40,25 +73,152 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Responses larger than this are compressed: brotli when brotli-asgi is installed (falling back
+# to gzip for clients without brotli support), gzip otherwise
+RESPONSE_COMPRESS_MIN_BYTES = int(config.get('RESPONSE_COMPRESS_MIN_BYTES', 1000))
+if BrotliMiddleware is not None:
+    app.add_middleware(BrotliMiddleware, minimum_size=RESPONSE_COMPRESS_MIN_BYTES)
+else:
+    app.add_middleware(GZipMiddleware, minimum_size=RESPONSE_COMPRESS_MIN_BYTES)
+
+# Self-contained index artifact (see index_artifact.py). When set, the backend serves the
+# artifact's book read-only, with the artifact's embedding model, and never contacts Qdrant
+INDEX_ARTIFACT_PATH = config.get('INDEX_ARTIFACT_PATH')
+if INDEX_ARTIFACT_PATH:
+    # Follow the version link once, so the manifest, index and model all come from one version
+    # even if a new artifact is written while the backend starts
+    INDEX_ARTIFACT_PATH = str(Path(INDEX_ARTIFACT_PATH).resolve())
+artifact_manifest = read_manifest(Path(INDEX_ARTIFACT_PATH)) if INDEX_ARTIFACT_PATH else None
+
 # Configuration constants
-COLLECTION_NAME = config['COLLECTION_NAME']
-QDRANT_URL = config['QDRANT_URL']
-QDRANT_API_KEY = config['QDRANT_API_KEY']
+COLLECTION_NAME = artifact_manifest["collection"] if artifact_manifest else config['COLLECTION_NAME']
+QDRANT_URL = config.get('QDRANT_URL') if artifact_manifest else config['QDRANT_URL']
+QDRANT_API_KEY = config.get('QDRANT_API_KEY') if artifact_manifest else config['QDRANT_API_KEY']
 HF_API_TOKEN = config['HF_API_TOKEN']
 EMBEDDING_MODEL_NAME = config['EMBEDDING_MODEL_NAME']
 GENERATION_MODEL_NAME = config['GENERATION_MODEL_NAME']
+STORAGE_PROFILE = config.get('STORAGE_PROFILE')
+# Shared secret for the /api/admin endpoints; they are disabled when it is not set
+ADMIN_TOKEN = config.get('ADMIN_TOKEN')
+
+# Search parameters matching the storage profile the collection was created with
+SEARCH_PARAMS = build_search_params(get_storage_profile(STORAGE_PROFILE))
+
+# Conversation session settings
+SESSION_MAX_SESSIONS = int(config.get('SESSION_MAX_SESSIONS', 1000))
+SESSION_MAX_TURNS = int(config.get('SESSION_MAX_TURNS', 5))
+SESSION_IDLE_TTL_SECONDS = float(config.get('SESSION_IDLE_TTL_SECONDS', 1800))
+# A follow-up this similar to an earlier question in the session reuses that turn's chunks
+SESSION_REUSE_THRESHOLD = float(config.get('SESSION_REUSE_THRESHOLD', 0.9))
+# A follow-up this similar still carries the earlier turn's best chunks over as context
+SESSION_CARRY_THRESHOLD = float(config.get('SESSION_CARRY_THRESHOLD', 0.4))
+SESSION_CARRY_CHUNKS = int(config.get('SESSION_CARRY_CHUNKS', 1))
+SESSION_HISTORY_TOKEN_BUDGET = int(config.get('SESSION_HISTORY_TOKEN_BUDGET', 300))
+
+# Precomputed FAQ answers written by precompute_answers.py
+ANSWER_STORE_PATH = Path(config.get('ANSWER_STORE_PATH', 'precomputed_answers.json'))
+
+answer_store = AnswerStore(COLLECTION_NAME)
+
+# Type-ahead suggestions from precomputed questions, cached questions and docs headings; each
+# worker rebuilds its index this often, and right after an invalidation
+SUGGEST_REFRESH_SECONDS = float(config.get('SUGGEST_REFRESH_SECONDS', 60))
+SUGGEST_MIN_CHARS = int(config.get('SUGGEST_MIN_CHARS', 2))
+# Questions typed by users become suggestions for others only once they were asked this often
+SUGGEST_MIN_ASKS = int(config.get('SUGGEST_MIN_ASKS', 3))
+SUGGEST_MAX_LIMIT = 10
+
+session_store = SessionStore(
+    max_sessions=SESSION_MAX_SESSIONS,
+    max_turns=SESSION_MAX_TURNS,
+    idle_ttl_seconds=SESSION_IDLE_TTL_SECONDS,
+)
+
+# Opt-in profiling: the /api/admin/profile endpoints exist only when enabled
+PROFILING_ENABLED = config.get('PROFILING_ENABLED', 'false').lower() == 'true'
+PROFILE_MAX_SECONDS = float(config.get('PROFILE_MAX_SECONDS', 60))
+# Fraction of queries profiled with cProfile (0 disables), and where the .pstats files are kept
+REQUEST_PROFILE_SAMPLE_RATE = float(config.get('REQUEST_PROFILE_SAMPLE_RATE', 0)) if PROFILING_ENABLED else 0.0
+REQUEST_PROFILE_DIR = Path(config.get('REQUEST_PROFILE_DIR', 'profiles'))
+REQUEST_PROFILE_KEEP = int(config.get('REQUEST_PROFILE_KEEP', 50))
+
+request_profiler = RequestProfiler(REQUEST_PROFILE_SAMPLE_RATE, REQUEST_PROFILE_DIR, keep=REQUEST_PROFILE_KEEP)
+
+# Answer routing, upstream scheduling, the shared cache and the query log are configured the
+# same way for every deployment (see rag_pipeline.py)
+answer_router = router_from_config(config)
+upstream_scheduler = scheduler_from_config(config)
+# Requests are interactive unless they send "X-Request-Priority: bulk" or an "X-API-Key" listed in
+# BULK_API_KEYS; queries refused because too many bulk calls wait get 429, which also keeps waiting
+# bulk queries from tying up the threads that serve sync endpoints
+BULK_API_KEYS = {key.strip() for key in config.get('BULK_API_KEYS', '').split(',') if key.strip()}
+
+# Length of the source snippets returned when a client does not want the full chunk text
+RESPONSE_SNIPPET_CHARS = int(config.get('RESPONSE_SNIPPET_CHARS', 200))
+# Chunks served by /api/chunk/{id} that are kept in memory
+CHUNK_CACHE_SIZE = int(config.get('CHUNK_CACHE_SIZE', 4096))
+CHUNK_MAX_AGE_SECONDS = int(config.get('CHUNK_MAX_AGE_SECONDS', 600))
+
+# Optional in-process index exported by `ingest_backend.py --local-index`; when set, searches
+# of the default book run against it instead of Qdrant
+LOCAL_INDEX_PATH = config.get('LOCAL_INDEX_PATH')
+
+# Books served by this deployment (see book_registry.py); without a books file the configured
+# collection is the only book
+if artifact_manifest:
+    BOOKS = {COLLECTION_NAME: {
+        "collection": COLLECTION_NAME,
+        "docs": None,
+        "local_index": str(index_path(Path(INDEX_ARTIFACT_PATH))),
+        "title": artifact_manifest.get("title"),
+    }}
+else:
+    BOOKS = load_books(Path(config.get('BOOKS_CONFIG_PATH', 'books.json')), COLLECTION_NAME,
+                       default_local_index=LOCAL_INDEX_PATH)
+DEFAULT_BOOK = config.get('DEFAULT_BOOK', COLLECTION_NAME if COLLECTION_NAME in BOOKS else next(iter(BOOKS)))
+# Book indexes are loaded on first use and unloaded least recently used first beyond these limits
+INDEX_MAX_RESIDENT_MB = int(config.get('INDEX_MAX_RESIDENT_MB', 2048))
+INDEX_MAX_LOADED_BOOKS = int(config.get('INDEX_MAX_LOADED_BOOKS', 16))
 
 # Global variables for clients
 qdrant_client: Optional[QdrantClient] = None
 embeddings: Optional[HuggingFaceEmbeddings] = None
-qdrant_vector_store: Optional[QdrantVectorStore] = None
 hf_client: Optional[InferenceClient] = None
+shared_cache: Optional[SharedCache] = None
+# Searches the Qdrant-backed books; books with a local index are searched in process
+qdrant_retriever: Optional[QdrantRetriever] = None
+# Embed / retrieve / generate stages, assembled at startup once the clients exist
+pipeline: Optional[RagPipeline] = None
+# Suggestion index per book, replaced wholesale by the refresh thread
+suggest_indexes: Dict[str, SuggestIndex] = {}
+suggest_refresh = threading.Event()
+query_log: Optional[QueryLog] = None
+# Shared cache version up to which invalidations have been applied to this worker's own caches
+local_cache_version = 0
+local_cache_lock = threading.Lock()
 
 
 class QueryRequest(BaseModel):
     """Request model for query endpoint"""
     question: str
     top_k: int = 3
+    source: Optional[str] = None  # Restrict search to one source file, e.g. "chapter-02-hardware.md"
+    chapter: Optional[str] = None  # Restrict search to one chapter (Docusaurus doc id), e.g. "chapter-02-hardware"
+    session_id: Optional[str] = None  # Client-generated id that enables multi-turn conversation mode
+    book: Optional[str] = None  # Book (collection) to search; defaults to DEFAULT_BOOK
+    # Response shaping: without the full text, sources carry a snippet and the full chunk can be
+    # fetched from /api/chunk/{id}; snippet_chars=0 leaves the text out entirely
+    include_source_text: bool = True
+    snippet_chars: Optional[int] = None
+    # Set when the question was picked from /api/suggest: it is answered like the first question of
+    # a session, from the precomputed answers and the shared cache, whatever turn it is
+    suggested: bool = False
+
+
+class InvalidateRequest(BaseModel):
+    """Request model for cache invalidation; no sources means everything"""
+    sources: List[str] = []
+    book: Optional[str] = None  # Book whose index was rebuilt and should be reloaded
 
 
 class QueryResponse(BaseModel):
@@ -66,31 +226,68 @@ class QueryResponse(BaseModel):
     answer: str
     sources: List[Dict[str, str]]
     question: str
+    session_id: Optional[str] = None
+
+
+def load_book_index(book_id: str, book: Dict) -> BookIndex:
+    """Open the index of one book for the registry"""
+    if book.get("local_index"):
+        # Memory-mapped, so forked workers share the pages as well
+        return BookIndex(book_id, local_index=LocalIndex.load(Path(book["local_index"])))
+
+    # Qdrant-backed books keep nothing in process; they are searched through qdrant_retriever
+    if qdrant_retriever is None:
+        raise HTTPException(status_code=500, detail="Qdrant client not initialized.")
+    return BookIndex(book_id)
+
+
+index_registry = IndexRegistry(
+    BOOKS,
+    load_book_index,
+    max_resident_bytes=INDEX_MAX_RESIDENT_MB * 1024 * 1024,
+    max_loaded=INDEX_MAX_LOADED_BOOKS,
+)
+
+
+def preload():
+    """
+    Load the read-only resources that worker processes can share.
+
+    Under `gunicorn -c gunicorn_conf.py` this runs once in the master before workers are
+    forked, so every worker shares the model weights copy-on-write instead of loading its
+    own copy. Network clients are not created here; they must not be shared across a fork.
+    """
+    global embeddings
+    if embeddings is None:
+        logger.info("Initializing HuggingFace embeddings...")
+        embeddings = HuggingFaceEmbeddings(
+            # A local directory, so nothing is downloaded from the hub
+            model_name=str(model_path(Path(INDEX_ARTIFACT_PATH))) if artifact_manifest else config["EMBEDDING_MODEL_NAME"]
+        )
+    if BOOKS[DEFAULT_BOOK].get("local_index"):
+        index_registry.get(DEFAULT_BOOK)
 
 
 @app.on_event("startup")
 def startup_event():
     """Initialize clients when the application starts"""
-    global qdrant_client, embeddings, qdrant_vector_store, hf_client
-
-    logger.info("Initializing HuggingFace embeddings...")
-    embeddings = HuggingFaceEmbeddings(
-        model_name=config["EMBEDDING_MODEL_NAME"]
-    )
-
-    logger.info("Initializing Qdrant client for cloud...")
-    qdrant_client = QdrantClient(
-        url=config["QDRANT_URL"],
-        api_key=config["QDRANT_API_KEY"],
-        https=True  # Ensuring HTTPS for cloud connection
-    )
+    global qdrant_client, qdrant_retriever, hf_client, shared_cache, query_log, pipeline, local_cache_version
+
+    # No-op when the master process already preloaded the model
+    preload()
+
+    if artifact_manifest:
+        logger.info(f"Serving index artifact {artifact_manifest['version']} from {INDEX_ARTIFACT_PATH} read-only")
+    else:
+        logger.info("Initializing Qdrant client for cloud...")
+        qdrant_client = QdrantClient(
+            url=config["QDRANT_URL"],
+            api_key=config["QDRANT_API_KEY"],
+            https=True  # Ensuring HTTPS for cloud connection
+        )
+        qdrant_retriever = QdrantRetriever(qdrant_client, COLLECTION_NAME, SEARCH_PARAMS, books=BOOKS)
 
-    logger.info("Initializing Qdrant vector store...")
-    qdrant_vector_store = QdrantVectorStore(
-        client=qdrant_client,
-        collection_name=config["COLLECTION_NAME"],
-        embedding=embeddings,  # Fixed: changed from 'embeddings' to 'embedding'
-    )
+    logger.info(f"Serving {len(BOOKS)} books (default '{DEFAULT_BOOK}'); indexes are loaded on first use")
 
     # Initialize the Hugging Face client
     logger.info("Initializing Hugging Face client...")
@@ -99,22 +296,53 @@ def startup_event():
         token=config['HF_API_TOKEN']
     )
 
-    # Check if collection exists
+    shared_cache = shared_cache_from_config(config, COLLECTION_NAME)
+    if shared_cache is not None:
+        local_cache_version = shared_cache.version()
+
+    pipeline = RagPipeline(
+        embedder=embeddings.embed_query,
+        retriever=retrieve_chunks_by_vector,
+        generator=HFChatGenerator(hf_client, BOOKS),
+        cache=shared_cache,
+        router=answer_router,
+        books=BOOKS,
+        scheduler=upstream_scheduler,
+    )
+
+    if ANSWER_STORE_PATH.exists():
+        answer_store.load(ANSWER_STORE_PATH)
+
+    refresh_suggest_indexes()
+    threading.Thread(target=suggest_refresh_loop, name="suggest-refresh", daemon=True).start()
+
+    if query_log is None:
+        query_log = query_log_from_config(config)
+
+    # An artifact deployment has no Qdrant collections to check
+    if artifact_manifest:
+        return
+
+    # Check if the collections exist
     try:
         collections = qdrant_client.get_collections()
         collection_names = [col.name for col in collections.collections]
 
-        if config["COLLECTION_NAME"] not in collection_names:
-            logger.warning(f"Collection '{config['COLLECTION_NAME']}' does not exist. Please make sure to run the ingestion script first.")
-        else:
-            logger.info(f"Connected to collection '{config['COLLECTION_NAME']}' successfully.")
+        for book_id, book in BOOKS.items():
+            collection_name = book["collection"]
+            if book.get("local_index"):
+                continue
+            if collection_name not in collection_names:
+                logger.warning(f"Collection '{collection_name}' of book '{book_id}' does not exist. Please make sure to run the ingestion script first.")
+                continue
+            logger.info(f"Connected to collection '{collection_name}' successfully.")
 
             # Verify collection has vectors by checking count
             try:
-                count = qdrant_client.count(collection_name=config["COLLECTION_NAME"])
-                logger.info(f"Collection '{config['COLLECTION_NAME']}' has {count.count} vectors")
+                count = qdrant_client.count(collection_name=collection_name)
+                logger.info(f"Collection '{collection_name}' has {count.count} vectors")
                 if count.count == 0:
-                    logger.warning(f"Collection '{config['COLLECTION_NAME']}' exists but has 0 vectors. Re-run ingestion script.")
+                    logger.warning(f"Collection '{collection_name}' exists but has 0 vectors. Re-run ingestion script.")
             except Exception as e:
                 logger.error(f"Error getting vector count: {str(e)}")
 
@@ -123,23 +351,94 @@ def startup_event():
         raise
 
 
-def retrieve_chunks(question: str, top_k: int) -> List[Dict]:
-    """Retrieve relevant chunks from Qdrant vector store."""
-    if qdrant_vector_store is None:
-        raise HTTPException(status_code=500, detail="Qdrant vector store not initialized.")
+def make_response(request: QueryRequest, answer: str, sources: List[Dict[str, str]]) -> QueryResponse:
+    """Build the response; only the response is trimmed, caches and sessions keep the full sources"""
+    shaped = shape_sources(sources, request.include_source_text, request.snippet_chars, RESPONSE_SNIPPET_CHARS)
+    return QueryResponse(answer=answer, sources=shaped, question=request.question,
+                         session_id=request.session_id)
+
+
+def embed_question(question: str, trace: Optional[QueryTrace] = None) -> List[float]:
+    """Embed a question, going through the shared cache so each question is embedded once per host"""
+    if pipeline is None:
+        raise HTTPException(status_code=500, detail="Embeddings not initialized.")
+    return pipeline.embed(question, trace)
 
-    # Retrieval method: Simple similarity search
-    retrieved_docs = qdrant_vector_store.similarity_search(question, k=top_k)
 
-    # Convert documents to required format
-    sources = []
-    for doc in retrieved_docs:
-        sources.append({
-            "text": doc.page_content,
-            "source": doc.metadata.get("source", "Unknown"),
-            "relevance_score": "N/A"
-        })
-    return sources
+def retrieve_chunks(question: str, top_k: int, conditions: Optional[Dict[str, str]] = None,
+                    book: Optional[str] = None) -> List[Dict]:
+    """Retrieve relevant chunks from Qdrant vector store, optionally restricted by payload filters."""
+    # Retrieval method: Simple similarity search on the (possibly cached) question embedding
+    return pipeline.retrieve(embed_question(question), top_k, conditions, book)
+
+
+def search_local_index(local_index: LocalIndex, embedding: List[float], top_k: int,
+                       conditions: Optional[Dict[str, str]] = None) -> List[Dict]:
+    """Search an in-process index; payloads use the same layout as the Qdrant points"""
+    return [source_from_payload(local_index.ids[row], local_index.payloads[row], score)
+            for row, score in local_index.search(embedding, top_k, conditions)]
+
+
+def retrieve_chunks_by_vector(embedding: List[float], top_k: int,
+                              conditions: Optional[Dict[str, str]] = None,
+                              book: Optional[str] = None) -> List[Dict]:
+    """Retrieve relevant chunks of a book for an already computed question embedding."""
+    book = book or DEFAULT_BOOK
+    book_index = index_registry.get(book)
+    if book_index.local_index is not None:
+        return search_local_index(book_index.local_index, embedding, top_k, conditions)
+    # The same Qdrant retriever as the other deployments, with real scores for the answer router
+    return qdrant_retriever(embedding, top_k, conditions, book)
+
+
+def without_score(source: Dict[str, str]) -> Dict[str, str]:
+    return dict(source, relevance_score="N/A")
+
+
+def retrieve_session_chunks(session, question: str, top_k: int, conditions: Dict[str, str],
+                            trace: Optional[QueryTrace] = None, book: Optional[str] = None):
+    """
+    Retrieve chunks for a question asked inside a conversation session.
+
+    The question is embedded once. If it is nearly the same as an earlier question in the
+    session, that turn's chunks are reused without searching again. Otherwise a fresh search
+    runs, and the best chunks of a related earlier turn are carried over so follow-ups such as
+    "what about its sensors?" keep their context.
+
+    Reused and carried chunks lose their relevance score: it measured how well they matched
+    the earlier question, so answer routing must not act on it.
+
+    Returns the sources and the normalized question embedding to record with the turn.
+    """
+    raw_embedding = embed_question(question, trace)
+    question_embedding = normalize_embedding(raw_embedding)
+    previous_turn, similarity = session.most_similar_turn(question_embedding, conditions)
+
+    if previous_turn is not None and previous_turn.sources and similarity >= SESSION_REUSE_THRESHOLD:
+        logger.info(f"Reusing {len(previous_turn.sources)} chunks from an earlier turn (similarity={similarity:.3f})")
+        if trace is not None:
+            trace.outcomes["session_retrieval"] = "reused"
+        return [without_score(source) for source in previous_turn.sources[:top_k]], question_embedding
+
+    sources = pipeline.retrieve(raw_embedding, top_k, conditions, book)
+    if trace is not None:
+        trace.outcomes["session_retrieval"] = "searched"
+
+    if previous_turn is not None and similarity >= SESSION_CARRY_THRESHOLD:
+        retrieved_ids = {source["id"] for source in sources}
+        carried = [without_score(source) for source in previous_turn.sources[:SESSION_CARRY_CHUNKS]
+                   if source["id"] not in retrieved_ids]
+        sources = sources + carried
+
+    return sources, question_embedding
+
+
+def generate_answer(sources: List[Dict[str, str]], question: str, history: str = "",
+                    book: Optional[str] = None) -> str:
+    """Generate an answer from the retrieved sources with the Hugging Face client"""
+    if pipeline is None:
+        raise HTTPException(status_code=500, detail="Hugging Face client not initialized")
+    return pipeline.generate(sources, question, history, book or DEFAULT_BOOK)
 
 
 @app.get("/")
@@ -148,11 +447,58 @@ def read_root():
     return {"message": "Physical AI & Humanoid Robotics RAG Chatbot API is running", "status": "ok"}
 
 
-@app.post("/api/query", response_model=QueryResponse)
-def query_endpoint(request: QueryRequest):
+def request_class(x_request_priority: Optional[str] = Header(None), x_api_key: Optional[str] = Header(None)) -> str:
+    """Dependency returning the priority class of a request"""
+    return classify_request(x_request_priority, x_api_key, BULK_API_KEYS)
+
+
+def invalidate_local_caches(sources: List[str], book: Optional[str]):
+    """Drop this worker's in-process results for the changed sources; no sources means everything"""
+    if sources:
+        session_store.invalidate_sources(sources)
+        answer_store.invalidate_sources(sources)
+    else:
+        session_store.clear()
+        answer_store.clear()
+    # A rebuilt local index is picked up on the book's next query
+    if book:
+        index_registry.evict(book)
+    load_chunk.cache_clear()
+    suggest_refresh.set()
+
+
+def sync_local_caches():
+    """
+    Dependency catching this worker up with invalidations made through any worker. Sessions,
+    precomputed answers, chunks and suggestions are cached per process, and the invalidation
+    request reaches only one of the workers; the others find it in the shared cache.
+    """
+    global local_cache_version
+    if shared_cache is None or shared_cache.version() == local_cache_version:
+        return
+    with local_cache_lock:
+        invalidations = shared_cache.invalidations_since(local_cache_version)
+        if invalidations is None:
+            # Too far behind to replay: start over
+            invalidations = [(shared_cache.version(), {})]
+        for version, details in invalidations:
+            invalidate_local_caches(details.get("sources", []), details.get("book"))
+            local_cache_version = version
+
+
+@app.post("/api/query", response_model=QueryResponse, dependencies=[Depends(sync_local_caches)])
+@request_profiler.profile("query")
+def query_endpoint(request: QueryRequest, priority: str = Depends(request_class)):
     """
     Query endpoint that takes a question and returns an answer based only on the book content
     """
+    trace = QueryTrace()
+    trace.outcomes["priority"] = priority
+    status = 200
+    conditions: Dict[str, str] = {}
+    sources: List[Dict[str, str]] = []
+    # Read by the pipeline stages when they wait for an upstream slot
+    priority_token = request_priority.set(priority)
     try:
         # Validate inputs
         if not request.question.strip():
@@ -161,60 +507,268 @@ def query_endpoint(request: QueryRequest):
         if request.top_k <= 0 or request.top_k > 10:
             raise HTTPException(status_code=400, detail="top_k must be between 1 and 10")
 
-        logger.info(f"Processing query: '{request.question[:50]}...' with top_k={request.top_k}")
+        book = request.book or DEFAULT_BOOK
+        if book not in BOOKS:
+            raise HTTPException(status_code=404, detail=f"Unknown book '{book}'")
+
+        conditions = build_filter_conditions(source=request.source, chapter=request.chapter)
+        logger.info(f"Processing query: '{request.question[:50]}...' with top_k={request.top_k}, filters={conditions}, book={book}")
+
+        if pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not initialized")
+
+        session = session_store.get(f"{book}:{request.session_id}") if request.session_id else None
+        # The first question of a conversation has no history to depend on, so it is answered like
+        # a question outside a session; so is a picked suggestion, which is a complete question
+        standalone = session is None or not session.turns or request.suggested
+        # The session keeps the embedding of every turn, so a standalone question is embedded
+        # once here and the pipeline reuses it
+        question_embedding = None
+        if session is not None and standalone:
+            with trace.stage("embed"):
+                question_embedding = pipeline.embed(request.question, trace)
+
+        # Popular questions are answered ahead of time and cost no upstream call
+        precomputed = None
+        if standalone and not conditions and book == DEFAULT_BOOK:
+            precomputed = answer_store.get(request.question, request.top_k)
+
+        if precomputed is not None:
+            logger.info("Serving precomputed answer")
+            trace.outcomes["answer"] = "precomputed"
+            answer, sources = precomputed["answer"], precomputed["sources"]
+        elif standalone:
+            # Standalone answers depend only on the question and filters, so any worker may have one
+            result = pipeline.run(request.question, request.top_k, conditions, book,
+                                  cache_key=answer_key(request.question, request.top_k, conditions, book),
+                                  trace=trace, embedding=question_embedding)
+            if result["answer"] is None:
+                raise HTTPException(status_code=404, detail="No relevant content found in the textbook")
+            answer, sources = result["answer"], result["sources"]
+            if trace.outcomes.get("answer") == "cached":
+                logger.info("Serving answer from the shared cache")
+        else:
+            with trace.stage("retrieve"):
+                sources, question_embedding = retrieve_session_chunks(
+                    session, request.question, request.top_k, conditions, trace, book
+                )
+            if not sources:
+                raise HTTPException(status_code=404, detail="No relevant content found in the textbook")
+
+            history = session.condensed_history(SESSION_HISTORY_TOKEN_BUDGET)
+            result = pipeline.respond(sources, request.question, history, book, trace)
+            answer, sources = result["answer"], result["sources"]
+            session.add_turn(request.question, question_embedding, conditions, sources, answer)
+
+        if session is not None and standalone:
+            session.add_turn(request.question, normalize_embedding(question_embedding), conditions, sources, answer)
+
+        response = make_response(request, answer, sources)
+
+        logger.info(f"Query processed successfully. Found {len(sources)} source documents.")
+        return response
+
+    except HTTPException as e:
+        status = e.status_code
+        raise
+    except QueueFull as e:
+        status = 429
+        logger.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        status = 500
+        logger.error(f"Unexpected error processing query: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        request_priority.reset(priority_token)
+        if query_log is not None:
+            query_log.record(request.question, request.top_k, conditions, request.session_id,
+                             trace, status, len(sources), book=request.book)
+
+
+@lru_cache(maxsize=CHUNK_CACHE_SIZE)
+def load_chunk(book: str, chunk_id: str) -> Dict[str, str]:
+    """Look up one chunk of a book by id; misses raise, so only found chunks are cached"""
+    book_index = index_registry.get(book)
+    if book_index.local_index is not None:
+        payload = book_index.local_index.payload_by_id(chunk_id)
+    else:
+        try:
+            points = qdrant_client.retrieve(
+                collection_name=BOOKS[book]["collection"],
+                ids=[chunk_id],
+                with_payload=True,
+                with_vectors=False,
+            )
+        except Exception as e:
+            # Ids that are not valid point ids are rejected by Qdrant
+            logger.warning(f"Error retrieving chunk {chunk_id}: {str(e)}")
+            points = []
+        payload = points[0].payload if points else None
+    if payload is None:
+        raise HTTPException(status_code=404, detail=f"Unknown chunk '{chunk_id}'")
+    metadata = payload.get("metadata", {})
+    return {
+        "id": chunk_id,
+        "text": payload.get("page_content", ""),
+        "source": metadata.get("source", "Unknown"),
+        "chapter": metadata.get("chapter", ""),
+        "heading_path": metadata.get("heading_path", ""),
+    }
+
+
+@app.get("/api/chunk/{chunk_id}", dependencies=[Depends(sync_local_caches)])
+def get_chunk(chunk_id: str, response: Response, book: Optional[str] = None):
+    """Full text of a source chunk, for clients that requested snippets only"""
+    book = book or DEFAULT_BOOK
+    if book not in BOOKS:
+        raise HTTPException(status_code=404, detail=f"Unknown book '{book}'")
+    chunk = load_chunk(book, chunk_id)
+    # Chunks only change on re-ingestion, so browsers and CDNs may keep them for a while
+    response.headers["Cache-Control"] = f"public, max-age={CHUNK_MAX_AGE_SECONDS}"
+    return chunk
+
+
+def build_suggest_indexes() -> Dict[str, SuggestIndex]:
+    """One suggestion index per book from the precomputed answers, the shared cache and the docs"""
+    entries: Dict[str, List] = {book_id: [(heading, "heading") for heading in docs_headings(book.get("docs"))]
+                                for book_id, book in BOOKS.items()}
+    # Precomputed answers are only served for the default book
+    entries[DEFAULT_BOOK].extend((question, "precomputed") for question in answer_store.questions())
+    # Cached questions were typed by users: only well-answered, popular, ordinary questions qualify
+    if shared_cache is not None:
+        for cached in shared_cache.iter_json("answer", min_count=SUGGEST_MIN_ASKS):
+            book_entries = entries.get(cached.get("book") or DEFAULT_BOOK)
+            if book_entries is not None and suggestible_cached_answer(cached):
+                book_entries.append((cached["question"], "cached"))
+    return {book_id: SuggestIndex(book_entries) for book_id, book_entries in entries.items()}
+
+
+def refresh_suggest_indexes():
+    global suggest_indexes
+    try:
+        # Swapping the whole dict keeps lookups lock-free
+        suggest_indexes = build_suggest_indexes()
+        logger.info(f"Suggestion index rebuilt: {sum(len(index) for index in suggest_indexes.values())} entries")
+    except Exception as e:
+        logger.warning(f"Error rebuilding the suggestion index: {str(e)}")
 
-        # Retrieve relevant chunks from the vector store
-        sources = retrieve_chunks(request.question, request.top_k)
 
-        if not sources:
-            raise HTTPException(status_code=404, detail="No relevant content found in the textbook")
+def suggest_refresh_loop():
+    """Rebuild the suggestion indexes periodically, or as soon as the caches are invalidated"""
+    while True:
+        suggest_refresh.wait(SUGGEST_REFRESH_SECONDS)
+        suggest_refresh.clear()
+        refresh_suggest_indexes()
 
-        # Combine the context from retrieved sources
-        context_parts = [source["text"] for source in sources]
-        context = "\n\n".join(context_parts)
 
-        # Format the prompt for the LLM with context and question
-        prompt = f"""
-        Based on the following context from the Physical AI & Humanoid Robotics textbook, please answer the question.
+@app.get("/api/suggest", dependencies=[Depends(sync_local_caches)])
+def suggest_questions(q: str = "", limit: int = Query(5, ge=1, le=SUGGEST_MAX_LIMIT), book: Optional[str] = None):
+    """
+    Type-ahead completions for a partly typed question. Answered questions rank first, so
+    picking a suggestion usually lands on a precomputed or cached answer.
+    """
+    book = book or DEFAULT_BOOK
+    if book not in BOOKS:
+        raise HTTPException(status_code=404, detail=f"Unknown book '{book}'")
+    index = suggest_indexes.get(book)
+    if index is None or len(q.strip()) < SUGGEST_MIN_CHARS:
+        return {"suggestions": []}
+    return {"suggestions": index.suggest(q, limit)}
+
 
-        Context:
-        {context}
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Dependency guarding the admin endpoints with the ADMIN_TOKEN shared secret"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
 
-        Question: {request.question}
 
-        Answer:
-        """
+@app.post("/api/admin/invalidate", dependencies=[Depends(require_admin_token)])
+def invalidate_caches(request: InvalidateRequest):
+    """
+    Called by the ingestion watcher after re-ingesting docs, so cached retrieval results for
+    the changed sources are not served any more
+    """
+    if shared_cache is not None:
+        # Cached answers may quote any changed chunk; bumping the version retires them for every
+        # worker, and each worker, this one included, replays the invalidation on its own caches
+        if not shared_cache.invalidate({"sources": request.sources, "book": request.book}):
+            # Other workers cannot be reached; at least this one stops serving stale results
+            invalidate_local_caches(request.sources, request.book)
+            raise HTTPException(status_code=503, detail="Shared cache invalidation failed, retry later")
+        sync_local_caches()
+    else:
+        invalidate_local_caches(request.sources, request.book)
+    logger.info(f"Invalidated cached results for sources: {request.sources or 'all'}")
+    return {"status": "invalidated", "sources": request.sources, "book": request.book}
+
+
+@app.get("/api/admin/metrics", dependencies=[Depends(require_admin_token)])
+def get_metrics():
+    """Counters of this worker process: answer routes, shared cache hits and upstream scheduling"""
+    return {
+        "routes": answer_router.stats() if answer_router is not None else None,
+        "shared_cache": shared_cache.stats() if shared_cache is not None else None,
+        "scheduler": upstream_scheduler.stats() if upstream_scheduler is not None else None,
+    }
+
+
+def require_profiling():
+    """Dependency hiding the profiling endpoints unless PROFILING_ENABLED is set"""
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+
+
+@app.get("/api/admin/profile", response_class=PlainTextResponse,
+         dependencies=[Depends(require_admin_token), Depends(require_profiling)])
+def profile_process(
+    seconds: float = Query(10.0, gt=0),
+    kind: str = Query("cpu", pattern="^(cpu|memory)$"),
+    interval_ms: float = Query(5.0, gt=0),
+):
+    """
+    Profile this worker process while it keeps serving requests.
+    `kind=cpu` returns sampled stacks in the folded format used by flamegraph tools;
+    `kind=memory` returns the source lines that allocated the most memory during the window.
+    """
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    logger.info(f"Profiling {kind} for {seconds:g}s")
+    if kind == "memory":
+        return allocation_snapshot(seconds)
+    return sample_stacks(seconds, interval=interval_ms / 1000)
+
 
-        # Generate response using the Hugging Face client
-        if hf_client is None:
-            raise HTTPException(status_code=500, detail="Hugging Face client not initialized")
+@app.get("/api/admin/profile/requests", dependencies=[Depends(require_admin_token), Depends(require_profiling)])
+def list_request_profiles():
+    """Per-request cProfile results collected with REQUEST_PROFILE_SAMPLE_RATE, newest first"""
+    return {"sample_rate": REQUEST_PROFILE_SAMPLE_RATE, "profiles": request_profiler.list_profiles()}
 
-        response = hf_client.chat_completion(
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=512
-        )
-        answer = response.choices[0].message.content
 
-        response = QueryResponse(
-            answer=answer,
-            sources=sources,
-            question=request.question
-        )
+@app.get("/api/admin/profile/requests/{name}", dependencies=[Depends(require_admin_token), Depends(require_profiling)])
+def get_request_profile(name: str):
+    """Download one .pstats file"""
+    if name not in request_profiler.list_profiles():
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(REQUEST_PROFILE_DIR / name, media_type="application/octet-stream", filename=name)
 
-        logger.info(f"Query processed successfully. Found {len(sources)} source documents.")
-        return response
 
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Unexpected error processing query: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush the query log before the worker exits"""
+    if query_log is not None:
+        query_log.close()
 
 
 @app.get("/api/health")
 def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "service": "RAG Chatbot API"}
+    return {
+        "status": "healthy",
+        "service": "RAG Chatbot API",
+        "index_artifact": artifact_manifest["version"] if artifact_manifest else None,
+    }
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
-import os
+from pathlib import Path
+from typing import Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException
 
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -10,16 +11,31 @@ from huggingface_hub import InferenceClient
 
 from qdrant_client import QdrantClient
 
-import qdrant_client as qc
+from book_registry import load_books
+
+from rag_pipeline import (
+    HFInferenceEmbedder,
+    HFTextGenerator,
+    QdrantRetriever,
+    RagPipeline,
+    load_config,
+    query_log_from_config,
+    router_from_config,
+    scheduler_from_config,
+    shape_sources,
+    shared_cache_from_config,
+)
+
+from question_keys import answer_key
 
-from packaging import version
+from request_scheduler import QueueFull
 
-from dotenv import load_dotenv
+from query_log import QueryTrace
 
 
 
 
-load_dotenv()
+config = load_config()
 
 # Create the FastAPI app
 app = FastAPI()
@@ -40,9 +56,18 @@ app.add_middleware(
 
 
 # Initialize clients but defer error handling to the request level
-HF_API_TOKEN = os.getenv("HF_API_TOKEN")
-QDRANT_URL = os.getenv("QDRANT_URL")
-QDRANT_API_KEY = os.getenv("QDRANT_API_KEY")
+HF_API_TOKEN = config.get("HF_API_TOKEN")
+QDRANT_URL = config.get("QDRANT_URL")
+QDRANT_API_KEY = config.get("QDRANT_API_KEY")
+COLLECTION_NAME = config.get("COLLECTION_NAME", "humanoid_robotics")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# text_generation zyada stable hai free tier par
+GENERATION_MODEL = "mistralai/Mistral-7B-v0.1"
+TOP_K = 3
+
+# Books served by this deployment; without a books file the configured collection is the only book
+BOOKS = load_books(Path(config.get("BOOKS_CONFIG_PATH", Path(__file__).parent / "books.json")), COLLECTION_NAME)
+DEFAULT_BOOK = config.get("DEFAULT_BOOK", COLLECTION_NAME if COLLECTION_NAME in BOOKS else next(iter(BOOKS)))
 
 # Initialize clients globally but handle missing env vars gracefully
 hf_client = InferenceClient(token=HF_API_TOKEN) if HF_API_TOKEN else None
@@ -58,10 +83,37 @@ if QDRANT_URL and QDRANT_API_KEY:
     )
 
 
+def build_instruction_prompt(context: str, question: str, history: str = "", title: str = "") -> str:
+    """Short instruction prompt for the Mistral base model, which does not follow build_prompt's layout"""
+    return f"Context: {context}\n\nQuestion: {question}\n\nAnswer concisely based on context:"
+
+
+# Same stages, caching, routing and scheduling as backend.py, with the embedding computed by the
+# Inference API instead of a local model. The routing thresholds also spare the free-tier
+# generation quota; the cache lives in /tmp, the only writable directory of a serverless function.
+pipeline = RagPipeline(
+    embedder=HFInferenceEmbedder(hf_client, EMBEDDING_MODEL),
+    retriever=QdrantRetriever(qdrant_client_inst, COLLECTION_NAME, books=BOOKS),
+    generator=HFTextGenerator(hf_client, GENERATION_MODEL, max_new_tokens=300, temperature=0.7, books=BOOKS,
+                             prompt_builder=build_instruction_prompt),
+    cache=shared_cache_from_config(config, COLLECTION_NAME, default_path="/tmp/rag_cache.sqlite"),
+    router=router_from_config(config),
+    books=BOOKS,
+    scheduler=scheduler_from_config(config),
+)
+query_log = query_log_from_config(config)
+
+
 class QueryRequest(BaseModel):
 
     query: str
 
+    book: Optional[str] = None
+
+    include_source_text: bool = True
+
+    snippet_chars: Optional[int] = None
+
 
 @app.get("")
 def home():
@@ -70,8 +122,11 @@ def home():
 
 @app.post("/api/query")
 
-async def process_query(request: QueryRequest):
+def process_query(request: QueryRequest):
 
+    trace = QueryTrace()
+    status = 200
+    sources = []
     try:
         # Check if required clients are initialized
         if not hf_client:
@@ -80,82 +135,32 @@ async def process_query(request: QueryRequest):
         if not qdrant_client_inst:
             return {"answer": "Backend Error: Qdrant client not initialized. Missing QDRANT_URL or QDRANT_API_KEY.", "sources": []}
 
-        # Step 1: Embeddings
-
-        embeddings = hf_client.feature_extraction(
-
-            request.query,
-
-            model="sentence-transformers/all-MiniLM-L6-v2"
-
-        )
-
-        vector = embeddings[0] if isinstance(embeddings[0], list) else embeddings.tolist()
-
-
-
-        # Step 2: Qdrant Search (Version Safe)
-
-        v = version.parse(qc.__version__)
-
-        if v >= version.parse("1.10.0"):
-
-            search_result = qdrant_client_inst.query_points(
-
-                collection_name="humanoid_robotics",
-
-                query=vector,
-
-                limit=3
-
-            ).points
-
-        else:
-
-            search_result = qdrant_client_inst.search(
-
-                collection_name="humanoid_robotics",
-
-                query_vector=vector,
-
-                limit=3
-
-            )
-
-
-
-        context = "\n".join([res.payload.get("text", "") for res in search_result if res.payload])
-
-
-
-        # Step 3: Powerful Free AI Model (Mistral-7B)
-
-        prompt = f"Context: {context}\n\nQuestion: {request.query}\n\nAnswer concisely based on context:"
-
-
-
-        # text_generation zyada stable hai free tier par
-
-        response = hf_client.text_generation(
-
-            prompt=prompt,
-
-            model="mistralai/Mistral-7B-v0.1",
-
-            max_new_tokens=300,
-
-            temperature=0.7,
-
-            return_full_text=False
+        book = request.book or DEFAULT_BOOK
+        if book not in BOOKS:
+            return {"answer": f"Backend Error: Unknown book '{book}'.", "sources": []}
 
-        )
+        # Embedding, Qdrant search and generation run through the shared pipeline
+        result = pipeline.run(request.query, TOP_K, book=book,
+                              cache_key=answer_key(request.query, TOP_K, book=book), trace=trace)
 
+        if result["answer"] is None:
+            status = 404
+            return {"answer": "No relevant content found in the textbook.", "sources": []}
 
+        sources = result["sources"]
+        return {"answer": result["answer"],
+                "sources": shape_sources(sources, request.include_source_text, request.snippet_chars)}
 
-        return {"answer": response}
 
 
+    except QueueFull as e:
+        status = 429
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
 
     except Exception as e:
+        status = 500
+        return {"answer": f"Backend Error: {str(e)}", "sources": []}
 
-        return {"answer": f"Backend Error: {str(e)}", "sources": []}
\ No newline at end of file
+    finally:
+        if query_log is not None:
+            query_log.record(request.query, TOP_K, {}, None, trace, status, len(sources), book=request.book)
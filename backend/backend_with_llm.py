@@ -1,13 +1,20 @@
-import os
-from dotenv import load_dotenv
-from dotenv import dotenv_values
 import logging
 from typing import Dict, List, Optional
 
+from rag_pipeline import (
+    QdrantRetriever,
+    RagPipeline,
+    generate_basic_answer,
+    load_config,
+    query_log_from_config,
+    router_from_config,
+    scheduler_from_config,
+    shape_sources,
+    shared_cache_from_config,
+)
+
 # Load environment variables
-config = dotenv_values(".env")
-if not config:
-    config = os.environ
+config = load_config()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,11 +24,16 @@ logger = logging.getLogger(__name__)
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_qdrant import Qdrant
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
 import uvicorn
 
+from storage_profiles import build_search_params, get_storage_profile
+from search_filters import build_filter_conditions
+from question_keys import answer_key
+from query_log import QueryLog, QueryTrace
+from request_scheduler import QueueFull
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Physical AI & Humanoid Robotics RAG Chatbot API",
@@ -36,17 +48,27 @@ QDRANT_API_KEY = config['QDRANT_API_KEY']
 HF_API_TOKEN = config['HF_API_TOKEN']
 EMBEDDING_MODEL_NAME = config['EMBEDDING_MODEL_NAME']
 GENERATION_MODEL_NAME = config['GENERATION_MODEL_NAME']
+STORAGE_PROFILE = config.get('STORAGE_PROFILE')
+
+# Search parameters matching the storage profile the collection was created with
+SEARCH_PARAMS = build_search_params(get_storage_profile(STORAGE_PROFILE))
 
 # Global variables for clients
 qdrant_client: Optional[QdrantClient] = None
 embeddings: Optional[HuggingFaceEmbeddings] = None
-qdrant_vector_store: Optional[Qdrant] = None
+pipeline: Optional[RagPipeline] = None
+query_log: Optional[QueryLog] = None
 
 
 class QueryRequest(BaseModel):
     """Request model for query endpoint"""
     question: str
     top_k: int = 3
+    source: Optional[str] = None  # Restrict search to one source file, e.g. "chapter-02-hardware.md"
+    chapter: Optional[str] = None  # Restrict search to one chapter (Docusaurus doc id), e.g. "chapter-02-hardware"
+    # Sources carry a snippet of the chunk unless the full text is requested; 0 leaves the text out
+    include_source_text: bool = False
+    snippet_chars: Optional[int] = None
 
 
 class QueryResponse(BaseModel):
@@ -59,7 +81,7 @@ class QueryResponse(BaseModel):
 @app.on_event("startup")
 def startup_event():
     """Initialize clients when the application starts"""
-    global qdrant_client, embeddings, qdrant_vector_store
+    global qdrant_client, embeddings, pipeline, query_log
 
     logger.info("Initializing HuggingFace embeddings...")
     embeddings = HuggingFaceEmbeddings(
@@ -73,12 +95,16 @@ def startup_event():
         https=True  # Ensuring HTTPS for cloud connection
     )
 
-    logger.info("Initializing Qdrant vector store...")
-    qdrant_vector_store = Qdrant(
-        client=qdrant_client,
-        collection_name=config["COLLECTION_NAME"],
-        embeddings=embeddings,
+    # Same caching, routing, scheduling and query log as backend.py, with extractive answers
+    pipeline = RagPipeline(
+        embedder=embeddings.embed_query,
+        retriever=QdrantRetriever(qdrant_client, COLLECTION_NAME, SEARCH_PARAMS),
+        generator=generate_answer,
+        cache=shared_cache_from_config(config, COLLECTION_NAME),
+        router=router_from_config(config),
+        scheduler=scheduler_from_config(config),
     )
+    query_log = query_log_from_config(config)
 
     # Check if collection exists
     try:
@@ -104,69 +130,14 @@ def startup_event():
         raise
 
 
-def retrieve_relevant_chunks(question: str, top_k: int = 3) -> List[Dict]:
-    """Retrieve relevant chunks from Qdrant vector store."""
-    if qdrant_vector_store is None:
-        raise HTTPException(status_code=500, detail="Qdrant vector store not initialized.")
-
-    # Retrieval method: Simple similarity search
-    retrieved_docs = qdrant_vector_store.similarity_search(question, k=top_k)
-
-    # Convert documents to required format
-    sources = []
-    for doc in retrieved_docs:
-        sources.append({
-            "text": doc.page_content,
-            "source": doc.metadata.get("source", "Unknown"),
-            "relevance_score": "N/A (similarity_search method)"
-        })
-    return sources
-
-
-def generate_basic_answer(context: str, question: str) -> str:
-    """
-    Generate an answer based on context and question with a lightweight approach
-    """
-    # Clean up the context
-    clean_context = context.replace('\n', ' ').strip()
-
-    # Extract sentences that seem most relevant to the question
-    sentences = clean_context.split('.')
-    question_lower = question.lower()
-
-    # Find sentences that contain keywords from the question
-    relevant_sentences = []
-    question_words = [word for word in question_lower.split() if len(word) > 3]  # Only longer words
-
-    for sentence in sentences:
-        sentence_lower = sentence.lower()
-        # Count how many question words appear in this sentence
-        matches = sum(1 for word in question_words if word in sentence_lower)
-        if matches > 0:
-            relevant_sentences.append((sentence.strip(), matches))
-
-    # Sort by relevance (number of matches)
-    relevant_sentences.sort(key=lambda x: x[1], reverse=True)
-
-    # Take top sentences that contribute to answering the question
-    top_sentences = [sent[0] for sent in relevant_sentences[:3]]  # Top 3 most relevant
-
-    # If no specific matches, take the first few sentences as a fallback
-    if not top_sentences:
-        top_sentences = [sent.strip() for sent in sentences[:3] if sent.strip()]
-
-    # Join the selected sentences
-    synthesized_content = '. '.join(top_sentences).strip()
+@app.on_event("shutdown")
+def shutdown_event():
+    """Flush the query log before the worker exits"""
+    if query_log is not None:
+        query_log.close()
 
-    if not synthesized_content:
-        return f"Based on the textbook content, I could not find specific information to answer: '{question}'. Please refer to the textbook for more details."
 
-    # Formulate the response
-    answer = f"Based on the Physical AI & Humanoid Robotics textbook:\n\n{synthesized_content}.\n\nThis information addresses your question: '{question}'."
-    return answer
-
-
-def generate_answer(context: str, question: str) -> str:
+def generate_answer(context: str, question: str, history: str = "", book: Optional[str] = None) -> str:
     """
     Generate an answer based on context and question using basic approach only.
     """
@@ -184,6 +155,10 @@ def query_endpoint(request: QueryRequest):
     """
     Query endpoint that takes a question and returns an answer based only on the book content
     """
+    trace = QueryTrace()
+    status = 200
+    conditions: Dict[str, str] = {}
+    sources: List[Dict[str, str]] = []
     try:
         # Validate inputs
         if not request.question.strip():
@@ -192,41 +167,42 @@ def query_endpoint(request: QueryRequest):
         if request.top_k <= 0 or request.top_k > 10:
             raise HTTPException(status_code=400, detail="top_k must be between 1 and 10")
 
-        logger.info(f"Processing query: '{request.question[:50]}...' with top_k={request.top_k}")
+        conditions = build_filter_conditions(source=request.source, chapter=request.chapter)
+        logger.info(f"Processing query: '{request.question[:50]}...' with top_k={request.top_k}, filters={conditions}")
 
-        # Retrieve relevant chunks from Qdrant vector store using similarity search
-        relevant_chunks = retrieve_relevant_chunks(request.question, request.top_k)
+        if pipeline is None:
+            raise HTTPException(status_code=500, detail="Pipeline not initialized.")
 
-        if not relevant_chunks:
+        # Retrieve relevant chunks from Qdrant and generate the answer from them
+        result = pipeline.run(request.question, request.top_k, conditions,
+                              cache_key=answer_key(request.question, request.top_k, conditions), trace=trace)
+        if result["answer"] is None:
             raise HTTPException(status_code=404, detail="No relevant content found in the textbook")
-
-        # Combine the context from retrieved chunks
-        context_parts = [chunk["text"] for chunk in relevant_chunks]
-        context = "\n\n".join(context_parts)
-
-        # Generate answer based on context and question
-        answer = generate_answer(context, request.question)
-
-        # Prepare response - using the data format from retrieve_relevant_chunks
-        sources = [{"text": chunk["text"][:200] + "..." if len(chunk["text"]) > 200 else chunk["text"],
-                   "source": chunk["source"],
-                   "relevance_score": chunk["relevance_score"]}
-                  for chunk in relevant_chunks]
+        sources = result["sources"]
 
         response = QueryResponse(
-            answer=answer,
-            sources=sources,
+            answer=result["answer"],
+            sources=shape_sources(sources, request.include_source_text, request.snippet_chars),
             question=request.question
         )
 
-        logger.info(f"Query processed successfully. Found {len(relevant_chunks)} relevant chunks.")
+        logger.info(f"Query processed successfully. Found {len(sources)} relevant chunks.")
         return response
 
-    except HTTPException:
+    except HTTPException as e:
+        status = e.status_code
         raise
+    except QueueFull as e:
+        status = 429
+        logger.warning(str(e))
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
+        status = 500
         logger.error(f"Unexpected error processing query: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+    finally:
+        if query_log is not None:
+            query_log.record(request.question, request.top_k, conditions, None, trace, status, len(sources))
 
 
 @app.get("/api/health")
@@ -0,0 +1,137 @@
+"""
+Benchmark the structure-aware markdown chunker against the previous RecursiveCharacterTextSplitter setup.
+
+Measures chunking throughput and downstream retrieval recall@k. The recall queries are the
+section headings of the docs; a query is answered when one of the top-k chunks contains the
+opening line of that section.
+
+Usage:
+    python benchmark_chunker.py --docs ./docs --repeat 50 --k 3
+    python benchmark_chunker.py --skip-recall   # throughput only, no embedding model needed
+"""
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from markdown_chunker import chunk_markdown, chunk_recursive_stream
+
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+
+def recursive_splitter_chunks(text: str) -> List[str]:
+    """The splitter configuration ingest_backend.py used before the markdown chunker (CHUNKER=recursive)"""
+    return [chunk["text"] for chunk in chunk_recursive_stream([text], chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)]
+
+
+def markdown_chunks(text: str) -> List[str]:
+    return [chunk["text"] for chunk in chunk_markdown(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)]
+
+
+def load_docs(docs_path: Path) -> List[Tuple[str, str]]:
+    return [(path.read_text(encoding="utf-8"), path.name) for path in sorted(docs_path.rglob("*.md"))]
+
+
+def build_heading_queries(docs: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Pair each section heading with the opening text of its section"""
+    queries = []
+    for content, _ in docs:
+        lines = content.splitlines()
+        for i, line in enumerate(lines):
+            match = HEADING_RE.match(line)
+            if not match or len(match.group(1)) == 1:
+                continue
+            for following in lines[i + 1:]:
+                stripped = following.strip()
+                if not stripped:
+                    continue
+                if HEADING_RE.match(stripped) or stripped.startswith(("```", "~~~", "|", "-", "*", "!")):
+                    break
+                queries.append((match.group(2).strip("* "), normalize_whitespace(stripped)[:60]))
+                break
+    return queries
+
+
+def normalize_whitespace(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def measure_throughput(name: str, chunker: Callable[[str], List[str]], docs: List[Tuple[str, str]],
+                       repeat: int) -> Dict:
+    total_bytes = sum(len(content.encode("utf-8")) for content, _ in docs)
+    chunks = [chunk for content, _ in docs for chunk in chunker(content)]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for content, _ in docs:
+            chunker(content)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "name": name,
+        "chunks": len(chunks),
+        "mean_chunk_chars": sum(len(c) for c in chunks) / max(len(chunks), 1),
+        "mb_per_second": total_bytes * repeat / elapsed / 1e6,
+        "docs_per_second": len(docs) * repeat / elapsed,
+    }
+
+
+def measure_recall(chunker: Callable[[str], List[str]], docs: List[Tuple[str, str]],
+                   queries: List[Tuple[str, str]], embeddings, k: int) -> float:
+    import numpy as np
+
+    chunks = [chunk for content, _ in docs for chunk in chunker(content)]
+    chunk_vectors = np.asarray(embeddings.embed_documents(chunks), dtype=np.float32)
+    chunk_vectors /= np.linalg.norm(chunk_vectors, axis=1, keepdims=True)
+    normalized_chunks = [normalize_whitespace(chunk) for chunk in chunks]
+
+    hits = 0
+    for question, answer_text in queries:
+        query_vector = np.asarray(embeddings.embed_query(question), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector)
+        top = np.argsort(-(chunk_vectors @ query_vector))[:k]
+        if any(answer_text in normalized_chunks[i] for i in top):
+            hits += 1
+    return hits / max(len(queries), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark markdown chunking throughput and retrieval recall")
+    parser.add_argument("--docs", type=Path, default=Path("./docs"))
+    parser.add_argument("--repeat", type=int, default=50, help="Passes over the corpus for the throughput timing")
+    parser.add_argument("--k", type=int, default=3, help="Top-k used for recall")
+    parser.add_argument("--model", default=os.environ.get("EMBEDDING_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    parser.add_argument("--skip-recall", action="store_true")
+    args = parser.parse_args()
+
+    docs = load_docs(args.docs)
+    if not docs:
+        raise SystemExit(f"No markdown files found under {args.docs}")
+
+    chunkers = [("markdown_chunker", markdown_chunks), ("recursive_splitter", recursive_splitter_chunks)]
+
+    print(f"Corpus: {len(docs)} files from {args.docs}")
+    print(f"{'chunker':<20} {'chunks':>7} {'mean chars':>11} {'MB/s':>8} {'docs/s':>9}")
+    for name, chunker in chunkers:
+        result = measure_throughput(name, chunker, docs, args.repeat)
+        print(f"{result['name']:<20} {result['chunks']:>7} {result['mean_chunk_chars']:>11.1f} "
+              f"{result['mb_per_second']:>8.2f} {result['docs_per_second']:>9.1f}")
+
+    if args.skip_recall:
+        return
+
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    embeddings = HuggingFaceEmbeddings(model_name=args.model)
+    queries = build_heading_queries(docs)
+    print(f"\nRecall@{args.k} over {len(queries)} section-heading queries ({args.model})")
+    for name, chunker in chunkers:
+        print(f"{name:<20} {measure_recall(chunker, docs, queries, embeddings, args.k):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Recall / latency trade-off of the local index modes.
+
+Compares the exact float32 scan with the PCA and binary first-pass modes at several
+shortlist sizes. By default it runs on a synthetic clustered corpus with the size of
+100x the current book; `--index` uses the vectors of an exported local index instead,
+optionally replicated with noise up to `--size` vectors.
+
+Usage:
+    python benchmark_local_index.py --size 300000
+    python benchmark_local_index.py --index local_index --size 500000
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from local_index import LocalIndex
+
+
+def synthetic_vectors(size: int, dimension: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Clustered unit vectors, a rough stand-in for sentence embeddings of book chunks"""
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignments = rng.integers(0, clusters, size)
+    vectors = centers[assignments] + 0.6 * rng.standard_normal((size, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def scale_vectors(vectors: np.ndarray, size: int, rng: np.random.Generator) -> np.ndarray:
+    """Replicate real vectors with small perturbations until the corpus has `size` vectors"""
+    picks = rng.integers(0, len(vectors), size)
+    scaled = vectors[picks] + 0.05 * rng.standard_normal((size, vectors.shape[1])).astype(np.float32)
+    return scaled / np.linalg.norm(scaled, axis=1, keepdims=True)
+
+
+def make_queries(vectors: np.ndarray, count: int, rng: np.random.Generator) -> np.ndarray:
+    """Queries close to (but not identical with) corpus vectors, like questions about a chunk"""
+    picks = rng.integers(0, len(vectors), count)
+    noise = rng.standard_normal((count, vectors.shape[1])).astype(np.float32)
+    queries = vectors[picks] + 0.7 * noise / np.sqrt(vectors.shape[1])
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def first_pass_bytes(index: LocalIndex) -> int:
+    if index.mode == "pca":
+        return index.reduced.nbytes
+    if index.mode == "binary":
+        return index.codes.nbytes
+    return index.vectors.nbytes
+
+
+def run(index: LocalIndex, queries: np.ndarray, k: int, truth: List[set]) -> Dict:
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        hits = index.search(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({row for row, _ in hits} & expected) / k)
+    return {
+        "recall": float(np.mean(recalls)),
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "first_pass_mb": first_pass_bytes(index) / 1024 / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index", type=Path, help="Exported local index whose vectors are used")
+    parser.add_argument("--size", type=int, default=100_000, help="Number of vectors to search")
+    parser.add_argument("--dimension", type=int, default=384, help="Dimension of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--pca-dims", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--oversampling", type=float, nargs="+", default=[10, 20, 50])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.index:
+        vectors = np.asarray(LocalIndex.load(args.index, mmap=False).vectors)
+        if args.size > len(vectors):
+            vectors = scale_vectors(vectors, args.size, rng)
+    else:
+        vectors = synthetic_vectors(args.size, args.dimension, clusters=max(10, args.size // 200), rng=rng)
+    ids = [str(i) for i in range(len(vectors))]
+    payloads = [{} for _ in ids]
+    queries = make_queries(vectors, args.queries, rng)
+
+    exact = LocalIndex.build(ids, vectors, payloads, mode="exact")
+    truth = [{row for row, _ in exact.search(query, args.k)} for query in queries]
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, recall@{args.k} vs exact scan\n")
+    print(f"{'mode':<22}{'recall':>8}{'p50 ms':>10}{'p95 ms':>10}{'first pass MB':>16}")
+
+    def report(name: str, result: Dict):
+        print(f"{name:<22}{result['recall']:>8.3f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['first_pass_mb']:>16.1f}")
+
+    report("exact", run(exact, queries, args.k, truth))
+    for dims in args.pca_dims:
+        for oversampling in args.oversampling:
+            index = LocalIndex.build(ids, vectors, payloads, mode="pca", pca_dims=dims, oversampling=oversampling)
+            report(f"pca{dims} x{oversampling:g}", run(index, queries, args.k, truth))
+    for oversampling in args.oversampling:
+        index = LocalIndex.build(ids, vectors, payloads, mode="binary", oversampling=oversampling)
+        report(f"binary x{oversampling:g}", run(index, queries, args.k, truth))
+
+
+if __name__ == "__main__":
+    main()
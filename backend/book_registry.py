@@ -0,0 +1,118 @@
+import json
+import logging
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def load_books(path: Path, default_collection: str, default_docs: str = "./docs",
+               default_local_index: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Read the books served by this deployment from a JSON file of the form
+
+        {"humanoid_robotics": {"collection": "humanoid_robotics", "docs": "./docs",
+                               "title": "Physical AI & Humanoid Robotics", "local_index": null}}
+
+    Without the file, the deployment serves a single book: the configured collection.
+    """
+    if not path.exists():
+        return {default_collection: {"collection": default_collection, "docs": default_docs,
+                                     "local_index": default_local_index}}
+    with open(path, 'r', encoding='utf-8') as f:
+        books = json.load(f)
+    for book_id, book in books.items():
+        book.setdefault("collection", book_id)
+        book.setdefault("docs", f"./books/{book_id}")
+        book.setdefault("local_index", None)
+    return books
+
+
+class BookIndex:
+    """The searchable index of one book: a local index, or None for books searched in Qdrant"""
+
+    def __init__(self, book_id: str, local_index: Any = None):
+        self.book_id = book_id
+        self.local_index = local_index
+
+    def resident_bytes(self) -> int:
+        """Memory the index can occupy in this process; Qdrant-backed books keep nothing locally"""
+        if self.local_index is None:
+            return 0
+        arrays = (self.local_index.vectors, self.local_index.reduced, self.local_index.codes)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+
+class IndexRegistry:
+    """
+    Loads book indexes on first use and keeps them in least-recently-used order.
+    When the loaded indexes exceed the memory budget or the book limit, the least recently
+    used ones are dropped and loaded again on their next query.
+
+    Loading can be slow (a local index is read from disk), so it happens under a lock of its
+    own per book: concurrent first queries of a book wait for one load, and queries
+    of other books are not held up by it.
+    """
+
+    def __init__(self, books: Dict[str, Dict], loader: Callable[[str, Dict], BookIndex],
+                 max_resident_bytes: int = 2 * 1024 ** 3, max_loaded: int = 16):
+        self.books = books
+        self.loader = loader
+        self.max_resident_bytes = max_resident_bytes
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, BookIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {book_id: threading.Lock() for book_id in books}
+        # Bumped by evict(), so an index loaded before its book was evicted is not kept
+        self._generations = {book_id: 0 for book_id in books}
+
+    def get(self, book_id: str) -> BookIndex:
+        """Return the index of a book, loading it if needed; raises KeyError for unknown books"""
+        book = self.books[book_id]
+        index = self._lookup(book_id)
+        if index is not None:
+            return index
+        with self._load_locks[book_id]:
+            # Another thread may have loaded the book while this one waited
+            index = self._lookup(book_id)
+            if index is not None:
+                return index
+            generation = self._generations[book_id]
+            logger.info(f"Loading index for book '{book_id}' (collection '{book['collection']}')")
+            index = self.loader(book_id, book)
+            with self._lock:
+                if self._generations[book_id] == generation:
+                    self._loaded[book_id] = index
+                    self._evict()
+            return index
+
+    def evict(self, book_id: str):
+        """Drop a book's index, e.g. after it was rebuilt"""
+        with self._lock:
+            self._loaded.pop(book_id, None)
+            if book_id in self._generations:
+                self._generations[book_id] += 1
+
+    def _lookup(self, book_id: str) -> Optional[BookIndex]:
+        with self._lock:
+            index = self._loaded.get(book_id)
+            if index is not None:
+                self._loaded.move_to_end(book_id)
+            return index
+
+    def loaded(self) -> List[str]:
+        """Ids of the loaded books, least recently used first"""
+        return list(self._loaded)
+
+    def resident_bytes(self) -> int:
+        return sum(index.resident_bytes() for index in self._loaded.values())
+
+    def _evict(self):
+        # The index that was just loaded is never evicted, even if it alone exceeds the budget
+        while len(self._loaded) > 1 and (
+            len(self._loaded) > self.max_loaded or self.resident_bytes() > self.max_resident_bytes
+        ):
+            book_id, _ = self._loaded.popitem(last=False)
+            logger.info(f"Unloaded index for book '{book_id}'")
@@ -0,0 +1,132 @@
+import base64
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Universal hash family h(x) = (a * x + b) mod p over 32-bit shingle hashes; with a and b
+# below 2**31 the products stay within uint64
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Overlapping word n-grams of the lowercased text; short texts are a single shingle"""
+    words = _WORD_RE.findall(text.lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+
+class ChunkDeduplicator:
+    """
+    Near-duplicate detection for chunks with MinHash signatures and LSH banding.
+
+    Each chunk gets a signature of `num_perm` min-hashes over its word shingles. The signature
+    is cut into `bands` bands; chunks sharing any band land in the same bucket and become
+    candidates, and a candidate counts as a duplicate when the estimated Jaccard similarity of
+    the shingle sets (the fraction of equal min-hashes) reaches `threshold`. With the defaults
+    (16 bands of 4 rows), chunks at 0.8 similarity are candidates with probability > 0.999,
+    while chunks below 0.3 almost never are.
+
+    The first chunk seen stays the representative of its duplicates. Signatures can be stored
+    with the chunks (`encode_signature`), so a later run registers the stored chunks without
+    hashing their text again.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 3, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Stored signatures are only reused by a deduplicator that computes them the same way
+        self._signature_tag = f"{num_perm}-{shingle_size}-{seed}"
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._buckets: Dict[Tuple[int, bytes], List[str]] = defaultdict(list)
+        self._signatures: Dict[str, np.ndarray] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def clear(self):
+        self._buckets.clear()
+        self._signatures.clear()
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = np.fromiter(
+            (zlib.crc32(shingle.encode("utf-8")) for shingle in shingles(text, self.shingle_size)),
+            dtype=np.uint64,
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def _band_keys(self, signature: np.ndarray):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def encode_signature(self, signature: np.ndarray) -> str:
+        """Compact text form of a signature, for storing it in a chunk's payload"""
+        return f"{self._signature_tag}:{base64.b64encode(signature.astype('<u4').tobytes()).decode('ascii')}"
+
+    def decode_signature(self, value) -> Optional[np.ndarray]:
+        """A stored signature, or None when it is missing or was computed with other parameters"""
+        if not isinstance(value, str):
+            return None
+        tag, _, data = value.partition(":")
+        if tag != self._signature_tag:
+            return None
+        try:
+            signature = np.frombuffer(base64.b64decode(data, validate=True), dtype='<u4')
+        except ValueError:
+            return None
+        return signature.astype(np.uint32) if len(signature) == self.num_perm else None
+
+    def add(self, key: str, text: str):
+        """Register a chunk as a representative without checking it"""
+        self.add_signature(key, self.signature(text))
+
+    def add_signature(self, key: str, signature: np.ndarray):
+        """Register a chunk by its signature as a representative without checking it"""
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = signature
+        for band_key in self._band_keys(signature):
+            self._buckets[band_key].append(key)
+
+    def remove(self, key: str):
+        """Forget a registered chunk, e.g. one whose file is about to be re-indexed"""
+        signature = self._signatures.pop(key, None)
+        if signature is None:
+            return
+        for band_key in self._band_keys(signature):
+            bucket = self._buckets[band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self._buckets[band_key]
+
+    def find(self, key: str, text: str) -> Optional[str]:
+        """Return the representative this chunk duplicates, or None after registering it as a new one"""
+        return self.find_signature(key, self.signature(text))
+
+    def find_signature(self, key: str, signature: np.ndarray) -> Optional[str]:
+        """`find` for a chunk whose signature is already computed"""
+        seen = set()
+        for band_key in self._band_keys(signature):
+            for candidate in self._buckets.get(band_key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                    return candidate
+        self.add_signature(key, signature)
+        return None
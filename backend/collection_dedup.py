@@ -0,0 +1,178 @@
+import logging
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from qdrant_client.http import models
+
+from chunk_dedup import ChunkDeduplicator
+from ingest_checkpoint import IngestCheckpoint
+from ingest_pipeline import batched
+from search_filters import chapter_from_source
+
+logger = logging.getLogger(__name__)
+
+# Payload layout used by the LangChain Qdrant integration that the backends read with
+CONTENT_PAYLOAD_KEY = "page_content"
+METADATA_PAYLOAD_KEY = "metadata"
+# Metadata field holding the chunk's encoded MinHash signature
+SIGNATURE_FIELD = "minhash"
+# Points read per scroll page, and stored texts fetched per request for chunks without a signature
+SCROLL_PAGE_SIZE = 512
+
+
+def sources_filter(sources: Iterable[str]) -> models.Filter:
+    """
+    Payload filter selecting all points of several source files
+    """
+    return models.Filter(
+        must=[models.FieldCondition(key=f"{METADATA_PAYLOAD_KEY}.source", match=models.MatchAny(any=sorted(sources)))]
+    )
+
+
+def scroll_points(client, collection_name: str, scroll_filter: Optional[models.Filter] = None,
+                  with_payload=True) -> Iterator:
+    """Page through the points of a collection, holding one page at a time"""
+    offset = None
+    while True:
+        points, offset = client.scroll(collection_name=collection_name, scroll_filter=scroll_filter,
+                                       with_payload=with_payload, with_vectors=False,
+                                       limit=SCROLL_PAGE_SIZE, offset=offset)
+        yield from points
+        if offset is None:
+            return
+
+
+def alternates_operations(kept_ids: Iterable[str], alternates: Dict[str, Set[str]]) -> List[models.SetPayloadOperation]:
+    """
+    Payload updates storing the current alternates of chunks, which may be none any more.
+    Chunks with the same alternates share one operation.
+    """
+    groups: Dict[Tuple[str, ...], List[str]] = {}
+    for kept_id in kept_ids:
+        groups.setdefault(tuple(sorted(alternates.get(kept_id, ()))), []).append(kept_id)
+    return [
+        models.SetPayloadOperation(set_payload=models.SetPayload(
+            # Filters on source or chapter also match these, so filtered searches still find the text
+            payload={
+                "alternate_sources": list(sources),
+                "alternate_chapters": sorted({chapter_from_source(source) for source in sources}),
+            },
+            points=sorted(ids),
+            key=METADATA_PAYLOAD_KEY,
+        ))
+        for sources, ids in groups.items()
+    ]
+
+
+class CollectionDeduplicator:
+    """
+    Deduplication against the chunks stored in a Qdrant collection: a ChunkDeduplicator holding
+    the stored chunks, and the sources recorded as alternates on them (`alternates`, point id ->
+    sources of the dropped duplicates).
+
+    `prepare` gets it ready to (re-)ingest a set of files. The first call seeds it from the
+    signatures stored in the payloads; later calls only drop the chunks of the files about to
+    be re-ingested, so a long-lived instance (the watcher keeps one) does not read the whole
+    collection again. Chunks ingested meanwhile are registered by `find`.
+    """
+
+    def __init__(self, client, collection_name: str, deduplicator: ChunkDeduplicator, seeded: bool = False):
+        self.client = client
+        self.collection_name = collection_name
+        self.deduplicator = deduplicator
+        self.alternates: Dict[str, Set[str]] = {}
+        # A fresh run has nothing to seed from
+        self.seeded = seeded
+
+    def find(self, key: str, text: str, metadata: Dict) -> Optional[str]:
+        """
+        Return the chunk this one duplicates, or None after registering it. The signature is
+        stored in `metadata`, so it is uploaded with the chunk.
+        """
+        signature = self.deduplicator.signature(text)
+        metadata[SIGNATURE_FIELD] = self.deduplicator.encode_signature(signature)
+        return self.deduplicator.find_signature(key, signature)
+
+    def record(self, kept_id: str, source: str):
+        """Record a dropped duplicate from `source` on the chunk that is kept for it"""
+        self.alternates.setdefault(kept_id, set()).add(source)
+
+    def prepare(self, pending: Set[str], checkpoint: IngestCheckpoint) -> Set[str]:
+        """
+        Leave the stored chunks of the pending files out of deduplication. A file whose chunks
+        stand in for duplicates in a pending file is re-ingested as well, since its copies may
+        no longer match; it is added to `pending` and forgotten by the checkpoint.
+
+        Returns the ids of the remaining chunks whose recorded alternates included a pending
+        file; their alternates are stored again once the pending files are ingested.
+        """
+        pending_ids = self._expand_pending(pending, checkpoint)
+        if not self.seeded:
+            self.seeded = True
+            return self._seed(pending)
+
+        for key in pending_ids:
+            self.deduplicator.remove(key)
+            self.alternates.pop(key, None)
+        trimmed = set()
+        for key, sources in self.alternates.items():
+            if sources & pending:
+                sources -= pending
+                trimmed.add(key)
+        return trimmed
+
+    def reset(self):
+        """Forget every chunk, e.g. after a failed re-index; the next `prepare` seeds it again"""
+        self.deduplicator.clear()
+        self.alternates.clear()
+        self.seeded = False
+
+    def _expand_pending(self, pending: Set[str], checkpoint: IngestCheckpoint) -> Set[str]:
+        """
+        Follow alternates until no new file is added, reading only the points of pending files.
+        Returns the ids of those points.
+        """
+        pending_ids = set()
+        frontier = set(pending)
+        while frontier:
+            added = set()
+            for point in scroll_points(self.client, self.collection_name, sources_filter(frontier),
+                                       with_payload=[METADATA_PAYLOAD_KEY]):
+                pending_ids.add(str(point.id))
+                metadata = (point.payload or {}).get(METADATA_PAYLOAD_KEY, {})
+                for source in metadata.get("alternate_sources", []):
+                    if source not in pending:
+                        logger.info(f"Re-ingesting {source}: it duplicates chunks of changed file {metadata['source']}")
+                        checkpoint.forget(source)
+                        pending.add(source)
+                        added.add(source)
+            frontier = added
+        return pending_ids
+
+    def _seed(self, pending: Set[str]) -> Set[str]:
+        """
+        Register every stored chunk outside the pending files. Only the metadata is read; the
+        text is fetched and hashed just for chunks stored without a usable signature.
+        """
+        trimmed, unsigned = set(), []
+        for point in scroll_points(self.client, self.collection_name, with_payload=[METADATA_PAYLOAD_KEY]):
+            metadata = (point.payload or {}).get(METADATA_PAYLOAD_KEY, {})
+            if metadata.get("source") in pending:
+                continue
+            key = str(point.id)
+            signature = self.deduplicator.decode_signature(metadata.get(SIGNATURE_FIELD))
+            if signature is None:
+                unsigned.append(key)
+            else:
+                self.deduplicator.add_signature(key, signature)
+            recorded = set(metadata.get("alternate_sources", []))
+            self.alternates[key] = recorded - pending
+            if recorded & pending:
+                trimmed.add(key)
+
+        for keys in batched(unsigned, SCROLL_PAGE_SIZE):
+            for point in self.client.retrieve(collection_name=self.collection_name, ids=keys,
+                                              with_payload=[CONTENT_PAYLOAD_KEY]):
+                self.deduplicator.add(str(point.id), (point.payload or {}).get(CONTENT_PAYLOAD_KEY, ""))
+        logger.info(f"Deduplicating against {len(self.deduplicator)} existing chunks "
+                    f"({len(unsigned)} without a stored signature)")
+        return trimmed
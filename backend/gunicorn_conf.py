@@ -0,0 +1,51 @@
+"""
+Gunicorn settings for serving backend.py with several worker processes on one host:
+
+    gunicorn -c gunicorn_conf.py backend:app
+
+The app is imported once in the master (`preload_app`) and the embedding model is loaded
+there before the workers are forked, so all workers share the model pages copy-on-write.
+Each worker limits torch to its share of the CPU cores to avoid oversubscription.
+"""
+import gc
+import multiprocessing
+import os
+
+# Defaults to one worker per core, at least 2 so the workers share the preloaded model, and at
+# most 4 since each worker still holds its own caches and activations
+workers = int(os.environ.get("WEB_CONCURRENCY", min(4, max(2, multiprocessing.cpu_count()))))
+bind = os.environ.get("BIND", f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Threads each worker's torch may use; defaults to an even split of the cores
+TORCH_THREADS_PER_WORKER = int(os.environ.get(
+    "TORCH_THREADS_PER_WORKER", max(1, multiprocessing.cpu_count() // max(1, workers))
+))
+
+# Must be set before torch is imported by the preloaded app
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_THREADS_PER_WORKER))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_THREADS_PER_WORKER))
+# The HuggingFace tokenizers thread pool does not survive a fork
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+
+def when_ready(server):
+    """Runs in the master after the app was imported and before any worker is forked"""
+    import backend
+
+    backend.preload()
+    # Move everything allocated so far out of the garbage collector's reach, so collections in
+    # the workers do not write to (and thereby copy) the shared pages of the preloaded model.
+    # The model is deliberately not warmed up here: running torch's thread pool in the master
+    # before forking can deadlock the workers.
+    gc.freeze()
+    server.log.info(f"Preloaded embedding model; workers use {TORCH_THREADS_PER_WORKER} torch threads each")
+
+
+def post_fork(server, worker):
+    """Runs in each worker right after the fork"""
+    import torch
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
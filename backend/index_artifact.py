@@ -0,0 +1,188 @@
+"""
+Self-contained index artifact for serving without Qdrant or the Hugging Face hub.
+
+An artifact is a directory holding everything the backend needs to answer from one book:
+
+    manifest.json   format, version, collection, embedding model, file checksums
+    index/          the local index (see local_index.py): memory-mappable .npy vectors,
+                    chunk texts and payloads
+    model/          the embedding model, saved with SentenceTransformer.save
+
+It is written by `python ingest_backend.py --export-artifact PATH`, checked with
+`python index_artifact.py verify PATH` and served with INDEX_ARTIFACT_PATH=PATH.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from local_index import LocalIndex
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the layout changes in a way older backends cannot read
+ARTIFACT_FORMAT = 1
+MANIFEST_NAME = "manifest.json"
+INDEX_DIR = "index"
+MODEL_DIR = "model"
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _index_version(index: LocalIndex) -> str:
+    """Content version of an index: changes whenever any chunk id or text changes"""
+    digest = hashlib.sha256()
+    for point_id, payload in zip(index.ids, index.payloads):
+        digest.update(point_id.encode("utf-8"))
+        digest.update(payload.get("page_content", "").encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def write_artifact(path: Path, index: LocalIndex, model, collection_name: str, model_name: str,
+                   title: Optional[str] = None) -> Dict:
+    """
+    Write an artifact for `index` and the SentenceTransformer `model` and return its manifest.
+
+    Each artifact is written to its own versioned directory next to `path`, and `path` is a
+    symlink that is switched to the new directory in one rename, so a reader always finds a
+    complete artifact at `path`. The previous version is kept for readers that resolved the
+    link before the switch; older versions are removed.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    if tmp_path.exists():
+        shutil.rmtree(tmp_path)
+    index.save(tmp_path / INDEX_DIR)
+    model.save(str(tmp_path / MODEL_DIR))
+
+    files = {
+        file_path.relative_to(tmp_path).as_posix(): {"bytes": file_path.stat().st_size, "sha256": _file_sha256(file_path)}
+        for file_path in sorted(tmp_path.rglob("*")) if file_path.is_file()
+    }
+    manifest = {
+        "format": ARTIFACT_FORMAT,
+        "version": f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}-{_index_version(index)}",
+        "collection": collection_name,
+        "title": title,
+        "embedding_model": model_name,
+        "index_mode": index.mode,
+        "count": len(index),
+        "dimension": int(index.vectors.shape[1]),
+        "files": files,
+    }
+    with open(tmp_path / MANIFEST_NAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+
+    version_path = path.with_name(f"{path.name}.{manifest['version']}")
+    if version_path.exists():
+        shutil.rmtree(version_path)
+    os.replace(tmp_path, version_path)
+    _switch_to(path, version_path)
+    logger.info(f"Wrote index artifact {manifest['version']} ({len(index)} chunks) to {path}")
+    return manifest
+
+
+def _switch_to(path: Path, version_path: Path):
+    """Point `path` at `version_path` and remove all but the previous version"""
+    previous = path.resolve() if path.is_symlink() else None
+    link_path = path.with_name(path.name + ".link")
+    if link_path.is_symlink() or link_path.exists():
+        link_path.unlink()
+    try:
+        os.symlink(version_path.name, link_path, target_is_directory=True)
+    except OSError:
+        # No symlinks (e.g. Windows without developer mode): fall back to a plain directory,
+        # moving the old artifact aside first, so there is a brief moment without one
+        if path.exists():
+            old_path = path.with_name(path.name + ".old")
+            if old_path.exists():
+                shutil.rmtree(old_path)
+            os.replace(path, old_path)
+            shutil.rmtree(old_path)
+        os.replace(version_path, path)
+        return
+
+    if path.exists() and not path.is_symlink():
+        # An artifact written before artifacts were versioned: move it aside, then link
+        old_path = path.with_name(path.name + ".old")
+        if old_path.exists():
+            shutil.rmtree(old_path)
+        os.replace(path, old_path)
+        os.replace(link_path, path)
+        shutil.rmtree(old_path)
+    else:
+        # Renaming a symlink over another is atomic
+        os.replace(link_path, path)
+
+    for old_version in path.parent.glob(f"{path.name}.*"):
+        if (old_version.is_dir() and not old_version.is_symlink() and (old_version / MANIFEST_NAME).exists()
+                and old_version.resolve() not in (version_path.resolve(), previous)):
+            shutil.rmtree(old_version)
+
+
+def read_manifest(path: Path) -> Dict:
+    """Read an artifact's manifest; raises ValueError for artifacts this code cannot serve"""
+    manifest_path = path / MANIFEST_NAME
+    if not manifest_path.exists():
+        raise ValueError(f"{path} is not an index artifact (no {MANIFEST_NAME})")
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format") != ARTIFACT_FORMAT:
+        raise ValueError(f"Index artifact {path} has format {manifest.get('format')}, expected {ARTIFACT_FORMAT}")
+    return manifest
+
+
+def verify_artifact(path: Path) -> List[str]:
+    """Check every file against the manifest; returns the problems found"""
+    manifest = read_manifest(path)
+    problems = []
+    for name, expected in manifest["files"].items():
+        file_path = path / name
+        if not file_path.is_file():
+            problems.append(f"missing {name}")
+        elif file_path.stat().st_size != expected["bytes"] or _file_sha256(file_path) != expected["sha256"]:
+            problems.append(f"checksum mismatch for {name}")
+    return problems
+
+
+def index_path(path: Path) -> Path:
+    return path / INDEX_DIR
+
+
+def model_path(path: Path) -> Path:
+    return path / MODEL_DIR
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Inspect and verify index artifacts")
+    parser.add_argument("command", choices=("info", "verify"))
+    parser.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    try:
+        manifest = read_manifest(args.path)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+    if args.command == "info":
+        print(json.dumps({key: value for key, value in manifest.items() if key != "files"}, indent=2))
+    else:
+        problems = verify_artifact(args.path)
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        if problems:
+            sys.exit(1)
+        print(f"Index artifact {manifest['version']} OK ({len(manifest['files'])} files)")
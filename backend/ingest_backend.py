@@ -1,17 +1,43 @@
 import os
+import argparse
 import asyncio
+import hashlib
 from pathlib import Path
 from dotenv import load_dotenv
 from dotenv import dotenv_values
 import logging
-from typing import List, Tuple
+import random
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Iterator, List, Set, Tuple
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
-from langchain_qdrant import Qdrant
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import numpy as np
 
+from storage_profiles import (
+    INDEXED_PAYLOAD_FIELDS,
+    build_hnsw_config,
+    build_quantization_config,
+    build_vectors_config,
+    get_embedding_dimension,
+    get_storage_profile,
+)
+from search_filters import chapter_from_source
+from markdown_chunker import format_heading_path, get_chunker
+from ingest_pipeline import StagedPipeline, batched
+from ingest_checkpoint import IngestCheckpoint, file_fingerprint
+from local_index import LOCAL_INDEX_MODES, LocalIndex, fetch_collection_points
+from chunk_dedup import ChunkDeduplicator
+from collection_dedup import (
+    CONTENT_PAYLOAD_KEY,
+    METADATA_PAYLOAD_KEY,
+    SIGNATURE_FIELD,
+    CollectionDeduplicator,
+    alternates_operations,
+)
+from index_artifact import write_artifact
+
 # Load environment variables
 config = dotenv_values(".env")
 if not config:
@@ -27,7 +53,33 @@ QDRANT_URL = config['QDRANT_URL']
 QDRANT_API_KEY = config['QDRANT_API_KEY']
 HF_API_TOKEN = config['HF_API_TOKEN']
 EMBEDDING_MODEL_NAME = config['EMBEDDING_MODEL_NAME']
+STORAGE_PROFILE = config.get('STORAGE_PROFILE')
 DOCS_PATH = Path("./docs")  # Path to your textbook content
+CHUNK_SIZE = 512
+CHUNK_OVERLAP = 50
+# "markdown" (structure-aware, default) or "recursive" (the previous fixed-size splitter)
+CHUNKER = get_chunker(config.get('CHUNKER'))
+# Skip files smaller than this (probably just frontmatter)
+MIN_DOC_BYTES = 50
+READ_BLOCK_SIZE = 64 * 1024
+EMBED_BATCH_SIZE = int(config.get('INGEST_BATCH_SIZE', 64))
+# Batches allowed to wait between pipeline stages; bounds ingestion memory
+PIPELINE_QUEUE_SIZE = int(config.get('INGEST_QUEUE_SIZE', 4))
+
+# Progress of interrupted runs is kept here so the next run resumes instead of starting over
+CHECKPOINT_PATH = Path(config.get('INGEST_CHECKPOINT_PATH', '.ingest_checkpoint.json'))
+# Failed uploads are retried with exponential backoff before the run gives up
+UPSERT_MAX_RETRIES = int(config.get('INGEST_MAX_RETRIES', 5))
+UPSERT_RETRY_BASE_SECONDS = float(config.get('INGEST_RETRY_BASE_SECONDS', 1.0))
+# Near-duplicate chunks (e.g. mirrored docs) are embedded and stored once; the sources and
+# chapters of the dropped copies are recorded on the chunk that is kept
+DEDUP_ENABLED = config.get('INGEST_DEDUP', 'true').lower() == 'true'
+# Estimated Jaccard similarity of the chunks' word shingles from which they count as duplicates
+DEDUP_THRESHOLD = float(config.get('INGEST_DEDUP_THRESHOLD', 0.85))
+# Alternates payload updates (one per distinct set of alternates) sent per request
+ALTERNATES_BATCH_SIZE = 256
+# Where --local-index writes the exported in-process index
+LOCAL_INDEX_PATH = Path(config.get('LOCAL_INDEX_PATH', 'local_index'))
 
 # Initialize embedding model
 embeddings = HuggingFaceEmbeddings(
@@ -41,151 +93,375 @@ client = QdrantClient(
     https=True  # Ensuring HTTPS for cloud connection
 )
 
-# Initialize Qdrant vector store
-qdrant = Qdrant(
-    client=client,
-    collection_name=config["COLLECTION_NAME"],
-    embeddings=embeddings,
-)
+
+def iter_doc_paths(docs_path: Path) -> Iterator[Path]:
+    """
+    Discover markdown files under the docs directory, including subdirectories
+    """
+    for file_path in sorted(docs_path.rglob("*.md")):
+        try:
+            size = file_path.stat().st_size
+        except OSError as e:
+            # A dangling symlink such as an editor lock file, or a file deleted since the glob
+            logger.warning(f"Skipping {file_path.name}: {str(e)}")
+            continue
+        if size < MIN_DOC_BYTES:
+            logger.warning(f"Skipping {file_path.name} due to short length")
+            continue
+        yield file_path
+
+
+def read_doc_pieces(file_path: Path) -> Iterator[str]:
+    """
+    Stream a file in fixed-size blocks instead of reading it whole
+    """
+    with open(file_path, 'r', encoding='utf-8') as f:
+        while True:
+            piece = f.read(READ_BLOCK_SIZE)
+            if not piece:
+                return
+            yield piece
 
 
-def chunk_text(text: str, chunk_size: int = 512, overlap: int = 50) -> List[str]:
+def point_id(source: str, chunk_index: int) -> str:
     """
-    Split text into overlapping chunks
+    Deterministic point id for a chunk, so re-uploading a chunk overwrites it instead of duplicating it
     """
-    chunks = []
-    start = 0
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{COLLECTION_NAME}/{source}#{chunk_index}"))
 
-    while start < len(text):
-        end = start + chunk_size
 
-        # Find the nearest sentence boundary if possible
-        if end < len(text):
-            # Look for period, exclamation mark, or question mark
-            for punct in '.!?':
-                last_punct = text.rfind(punct, start, end)
-                if last_punct != -1 and last_punct > start + chunk_size // 2:
-                    end = last_punct + 1
-                    break
+def source_name(file_path: Path, docs_path: Path) -> str:
+    """
+    Source name stored with the chunks: the path relative to the docs directory
+    """
+    return file_path.relative_to(docs_path).as_posix()
 
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append(chunk)
 
-        # Move start position forward, considering overlap
-        start = end - overlap if end < len(text) else len(text)
+def iter_file_chunks(file_path: Path, source: str) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yield (chunk_text, metadata) for the chunks of one file, streaming it from disk
+    """
+    chunks = CHUNKER(read_doc_pieces(file_path), chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP)
+    for chunk_idx, chunk in enumerate(chunks):
+        yield chunk["text"], {
+            "source": source,
+            "chapter": chapter_from_source(source),
+            "chunk_index": chunk_idx,
+            "heading_path": format_heading_path(chunk["heading_path"]),
+            # Lets incremental re-ingestion recognize unchanged chunks and reuse their vectors
+            "content_hash": hashlib.sha1(chunk["text"].encode("utf-8")).hexdigest()
+        }
+
+
+def iter_doc_chunks(docs_path: Path, checkpoint: IngestCheckpoint,
+                    file_totals: Dict[str, int]) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yield (chunk_text, metadata) for every chunk of every document, one file at a time.
+    Files and chunks the checkpoint already has are skipped; the number of chunks of each
+    finished file is recorded in `file_totals`.
+    """
+    for file_path in iter_doc_paths(docs_path):
+        source = source_name(file_path, docs_path)
+        fingerprint = file_fingerprint(file_path)
+        if checkpoint.is_complete(source, fingerprint):
+            logger.info(f"Skipping {source}: already ingested")
+            continue
+
+        chunks_done = checkpoint.begin_file(source, fingerprint)
+        logger.info(f"Reading file: {source}" + (f" (resuming after chunk {chunks_done})" if chunks_done else ""))
+        try:
+            chunk_count = 0
+            for text, metadata in iter_file_chunks(file_path, source):
+                chunk_count += 1
+                if metadata["chunk_index"] >= chunks_done:
+                    yield text, metadata
+            file_totals[source] = chunk_count
+        except Exception as e:
+            logger.error(f"Error reading file {source}: {str(e)}")
 
-        # If no progress is being made, advance by chunk_size anyway
-        if start == end:
-            start = end
 
-    return chunks
+def mark_duplicates(chunks: Iterator[Tuple[str, Dict]],
+                    deduplicator: CollectionDeduplicator) -> Iterator[Tuple[str, Dict]]:
+    """
+    Mark chunks that nearly duplicate an earlier chunk with the point id of that chunk
+    (`duplicate_of`). Marked chunks stay in the stream so the checkpoint counts them, but they
+    are neither embedded nor uploaded. Every chunk gets its MinHash signature in the metadata.
+    """
+    for text, metadata in chunks:
+        duplicate_of = deduplicator.find(point_id(metadata["source"], metadata["chunk_index"]), text, metadata)
+        if duplicate_of is not None:
+            metadata["duplicate_of"] = duplicate_of
+        yield text, metadata
 
 
-def read_docs(docs_path: Path) -> List[Tuple[str, str]]:
+def embed_batch(batch: List[Tuple[str, Dict]]) -> Tuple[List[Tuple[str, Dict]], List[List[float]]]:
     """
-    Read all markdown files from the docs directory
-    Returns list of tuples (content, source_filename)
+    Embed one batch of chunks; duplicates get no vector
     """
-    docs_data = []
+    unique = [text for text, metadata in batch if "duplicate_of" not in metadata]
+    vectors = iter(embeddings.embed_documents(unique) if unique else [])
+    return batch, [None if "duplicate_of" in metadata else next(vectors) for _, metadata in batch]
+
 
-    for file_path in docs_path.glob("*.md"):
-        logger.info(f"Reading file: {file_path.name}")
+def with_retries(action: str, operation: Callable[[], None]):
+    """Run a Qdrant write, retrying failures with exponential backoff"""
+    for attempt in range(UPSERT_MAX_RETRIES + 1):
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            operation()
+            return
+        except Exception as e:
+            if attempt == UPSERT_MAX_RETRIES:
+                raise
+            delay = UPSERT_RETRY_BASE_SECONDS * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"{action} failed ({str(e)}); retrying in {delay:.1f}s")
+            time.sleep(delay)
 
-                # Skip if content is too short (probably just frontmatter)
-                if len(content.strip()) < 50:
-                    logger.warning(f"Skipping {file_path.name} due to short length")
-                    continue
 
-                docs_data.append((content, file_path.name))
-        except Exception as e:
-            logger.error(f"Error reading file {file_path.name}: {str(e)}")
+def upsert_batch(batch: List[Tuple[str, Dict]], vectors: List[List[float]]):
+    """
+    Upload one embedded batch to Qdrant in the payload layout LangChain reads,
+    retrying failures with exponential backoff
+    """
+    points = [
+        models.PointStruct(
+            id=point_id(metadata["source"], metadata["chunk_index"]),
+            vector=vector,
+            payload={CONTENT_PAYLOAD_KEY: text, METADATA_PAYLOAD_KEY: metadata},
+        )
+        for (text, metadata), vector in zip(batch, vectors)
+        if vector is not None
+    ]
+    if points:
+        with_retries(f"Upsert of {len(points)} points",
+                     lambda: client.upsert(collection_name=COLLECTION_NAME, points=points))
 
-    return docs_data
+
+def record_alternates(batch: List[Tuple[str, Dict]], deduplicator: CollectionDeduplicator):
+    """
+    Add the sources and chapters of the duplicates in an uploaded batch to the chunks they
+    duplicate. Those chunks are always uploaded in the same or an earlier batch.
+    """
+    changed = set()
+    for _, metadata in batch:
+        kept_id = metadata.get("duplicate_of")
+        if kept_id is None:
+            continue
+        deduplicator.record(kept_id, metadata["source"])
+        changed.add(kept_id)
+    write_alternates(changed, deduplicator.alternates)
+
+
+def write_alternates(kept_ids: Iterable[str], alternates: Dict[str, set]):
+    """Store the current alternates of chunks, batching the payload updates"""
+    for operations in batched(alternates_operations(kept_ids, alternates), ALTERNATES_BATCH_SIZE):
+        with_retries(f"Recording {len(operations)} sets of alternates", lambda: client.batch_update_points(
+            collection_name=COLLECTION_NAME, update_operations=operations,
+        ))
+
+
+def pending_sources(checkpoint: IngestCheckpoint) -> Set[str]:
+    """Sources of the files a batch run is about to (re-)ingest"""
+    pending = set()
+    for file_path in iter_doc_paths(DOCS_PATH):
+        source = source_name(file_path, DOCS_PATH)
+        if not checkpoint.is_complete(source, file_fingerprint(file_path)):
+            pending.add(source)
+    return pending
+
+
+def source_filter(source: str) -> models.Filter:
+    """
+    Payload filter selecting all points of one source file
+    """
+    return models.Filter(
+        must=[models.FieldCondition(key=f"{METADATA_PAYLOAD_KEY}.source", match=models.MatchValue(value=source))]
+    )
 
 
-def create_collection_if_not_exists():
+def delete_stale_points(source: str, chunk_count: int):
+    """
+    Remove points of a source that are not part of its current chunking,
+    e.g. trailing chunks of a file that got shorter or points from older random-id runs
     """
-    Create the Qdrant collection if it doesn't exist
+    expected_ids = [point_id(source, chunk_index) for chunk_index in range(chunk_count)]
+    must_not = [models.HasIdCondition(has_id=expected_ids)] if expected_ids else None
+    client.delete(
+        collection_name=COLLECTION_NAME,
+        points_selector=models.FilterSelector(
+            filter=models.Filter(must=source_filter(source).must, must_not=must_not)
+        ),
+    )
+
+
+def finish_completed_files(checkpoint: IngestCheckpoint, file_totals: Dict[str, int]):
+    """
+    Mark files whose chunks are all uploaded as complete and clean up their stale points
+    """
+    for source, total in list(file_totals.items()):
+        if checkpoint.chunks_done(source) >= total:
+            delete_stale_points(source, total)
+            checkpoint.mark_complete(source)
+            del file_totals[source]
+
+
+def create_collection_if_not_exists(storage_profile: str = None):
+    """
+    Create the Qdrant collection if it doesn't exist, using the given storage profile
     """
     try:
+        profile = get_storage_profile(storage_profile or STORAGE_PROFILE)
+
         # Get existing collections
         collections = client.get_collections()
         collection_names = [col.name for col in collections.collections]
 
-        # Determine embedding dimension from the HuggingFace model
-        sample_embedding = embeddings.embed_query("sample text")
-        embedding_size = len(sample_embedding)
+        if COLLECTION_NAME not in collection_names:
+            # Determine embedding dimension from the model metadata
+            embedding_size = get_embedding_dimension(embeddings)
 
-        if config["COLLECTION_NAME"] not in collection_names:
-            logger.info(f"Creating collection: {config['COLLECTION_NAME']}")
+            logger.info(f"Creating collection: {COLLECTION_NAME} (dimension={embedding_size})")
             client.create_collection(
-                collection_name=config["COLLECTION_NAME"],
-                vectors_config=models.VectorParams(
-                    size=embedding_size,
-                    distance=models.Distance.COSINE
-                ),
+                collection_name=COLLECTION_NAME,
+                vectors_config=build_vectors_config(profile, embedding_size),
+                quantization_config=build_quantization_config(profile),
+                hnsw_config=build_hnsw_config(profile),
+                on_disk_payload=profile["on_disk_payload"],
             )
-            logger.info(f"Collection {config['COLLECTION_NAME']} created successfully")
+            logger.info(f"Collection {COLLECTION_NAME} created successfully")
         else:
-            logger.info(f"Collection {config['COLLECTION_NAME']} already exists")
+            logger.info(f"Collection {COLLECTION_NAME} already exists")
+
+        # Payload indexes are idempotent, so make sure they exist on older collections too
+        for field_name in INDEXED_PAYLOAD_FIELDS:
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field_name,
+                field_schema=models.PayloadSchemaType.KEYWORD,
+            )
 
     except Exception as e:
         logger.error(f"Error creating collection: {str(e)}")
         raise
 
 
-async def ingest_documents():
+async def ingest_documents(fresh: bool = False):
     """
-    Main ingestion function to process all documents and store embeddings in Qdrant
+    Main ingestion function to process all documents and store embeddings in Qdrant.
+    Progress is checkpointed after every batch; unless `fresh` is set, a previous
+    interrupted run is resumed.
     """
     logger.info("Starting ingestion process...")
 
     # Create collection if it doesn't exist
     create_collection_if_not_exists()
 
-    # Read documents
-    docs_data = read_docs(DOCS_PATH)
-
-    if not docs_data:
-        logger.error("No documents found to ingest. Please check the docs directory.")
-        return
-
-    # Process documents using LangChain's Qdrant integration
-    for content, source in docs_data:
-        logger.info(f"Processing document: {source}")
-
-        # Split the content into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=512,
-            chunk_overlap=50,
-            separators=["\n\n", "\n", " ", ""]
-        )
-        chunks = text_splitter.split_text(content)
-
-        # Add documents to Qdrant using the LangChain integration
-        texts_with_metadata = []
-        metadatas = []
-        for chunk_idx, chunk in enumerate(chunks):
-            texts_with_metadata.append(chunk)
-            metadatas.append({
-                "source": source,
-                "chunk_index": chunk_idx
-            })
-
-        # Add to Qdrant
-        qdrant.add_texts(
-            texts=texts_with_metadata,
-            metadatas=metadatas
-        )
-
-        logger.info(f"Added {len(chunks)} chunks from {source} to collection {config['COLLECTION_NAME']}")
-
-    logger.info(f"Ingestion complete! Documents uploaded to collection {config['COLLECTION_NAME']}")
+    checkpoint = IngestCheckpoint(CHECKPOINT_PATH, COLLECTION_NAME)
+    if fresh:
+        checkpoint.clear()
+    else:
+        checkpoint.load()
+
+    # Number of chunks of every fully chunked file, filled in by the chunking stage
+    file_totals: Dict[str, int] = {}
+
+    chunks = iter_doc_chunks(DOCS_PATH, checkpoint, file_totals)
+    deduplicator = None
+    # Existing chunks whose recorded alternates are re-ingested in this run
+    trimmed: Set[str] = set()
+    if DEDUP_ENABLED:
+        deduplicator = CollectionDeduplicator(client, COLLECTION_NAME, ChunkDeduplicator(threshold=DEDUP_THRESHOLD),
+                                              seeded=fresh)
+        if not fresh:
+            trimmed = deduplicator.prepare(pending_sources(checkpoint), checkpoint)
+        chunks = mark_duplicates(chunks, deduplicator)
+
+    # Read -> chunk -> deduplicate -> embed -> upsert, each stage in its own thread with bounded
+    # queues between them, so the first vectors land while later files are still being read
+    pipeline = StagedPipeline(
+        batched(chunks, EMBED_BATCH_SIZE),
+        [embed_batch],
+        queue_size=PIPELINE_QUEUE_SIZE,
+    )
+
+    chunks_per_source: Dict[str, int] = {}
+    duplicates = 0
+    for batch, vectors in pipeline:
+        upsert_batch(batch, vectors)
+        if deduplicator is not None:
+            record_alternates(batch, deduplicator)
+        checkpoint.record_chunks(metadata for _, metadata in batch)
+        for (_, metadata), vector in zip(batch, vectors):
+            if vector is None:
+                duplicates += 1
+                continue
+            chunks_per_source[metadata["source"]] = chunks_per_source.get(metadata["source"], 0) + 1
+        logger.info(f"Upserted batch of {len(batch)} chunks ({sum(chunks_per_source.values())} so far, "
+                    f"{duplicates} duplicates skipped)")
+        finish_completed_files(checkpoint, file_totals)
+
+    # Files whose remaining chunks were all skipped never reach the upload loop
+    finish_completed_files(checkpoint, file_totals)
+    if deduplicator is not None:
+        write_alternates(trimmed, deduplicator.alternates)
+
+    if not chunks_per_source:
+        logger.info("No new or changed documents to ingest.")
+
+    for source, count in chunks_per_source.items():
+        logger.info(f"Added {count} chunks from {source} to collection {COLLECTION_NAME}")
+
+    logger.info(f"Ingestion complete! Documents uploaded to collection {COLLECTION_NAME}")
+
+
+def fetch_export_points():
+    """Every point of the collection, without the signatures only ingestion needs"""
+    ids, vectors, payloads = fetch_collection_points(client, COLLECTION_NAME)
+    for payload in payloads:
+        payload.get(METADATA_PAYLOAD_KEY, {}).pop(SIGNATURE_FIELD, None)
+    return ids, vectors, payloads
+
+
+def export_local_index(mode: str, output_path: Path):
+    """Build the optional in-process index (see local_index.py) from the ingested collection"""
+    ids, vectors, payloads = fetch_export_points()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode)
+    index.save(output_path)
+    logger.info(f"Saved {mode} local index with {len(index)} vectors to {output_path}")
+
+
+def export_artifact(mode: str, output_path: Path, title: str = None):
+    """
+    Write a self-contained index artifact (see index_artifact.py): the collection as a local
+    index plus the embedding model files, so a backend can serve it without Qdrant or the hub
+    """
+    ids, vectors, payloads = fetch_export_points()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode)
+    # HuggingFaceEmbeddings keeps the underlying SentenceTransformer in `_client`
+    write_artifact(output_path, index, embeddings._client, COLLECTION_NAME, EMBEDDING_MODEL_NAME, title=title)
 
 
 if __name__ == "__main__":
-    asyncio.run(ingest_documents())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Ingest the textbook docs into Qdrant")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoint and ingest every file again")
+    parser.add_argument("--local-index", choices=LOCAL_INDEX_MODES,
+                        help="Also export the collection as a local index of this mode")
+    # Overrides used by ingest_books.py to ingest one book of a multi-book deployment
+    parser.add_argument("--collection", default=COLLECTION_NAME)
+    parser.add_argument("--docs", type=Path, default=DOCS_PATH)
+    parser.add_argument("--checkpoint", type=Path, default=CHECKPOINT_PATH)
+    parser.add_argument("--local-index-path", type=Path, default=LOCAL_INDEX_PATH)
+    parser.add_argument("--export-artifact", type=Path, metavar="PATH",
+                        help="Also write a self-contained index artifact (index and model) to PATH; "
+                             "its index uses the --local-index mode, exact by default")
+    parser.add_argument("--title", help="Book title recorded in the artifact")
+    args = parser.parse_args()
+
+    COLLECTION_NAME = args.collection
+    DOCS_PATH = args.docs
+    CHECKPOINT_PATH = args.checkpoint
+    LOCAL_INDEX_PATH = args.local_index_path
+    asyncio.run(ingest_documents(fresh=args.fresh))
+    if args.local_index:
+        export_local_index(args.local_index, LOCAL_INDEX_PATH)
+    if args.export_artifact:
+        export_artifact(args.local_index or "exact", args.export_artifact, title=args.title)
\ No newline at end of file
@@ -0,0 +1,81 @@
+import os
+import argparse
+import logging
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import dotenv_values
+
+from book_registry import load_books
+from local_index import LOCAL_INDEX_MODES
+
+# Load environment variables
+config = dotenv_values(".env")
+if not config:
+    config = os.environ
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INGEST_SCRIPT = Path(__file__).parent / "ingest_backend.py"
+
+
+def ingest_command(book_id: str, book: Dict, fresh: bool, local_index_mode: Optional[str]) -> List[str]:
+    """Command line of one ingest_backend.py run for a book, with its own checkpoint file"""
+    command = [
+        sys.executable, str(INGEST_SCRIPT),
+        "--collection", book["collection"],
+        "--docs", book["docs"],
+        "--checkpoint", f".ingest_checkpoint.{book_id}.json",
+    ]
+    if fresh:
+        command.append("--fresh")
+    if local_index_mode:
+        command += ["--local-index", local_index_mode,
+                    "--local-index-path", book.get("local_index") or f"local_index/{book_id}"]
+    return command
+
+
+def ingest_book(book_id: str, book: Dict, fresh: bool, local_index_mode: Optional[str]) -> int:
+    """Run the ingestion of one book in its own process and return its exit code"""
+    start = time.monotonic()
+    logger.info(f"Ingesting book '{book_id}' from {book['docs']} into collection '{book['collection']}'")
+    result = subprocess.run(ingest_command(book_id, book, fresh, local_index_mode))
+    logger.info(f"Book '{book_id}' finished with exit code {result.returncode} "
+                f"after {time.monotonic() - start:.1f}s")
+    return result.returncode
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest every book of a multi-book deployment in parallel")
+    parser.add_argument("books", nargs="*", help="Book ids to ingest (default: all books)")
+    parser.add_argument("--books-config", type=Path, default=Path(config.get('BOOKS_CONFIG_PATH', 'books.json')))
+    parser.add_argument("--parallel", type=int, default=2,
+                        help="Books ingested at the same time; each run loads its own embedding model")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the checkpoints and ingest every file again")
+    parser.add_argument("--local-index", choices=LOCAL_INDEX_MODES,
+                        help="Also export each book as a local index of this mode")
+    args = parser.parse_args()
+
+    books = load_books(args.books_config, config['COLLECTION_NAME'])
+    unknown = [book_id for book_id in args.books if book_id not in books]
+    if unknown:
+        parser.error(f"Unknown books: {', '.join(unknown)}")
+    selected = args.books or list(books)
+
+    # Separate processes rather than threads: embedding is CPU-bound and each run keeps its own
+    # Qdrant connection and checkpoint
+    with ThreadPoolExecutor(max_workers=args.parallel) as executor:
+        exit_codes = dict(zip(selected, executor.map(
+            lambda book_id: ingest_book(book_id, books[book_id], args.fresh, args.local_index), selected
+        )))
+
+    failed = [book_id for book_id, code in exit_codes.items() if code != 0]
+    if failed:
+        logger.error(f"Ingestion failed for: {', '.join(failed)}")
+        sys.exit(1)
+    logger.info(f"Ingested {len(selected)} books")
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(file_path: Path) -> str:
+    """Cheap change detector for a source file: size and modification time"""
+    stat = file_path.stat()
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class IngestCheckpoint:
+    """
+    Durable record of ingestion progress, so an interrupted run can resume where it stopped.
+
+    For every source file it stores the fingerprint the file had when it was ingested, how
+    many of its chunks (in order) have been uploaded, and whether the file is complete. The
+    record is rewritten atomically after every uploaded batch.
+    """
+
+    def __init__(self, path: Path, collection_name: str):
+        self.path = path
+        self.collection_name = collection_name
+        self._files: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load an existing checkpoint; checkpoints for another collection are ignored"""
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {str(e)}")
+            return
+        if data.get("collection") != self.collection_name:
+            logger.info(f"Checkpoint {self.path} belongs to collection '{data.get('collection')}', starting fresh")
+            return
+        self._files = data.get("files", {})
+        logger.info(f"Resuming from checkpoint {self.path} ({len(self._files)} files recorded)")
+
+    def is_complete(self, source: str, fingerprint: str) -> bool:
+        """True if the file was fully ingested and has not changed since"""
+        with self._lock:
+            entry = self._files.get(source)
+            return bool(entry and entry["fingerprint"] == fingerprint and entry["complete"])
+
+    def begin_file(self, source: str, fingerprint: str) -> int:
+        """
+        Start (or resume) a file and return how many of its chunks are already uploaded.
+        A changed file starts again from its first chunk.
+        """
+        with self._lock:
+            entry = self._files.get(source)
+            if entry is None or entry["fingerprint"] != fingerprint:
+                entry = {"fingerprint": fingerprint, "chunks_done": 0, "complete": False}
+                self._files[source] = entry
+            return entry["chunks_done"]
+
+    def record_chunks(self, chunk_metadatas: Iterable[Dict]):
+        """Record the chunks of an uploaded batch and persist the checkpoint"""
+        with self._lock:
+            for metadata in chunk_metadatas:
+                entry = self._files[metadata["source"]]
+                entry["chunks_done"] = max(entry["chunks_done"], metadata["chunk_index"] + 1)
+            self._save()
+
+    def chunks_done(self, source: str) -> int:
+        with self._lock:
+            return self._files[source]["chunks_done"]
+
+    def mark_complete(self, source: str):
+        with self._lock:
+            self._files[source]["complete"] = True
+            self._save()
+
+    def forget(self, source: str):
+        """Drop a file from the checkpoint, e.g. because it was deleted from the docs"""
+        with self._lock:
+            if self._files.pop(source, None) is not None:
+                self._save()
+
+    def clear(self):
+        """Forget all progress and remove the checkpoint file"""
+        with self._lock:
+            self._files = {}
+            if self.path.exists():
+                self.path.unlink()
+
+    def _save(self):
+        """Write to a temporary file and rename it over the checkpoint so a crash never leaves it half-written"""
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"collection": self.collection_name, "files": self._files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
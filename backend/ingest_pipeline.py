@@ -0,0 +1,103 @@
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
+
+# Marks the end of a stage's output in its queue
+_END = object()
+
+
+def batched(items: Iterable[T], batch_size: int) -> Iterator[List[T]]:
+    """Group an iterable into lists of at most `batch_size` items without materializing it"""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class StagedPipeline:
+    """
+    Run generator stages concurrently, connected by bounded queues.
+
+    The source iterable is consumed in its own thread, each stage function runs in its own
+    thread on the items of the previous stage, and the caller iterates over the output of the
+    last stage. A full queue blocks the stage before it, so at most `queue_size` items wait
+    between any two stages and memory stays flat however long the source is. An exception in
+    any stage stops the others and is re-raised to the caller.
+    """
+
+    def __init__(self, source: Iterable, stages: List[Callable], queue_size: int = 4):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+
+    def __iter__(self) -> Iterator:
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(iter(self.source), queues[0]), daemon=True)]
+        for stage, in_queue, out_queue in zip(self.stages, queues, queues[1:]):
+            threads.append(threading.Thread(target=self._feed, args=(self._apply(stage, in_queue), out_queue),
+                                            daemon=True))
+
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self._drain(queues[-1])
+        finally:
+            # Also reached when the caller stops early or fails: release the stage threads
+            self._stop.set()
+            for q in queues:
+                self._discard(q)
+            for thread in threads:
+                thread.join(timeout=1)
+
+        if self._errors:
+            raise self._errors[0]
+
+    def _feed(self, items: Iterator, out_queue: "queue.Queue"):
+        try:
+            for item in items:
+                if not self._put(out_queue, item):
+                    return
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+        finally:
+            self._put(out_queue, _END, force=True)
+
+    def _apply(self, stage: Callable, in_queue: "queue.Queue") -> Iterator:
+        """Run one stage over the items of its input queue; a function, so each thread gets its own stage"""
+        for item in self._drain(in_queue):
+            yield stage(item)
+
+    def _drain(self, in_queue: "queue.Queue") -> Iterator:
+        while True:
+            item = in_queue.get()
+            if item is _END or self._stop.is_set() and self._errors:
+                return
+            yield item
+
+    def _put(self, out_queue: "queue.Queue", item, force: bool = False) -> bool:
+        while force or not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if force and self._stop.is_set():
+                    self._discard(out_queue)
+        return False
+
+    @staticmethod
+    def _discard(q: "queue.Queue"):
+        try:
+            while True:
+                q.get_nowait()
+        except queue.Empty:
+            pass
+
@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import json
+import logging
+import time
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from qdrant_client.http import models
+
+# Importing the ingestion module loads the embedding model and connects to Qdrant once;
+# the daemon keeps both warm for every re-ingestion
+import ingest_backend
+from ingest_backend import (
+    CHECKPOINT_PATH,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+    METADATA_PAYLOAD_KEY,
+    EMBED_BATCH_SIZE,
+    client,
+    config,
+    delete_stale_points,
+    embeddings,
+    iter_doc_paths,
+    iter_file_chunks,
+    mark_duplicates,
+    point_id,
+    record_alternates,
+    source_filter,
+    source_name,
+    upsert_batch,
+    write_alternates,
+)
+from chunk_dedup import ChunkDeduplicator
+from collection_dedup import CollectionDeduplicator
+from ingest_checkpoint import IngestCheckpoint, file_fingerprint
+from ingest_pipeline import batched
+
+logger = logging.getLogger(__name__)
+
+# How often the docs directory is scanned, and how long it must stay quiet before changes are applied
+WATCH_POLL_SECONDS = float(config.get('WATCH_POLL_SECONDS', 1.0))
+WATCH_DEBOUNCE_SECONDS = float(config.get('WATCH_DEBOUNCE_SECONDS', 2.0))
+# Comma-separated invalidation endpoints of running backends, e.g. http://localhost:8000/api/admin/invalidate
+BACKEND_NOTIFY_URLS = [url.strip() for url in config.get('BACKEND_NOTIFY_URLS', '').split(',') if url.strip()]
+ADMIN_TOKEN = config.get('ADMIN_TOKEN')
+
+# source -> (path, fingerprint)
+Snapshot = Dict[str, Tuple[Path, str]]
+
+
+def scan_docs(docs_path: Path) -> Snapshot:
+    """Fingerprint every markdown file currently under the docs directory"""
+    snapshot = {}
+    for file_path in iter_doc_paths(docs_path):
+        try:
+            snapshot[source_name(file_path, docs_path)] = (file_path, file_fingerprint(file_path))
+        except OSError:
+            # Deleted or made unreadable between discovery and stat; the next scan reports it as removed
+            continue
+    return snapshot
+
+
+def diff_snapshots(previous: Snapshot, current: Snapshot) -> Dict[str, Optional[Path]]:
+    """Map changed or added sources to their path, and removed sources to None"""
+    changes: Dict[str, Optional[Path]] = {}
+    for source, (file_path, fingerprint) in current.items():
+        if source not in previous or previous[source][1] != fingerprint:
+            changes[source] = file_path
+    for source in previous:
+        if source not in current:
+            changes[source] = None
+    return changes
+
+
+def fetch_existing_points(source: str) -> Dict[str, Tuple[str, List[float], List[str]]]:
+    """
+    Map point id -> (content hash, vector, alternate sources) for the points currently stored
+    for a source
+    """
+    existing = {}
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=config["COLLECTION_NAME"],
+            scroll_filter=source_filter(source),
+            with_payload=[METADATA_PAYLOAD_KEY],
+            with_vectors=True,
+            limit=256,
+            offset=offset,
+        )
+        for point in points:
+            metadata = (point.payload or {}).get(METADATA_PAYLOAD_KEY, {})
+            existing[str(point.id)] = (metadata.get("content_hash"), point.vector,
+                                       metadata.get("alternate_sources", []))
+        if offset is None:
+            return existing
+
+
+def reindex_file(file_path: Optional[Path], source: str, checkpoint: IngestCheckpoint,
+                 deduplicator: Optional[CollectionDeduplicator] = None) -> int:
+    """
+    Bring one changed file up to date, or remove it when `file_path` is None, and return the
+    number of chunks that had to be embedded.
+
+    Chunks whose text is unchanged at the same position are left alone. Chunks that only moved
+    (e.g. because a paragraph was inserted above them) reuse their stored vector. Only new or
+    edited text goes through the embedding model.
+
+    Files whose duplicate chunks were dropped in favour of this file's chunks may no longer be
+    stored anywhere, so they are re-indexed right after it. With deduplication on, all of them
+    are checked against the rest of the collection like in a batch run; the watcher's
+    `deduplicator` is seeded from the collection once and then kept up to date here.
+    """
+    pending = {source}
+    trimmed = set()
+    if deduplicator is not None:
+        # Adds the files holding duplicates of this file's chunks to `pending`
+        trimmed = deduplicator.prepare(pending, checkpoint)
+
+    if file_path is None:
+        remove_source(source, checkpoint)
+        embedded = 0
+    else:
+        embedded = index_file(file_path, source, checkpoint, deduplicator, pending)
+    for alternate in sorted(pending - {source}):
+        alternate_path = ingest_backend.DOCS_PATH / alternate
+        if not alternate_path.is_file():
+            # Removed meanwhile; the watcher deletes its points when it notices
+            continue
+        logger.info(f"Re-indexing {alternate}: it duplicated chunks of {source}")
+        embedded += index_file(alternate_path, alternate, checkpoint, deduplicator, pending)
+    if deduplicator is not None:
+        write_alternates(trimmed, deduplicator.alternates)
+    return embedded
+
+
+def index_file(file_path: Path, source: str, checkpoint: IngestCheckpoint,
+               deduplicator: Optional[CollectionDeduplicator], pending: set) -> int:
+    """
+    Incrementally index one file (see `reindex_file`); without dedup, the files holding
+    duplicates of its stored chunks are added to `pending`
+    """
+    fingerprint = file_fingerprint(file_path)
+    chunks = list(iter_file_chunks(file_path, source))
+    if deduplicator is not None:
+        chunks = list(mark_duplicates(chunks, deduplicator))
+    existing = fetch_existing_points(source)
+    vectors_by_hash = {content_hash: vector for content_hash, vector, _ in existing.values() if content_hash}
+    if deduplicator is None:
+        pending.update(alternate for _, _, sources in existing.values() for alternate in sources)
+
+    to_embed = []
+    reused_batch, reused_vectors = [], []
+    # Stored chunks that are now duplicates, and unchanged ones whose recorded alternates are re-indexed
+    duplicate_ids, reset_ids = [], []
+    for text, metadata in chunks:
+        chunk_id = point_id(source, metadata["chunk_index"])
+        stored = existing.get(chunk_id)
+        if "duplicate_of" in metadata:
+            if stored is not None:
+                duplicate_ids.append(chunk_id)
+            continue
+        if stored is not None and stored[0] == metadata["content_hash"]:
+            if stored[2]:
+                reset_ids.append(chunk_id)
+            continue
+        vector = vectors_by_hash.get(metadata["content_hash"])
+        if vector is None:
+            to_embed.append((text, metadata))
+        else:
+            reused_batch.append((text, metadata))
+            reused_vectors.append(vector)
+
+    if reused_batch:
+        upsert_batch(reused_batch, reused_vectors)
+    for batch in batched(to_embed, EMBED_BATCH_SIZE):
+        upsert_batch(batch, embeddings.embed_documents([text for text, _ in batch]))
+    delete_stale_points(source, len(chunks))
+    if duplicate_ids:
+        client.delete(collection_name=config["COLLECTION_NAME"],
+                      points_selector=models.PointIdsList(points=duplicate_ids))
+    # Their alternates are recorded again as the re-indexed files turn out to duplicate them
+    write_alternates(reset_ids, {})
+    if deduplicator is not None:
+        record_alternates(chunks, deduplicator)
+
+    checkpoint.begin_file(source, fingerprint)
+    checkpoint.record_chunks(metadata for _, metadata in chunks)
+    checkpoint.mark_complete(source)
+
+    duplicates = sum(1 for _, metadata in chunks if "duplicate_of" in metadata)
+    logger.info(f"Re-indexed {source}: {len(chunks)} chunks, {len(to_embed)} embedded, "
+                f"{len(reused_batch)} moved, {duplicates} duplicates, "
+                f"{len(chunks) - len(to_embed) - len(reused_batch) - duplicates} unchanged")
+    return len(to_embed)
+
+
+def remove_source(source: str, checkpoint: IngestCheckpoint):
+    """Delete every point of a source file that no longer exists"""
+    client.delete(
+        collection_name=config["COLLECTION_NAME"],
+        points_selector=models.FilterSelector(filter=source_filter(source)),
+    )
+    checkpoint.forget(source)
+    logger.info(f"Removed {source} from collection {config['COLLECTION_NAME']}")
+
+
+def notify_backends(sources: List[str]):
+    """Tell running backends which sources changed so they can drop stale cached results"""
+    body = json.dumps({"sources": sources}).encode("utf-8")
+    for url in BACKEND_NOTIFY_URLS:
+        request = urllib.request.Request(url, data=body, method="POST")
+        request.add_header("Content-Type", "application/json")
+        if ADMIN_TOKEN:
+            request.add_header("X-Admin-Token", ADMIN_TOKEN)
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                logger.info(f"Notified {url} ({response.status})")
+        except Exception as e:
+            logger.warning(f"Could not notify {url}: {str(e)}")
+
+
+def apply_changes(changes: Dict[str, Optional[Path]], checkpoint: IngestCheckpoint,
+                  deduplicator: Optional[CollectionDeduplicator] = None):
+    """Re-index changed files, drop removed ones and notify the backends"""
+    applied = []
+    for source, file_path in sorted(changes.items()):
+        try:
+            reindex_file(file_path, source, checkpoint, deduplicator)
+            applied.append(source)
+        except Exception as e:
+            # The file stays out of date in the checkpoint, so the next batch run picks it up
+            logger.error(f"Error re-indexing {source}: {str(e)}")
+            if deduplicator is not None:
+                # It may hold chunks that never reached the collection
+                deduplicator.reset()
+    if applied:
+        notify_backends(applied)
+
+
+def watch(docs_path: Path):
+    """
+    Watch the docs directory and re-ingest changes once the directory has been quiet for the
+    debounce interval, so a burst of saves from an editor results in a single update.
+    """
+    checkpoint = IngestCheckpoint(CHECKPOINT_PATH, config["COLLECTION_NAME"])
+    checkpoint.load()
+    # Seeded from the collection on the first change, then updated with every re-index
+    deduplicator = None
+    if DEDUP_ENABLED:
+        deduplicator = CollectionDeduplicator(client, config["COLLECTION_NAME"],
+                                              ChunkDeduplicator(threshold=DEDUP_THRESHOLD))
+
+    snapshot = scan_docs(docs_path)
+    pending: Dict[str, Optional[Path]] = {}
+    last_change = 0.0
+    logger.info(f"Watching {docs_path} for changes ({len(snapshot)} files)")
+
+    while True:
+        time.sleep(WATCH_POLL_SECONDS)
+        current = scan_docs(docs_path)
+        changes = diff_snapshots(snapshot, current)
+        snapshot = current
+        if changes:
+            pending.update(changes)
+            last_change = time.monotonic()
+            continue
+        if pending and time.monotonic() - last_change >= WATCH_DEBOUNCE_SECONDS:
+            logger.info(f"Applying changes to {len(pending)} files")
+            apply_changes(pending, checkpoint, deduplicator)
+            pending = {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously re-ingest the docs directory into Qdrant")
+    parser.add_argument("--docs", type=Path, default=ingest_backend.DOCS_PATH)
+    parser.add_argument("--skip-initial-sync", action="store_true",
+                        help="Do not catch up on changes made while the watcher was not running")
+    args = parser.parse_args()
+
+    ingest_backend.DOCS_PATH = args.docs
+    if not args.skip_initial_sync:
+        # Resumes from the checkpoint, so unchanged files are skipped
+        asyncio.run(ingest_backend.ingest_documents())
+    try:
+        watch(args.docs)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
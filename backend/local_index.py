@@ -0,0 +1,195 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search_filters import metadata_matches
+
+logger = logging.getLogger(__name__)
+
+# exact:  full float32 scan, the reference for recall
+# pca:    first pass over a learned low-dimensional projection
+# binary: first pass by Hamming distance over 1 bit per dimension
+LOCAL_INDEX_MODES = ("exact", "pca", "binary")
+
+# Popcount of every byte value, for numpy versions without np.bitwise_count
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+_MAX_CACHED_FILTERS = 256
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def _hamming_distances(codes: np.ndarray, query_code: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):
+        if codes.shape[1] % 8 == 0:
+            # Popcount on 64-bit words is several times faster than byte by byte
+            codes, query_code = codes.view(np.uint64), query_code.view(np.uint64)
+        return np.bitwise_count(np.bitwise_xor(codes, query_code)).sum(axis=1, dtype=np.uint16)
+    return _POPCOUNT[np.bitwise_xor(codes, query_code)].sum(axis=1, dtype=np.uint16)
+
+
+def _top_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first"""
+    if k >= len(scores):
+        return np.argsort(-scores)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class LocalIndex:
+    """
+    In-process vector index over an exported copy of the collection.
+
+    A cheap first pass (a PCA projection or binary codes) selects `oversampling * k`
+    candidates, which are then rescored with the full normalized float32 vectors. Arrays are
+    saved as .npy files and loaded memory-mapped, so all workers on a host share one copy.
+    """
+
+    def __init__(self, mode: str, ids: List[str], vectors: np.ndarray, payloads: List[Dict],
+                 projection: Optional[np.ndarray] = None, reduced: Optional[np.ndarray] = None,
+                 thresholds: Optional[np.ndarray] = None, codes: Optional[np.ndarray] = None,
+                 oversampling: float = 20.0):
+        if mode not in LOCAL_INDEX_MODES:
+            raise ValueError(f"Unknown local index mode '{mode}'. Available modes: {', '.join(LOCAL_INDEX_MODES)}")
+        self.mode = mode
+        self.ids = ids
+        self.vectors = vectors
+        self.payloads = payloads
+        self.projection = projection
+        self.reduced = reduced
+        self.thresholds = thresholds
+        self.codes = codes
+        self.oversampling = oversampling
+        self._filter_masks: Dict[Tuple, np.ndarray] = {}
+        self._rows_by_id: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def build(cls, ids: List[str], vectors, payloads: List[Dict], mode: str = "binary",
+              pca_dims: int = 64, oversampling: float = 20.0, sample_size: int = 20000,
+              seed: int = 0) -> "LocalIndex":
+        """Learn the first-pass representation from the vectors and build the index"""
+        vectors = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+        rng = np.random.default_rng(seed)
+        sample = vectors if len(vectors) <= sample_size else vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        projection = reduced = thresholds = codes = None
+        if mode == "pca":
+            # Uncentered, so dot products in the projected space approximate the full ones
+            _, _, components = np.linalg.svd(sample, full_matrices=False)
+            projection = np.ascontiguousarray(components[:pca_dims].T, dtype=np.float32)
+            reduced = vectors @ projection
+        elif mode == "binary":
+            # Thresholding at the per-dimension mean keeps the bits balanced
+            thresholds = sample.mean(axis=0).astype(np.float32)
+            codes = np.packbits(vectors > thresholds, axis=1)
+
+        return cls(mode, ids, vectors, payloads, projection=projection, reduced=reduced,
+                   thresholds=thresholds, codes=codes, oversampling=oversampling)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def payload_by_id(self, point_id: str) -> Optional[Dict]:
+        """Payload of the point with this id, or None"""
+        if self._rows_by_id is None:
+            self._rows_by_id = {pid: row for row, pid in enumerate(self.ids)}
+        row = self._rows_by_id.get(point_id)
+        return None if row is None else self.payloads[row]
+
+    def _filter_mask(self, conditions: Dict[str, str]) -> np.ndarray:
+        """Boolean mask of the points matching the filter, cached per filter"""
+        key = tuple(sorted(conditions.items()))
+        mask = self._filter_masks.get(key)
+        if mask is None:
+            mask = np.fromiter(
+                (metadata_matches(payload.get("metadata", {}), conditions) for payload in self.payloads),
+                dtype=bool, count=len(self.payloads),
+            )
+            if len(self._filter_masks) >= _MAX_CACHED_FILTERS:
+                self._filter_masks.clear()
+            self._filter_masks[key] = mask
+        return mask
+
+    def search(self, query, k: int, conditions: Optional[Dict[str, str]] = None) -> List[Tuple[int, float]]:
+        """Return (row, cosine similarity) of the k best matches, best first"""
+        query = _normalize_rows(np.asarray(query, dtype=np.float32))
+        mask = self._filter_mask(conditions) if conditions else None
+
+        if self.mode == "exact":
+            candidates = None
+        else:
+            shortlist = min(len(self.ids), max(k, int(k * self.oversampling)))
+            if self.mode == "pca":
+                first_pass = self.reduced @ (query @ self.projection)
+            else:
+                query_code = np.packbits(query > self.thresholds)
+                first_pass = -_hamming_distances(self.codes, query_code).astype(np.float32)
+            if mask is not None:
+                first_pass = np.where(mask, first_pass, -np.inf)
+            candidates = _top_indices(first_pass, shortlist)
+
+        if candidates is None:
+            scores = self.vectors @ query
+            candidates = np.arange(len(scores))
+        else:
+            scores = self.vectors[candidates] @ query
+        if mask is not None:
+            scores = np.where(mask[candidates], scores, -np.inf)
+        best = _top_indices(scores, k)
+        return [(int(candidates[i]), float(scores[i])) for i in best if np.isfinite(scores[i])]
+
+    def save(self, path: Path):
+        """Write the index as a directory of .npy arrays plus JSON metadata and payloads"""
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / "vectors.npy", self.vectors)
+        for name in ("projection", "reduced", "thresholds", "codes"):
+            array = getattr(self, name)
+            if array is not None:
+                np.save(path / f"{name}.npy", array)
+        with open(path / "payloads.json", 'w', encoding='utf-8') as f:
+            json.dump({"ids": self.ids, "payloads": self.payloads}, f, ensure_ascii=False, separators=(",", ":"))
+        with open(path / "index.json", 'w', encoding='utf-8') as f:
+            json.dump({"mode": self.mode, "count": len(self.ids), "dimension": int(self.vectors.shape[1]),
+                       "oversampling": self.oversampling}, f, indent=2)
+
+    @classmethod
+    def load(cls, path: Path, mmap: bool = True) -> "LocalIndex":
+        """Load a saved index; with `mmap` the arrays are paged in from the files on demand"""
+        with open(path / "index.json", 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(path / "payloads.json", 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        mmap_mode = "r" if mmap else None
+        arrays = {}
+        for name in ("vectors", "projection", "reduced", "thresholds", "codes"):
+            file_path = path / f"{name}.npy"
+            arrays[name] = np.load(file_path, mmap_mode=mmap_mode) if file_path.exists() else None
+        logger.info(f"Loaded {meta['mode']} local index with {meta['count']} vectors from {path}")
+        return cls(meta["mode"], data["ids"], payloads=data["payloads"],
+                   oversampling=meta.get("oversampling", 20.0), **arrays)
+
+
+def fetch_collection_points(client, collection_name: str, batch_size: int = 512):
+    """Read every point of a Qdrant collection: ids, vectors and payloads"""
+    ids, vectors, payloads = [], [], []
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            with_payload=True,
+            with_vectors=True,
+            limit=batch_size,
+            offset=offset,
+        )
+        for point in points:
+            ids.append(str(point.id))
+            vectors.append(point.vector)
+            payloads.append(point.payload or {})
+        if offset is None:
+            return ids, np.asarray(vectors, dtype=np.float32), payloads
@@ -0,0 +1,292 @@
+import re
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Lines that change the structure: a code fence or an ATX heading. The match includes the
+# preceding line ending; the literal prefix lets the regex engine skip ahead between lines.
+STRUCTURE_RE = re.compile(r"\n[ \t]*(```|~~~)|\n(#{1,6})[ \t]+([^\n]*)")
+# Frontmatter delimiters; only complete lines are matched, so a closing line split across
+# pieces is never mistaken for the end of the stream
+FRONTMATTER_OPEN_RE = re.compile(r"---[ \t]*\r?\n")
+FRONTMATTER_CLOSE_RE = re.compile(r"^---[ \t]*\r?\n", re.MULTILINE)
+FRONTMATTER_TITLE_RE = re.compile(r"^title:[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+
+# Splits the text of one section into blocks: fenced code (terminated or running to the end)
+# and paragraphs of consecutive non-blank lines
+BLOCK_RE = re.compile(
+    r"^[ \t]*(```|~~~)[^\n]*\n(?:[^\n]*\n)*?[ \t]*\1[^\n]*$"
+    r"|^[ \t]*(?:```|~~~)[^\n]*(?:\n[^\n]*)*"
+    r"|^[^\n]*\S[^\n]*(?:\n(?![ \t]*(?:```|~~~))[^\n]*\S[^\n]*)*",
+    re.MULTILINE,
+)
+PARAGRAPH_BREAK_RE = re.compile(r"\n[ \t]*\n")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+FENCE_PREFIXES = ("```", "~~~")
+
+# Streamed input is regrouped into pieces of about this many characters before scanning
+STREAM_PIECE_CHARS = 64 * 1024
+
+# A block is (kind, text) where kind is "text" or "code"
+Block = Tuple[str, str]
+
+
+def chunk_markdown(text: str, chunk_size: int = 512, overlap: int = 50) -> List[Dict]:
+    """Chunk a whole markdown document held in memory"""
+    return list(chunk_markdown_stream([text], chunk_size=chunk_size, overlap=overlap))
+
+
+def chunk_markdown_lines(lines: Iterable[str], chunk_size: int = 512, overlap: int = 50) -> Iterator[Dict]:
+    """Chunk a markdown document from lines that keep their line endings, e.g. an open file"""
+    return chunk_markdown_stream(_regroup(lines), chunk_size=chunk_size, overlap=overlap)
+
+
+def chunk_markdown_stream(pieces: Iterable[str], chunk_size: int = 512, overlap: int = 50) -> Iterator[Dict]:
+    """
+    Split a markdown document into chunks in a single pass.
+
+    The document arrives as consecutive text pieces (any split, e.g. fixed-size reads of a
+    file), and only the section currently being read is buffered. Structure is found with
+    regexes over whole pieces rather than a Python loop over lines.
+
+    - YAML frontmatter is skipped; its `title` is used as the root heading when there is no H1
+    - Chunks never cross a heading, so each one belongs to exactly one section
+    - Fenced code blocks are kept whole unless they alone exceed the chunk size, and headings
+      inside them are ignored
+    - Consecutive chunks of a section share up to `overlap` characters, but overlap is never
+      carried across sections, a chunk is never made of overlap alone and identical chunks
+      are emitted only once
+
+    Yields dicts with the chunk `text`, its `heading_path` (list of headings from the top of
+    the document) and the 1-based `start_line` of the section it came from.
+    """
+    heading_stack: List[Tuple[int, str]] = []
+    frontmatter_title: Optional[str] = None
+    seen_chunks = set()
+
+    def emit(section_text: str, start_line: int) -> Iterator[Dict]:
+        if "```" in section_text or "~~~" in section_text:
+            blocks = [
+                ("code" if match.group(0).lstrip().startswith(FENCE_PREFIXES) else "text", match.group(0).rstrip())
+                for match in BLOCK_RE.finditer(section_text)
+            ]
+        else:
+            # Plain prose: paragraphs are simply separated by blank lines
+            blocks = [("text", block.strip()) for block in PARAGRAPH_BREAK_RE.split(section_text) if block.strip()]
+        # A heading directly followed by a subheading has no content of its own; it still
+        # appears in the heading path of the subsections
+        if not blocks or (heading_stack and section_text.startswith("#")
+                          and not section_text.partition("\n")[2].strip()):
+            return
+        path = [title for _, title in heading_stack]
+        if frontmatter_title and (not heading_stack or heading_stack[0][0] > 1):
+            path.insert(0, frontmatter_title)
+        for chunk in _pack_blocks(blocks, chunk_size, overlap):
+            if chunk not in seen_chunks:
+                seen_chunks.add(chunk)
+                yield {"text": chunk, "heading_path": path, "start_line": start_line}
+
+    # The buffer always starts with a line ending so the first line is scanned like any other
+    buffer = "\n"
+    # Offset of the line ending that precedes the current section, and how far structure was scanned
+    section_offset = 0
+    scanned = 1
+    section_line = 1
+    fence: Optional[str] = None
+
+    def scan() -> Iterator[Dict]:
+        """Scan the complete lines added since the last call and emit finished sections"""
+        nonlocal buffer, section_offset, scanned, section_line, fence
+        scan_end = buffer.rfind("\n") + 1
+        for match in STRUCTURE_RE.finditer(buffer, scanned - 1, scan_end):
+            marker = match.group(1)
+            if fence is not None:
+                if marker == fence:
+                    fence = None
+                continue
+            if marker is not None:
+                fence = marker
+                continue
+
+            line_end = match.start()
+            if line_end > section_offset:
+                yield from emit(buffer[section_offset + 1:line_end + 1], section_line)
+                section_line += buffer.count("\n", section_offset + 1, line_end + 1)
+                section_offset = line_end
+            level = len(match.group(2))
+            while heading_stack and heading_stack[-1][0] >= level:
+                heading_stack.pop()
+            # Closing hashes of an ATX heading are not part of its title
+            heading_stack.append((level, match.group(3).rstrip().rstrip("#").rstrip()))
+        scanned = max(scan_end, scanned)
+
+        # Drop the text of finished sections so memory stays bounded by the current section
+        if section_offset:
+            buffer = buffer[section_offset:]
+            scanned -= section_offset
+            section_offset = 0
+
+    frontmatter_pending = True
+    for piece in _terminated(pieces):
+        buffer += piece
+
+        if frontmatter_pending:
+            if buffer.startswith("\n---"):
+                opening_end = buffer.find("\n", 1) + 1
+                if not opening_end:
+                    # Wait for the rest of the opening line
+                    continue
+                if FRONTMATTER_OPEN_RE.fullmatch(buffer, 1, opening_end):
+                    closing = FRONTMATTER_CLOSE_RE.search(buffer, opening_end)
+                    if closing is None:
+                        # Wait for the closing delimiter
+                        continue
+                    title_match = FRONTMATTER_TITLE_RE.search(buffer, opening_end, closing.start())
+                    if title_match:
+                        frontmatter_title = title_match.group(1).strip("'\"")
+                    section_line += buffer.count("\n", 1, closing.end())
+                    buffer = "\n" + buffer[closing.end():]
+            elif len(buffer) < 4 and "\n---".startswith(buffer):
+                continue
+            frontmatter_pending = False
+
+        yield from scan()
+
+    # Frontmatter that is never closed is treated as ordinary text
+    if frontmatter_pending:
+        yield from scan()
+    if buffer.strip():
+        yield from emit(buffer[1:], section_line)
+
+
+def chunk_recursive_stream(pieces: Iterable[str], chunk_size: int = 512, overlap: int = 50) -> Iterator[Dict]:
+    """
+    Split a document with the fixed-size RecursiveCharacterTextSplitter setup ingestion used
+    before `chunk_markdown_stream`. It is about 2.5x faster, but blind to the markdown
+    structure: chunks may cross headings and split code blocks, frontmatter is kept, chunks
+    carry no heading path and the whole document is held in memory.
+    """
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    for text in splitter.split_text("".join(pieces)):
+        yield {"text": text, "heading_path": [], "start_line": None}
+
+
+# Chunkers selectable for ingestion, all called as chunker(pieces, chunk_size=..., overlap=...)
+CHUNKERS = {"markdown": chunk_markdown_stream, "recursive": chunk_recursive_stream}
+
+
+def get_chunker(name: Optional[str]):
+    """Look up a chunker by name, falling back to the markdown chunker"""
+    chunker_name = name or "markdown"
+    if chunker_name not in CHUNKERS:
+        raise ValueError(f"Unknown chunker '{chunker_name}'. Available chunkers: {', '.join(sorted(CHUNKERS))}")
+    return CHUNKERS[chunker_name]
+
+
+def _terminated(pieces: Iterable[str]) -> Iterator[str]:
+    """Pass pieces through, adding a final line ending so the last line gets scanned too"""
+    last = ""
+    for piece in pieces:
+        if piece:
+            last = piece
+            yield piece
+    if not last.endswith("\n"):
+        yield "\n"
+
+
+def _regroup(lines: Iterable[str]) -> Iterator[str]:
+    """Join small lines into larger pieces so the regex scan runs over more text per call"""
+    batch: List[str] = []
+    size = 0
+    for line in lines:
+        batch.append(line)
+        size += len(line)
+        if size >= STREAM_PIECE_CHARS:
+            yield "".join(batch)
+            batch = []
+            size = 0
+    if batch:
+        yield "".join(batch)
+
+
+def _pack_blocks(blocks: List[Block], chunk_size: int, overlap: int) -> Iterator[str]:
+    """Greedily pack the blocks of one section into chunks of at most `chunk_size` characters"""
+    current: List[str] = []
+    current_len = 0
+    # Length of the overlap prefix at the start of `current`; a chunk holding only that is dropped
+    overlap_len = 0
+    last_kind = "text"
+
+    for kind, text in blocks:
+        # A block larger than a chunk first fills whatever room is left, so a heading is never stranded
+        room = chunk_size - current_len - 2 if current else chunk_size
+        first_limit = room if room >= chunk_size // 4 else chunk_size
+        pieces = (text,) if len(text) <= chunk_size else _split_oversized(kind, text, chunk_size, first_limit)
+        for piece in pieces:
+            added_len = len(piece) + (2 if current else 0)
+            if current and current_len + added_len > chunk_size:
+                if current_len > overlap_len:
+                    yield "\n\n".join(current)
+                # Overlap is only taken from prose; repeating half a code line helps nobody
+                tail = _overlap_tail(current[-1], overlap) if last_kind == "text" else ""
+                current = [tail] if tail and len(tail) + 2 + len(piece) <= chunk_size else []
+                current_len = len(current[0]) if current else 0
+                overlap_len = current_len
+                added_len = len(piece) + (2 if current else 0)
+            current.append(piece)
+            current_len += added_len
+            last_kind = kind
+
+    if current and current_len > overlap_len:
+        yield "\n\n".join(current)
+
+
+def _split_oversized(kind: str, text: str, chunk_size: int, first_limit: int) -> Iterator[str]:
+    """
+    Split a block larger than a chunk: code by lines, prose by sentences then words.
+    The first piece is at most `first_limit` characters, the rest at most `chunk_size`.
+    """
+    if len(text) <= chunk_size:
+        yield text
+        return
+
+    units = text.split("\n") if kind == "code" else SENTENCE_END_RE.split(text)
+    joiner = "\n" if kind == "code" else " "
+    limit = first_limit
+    buffer = ""
+    for unit in units:
+        if buffer and len(buffer) + len(joiner) + len(unit) <= limit:
+            buffer = buffer + joiner + unit
+            continue
+        if buffer:
+            yield buffer
+            buffer = ""
+            limit = chunk_size
+        while len(unit) > limit:
+            # A single sentence or line longer than the limit: cut at the last space that fits
+            cut = unit.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            yield unit[:cut]
+            unit = unit[cut:].lstrip()
+            limit = chunk_size
+        buffer = unit
+    if buffer:
+        yield buffer
+
+
+def _overlap_tail(text: str, overlap: int) -> str:
+    """Take roughly the last `overlap` characters of a block, starting on a word boundary"""
+    if overlap <= 0 or len(text) <= overlap:
+        return ""
+    tail = text[-overlap:]
+    space = tail.find(" ")
+    return tail[space + 1:] if space != -1 else tail
+
+
+def format_heading_path(path: List[str]) -> str:
+    """Render a heading path for chunk metadata, e.g. 'Chapter 2 > Hardware Specifications'"""
+    return " > ".join(path)
@@ -0,0 +1,88 @@
+import argparse
+import logging
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Importing the backend gives this job exactly the retrieval and generation code the API uses
+import backend
+from answer_store import AnswerStore
+from question_keys import FAQ_QUESTIONS_PATH, load_questions, normalize_question
+
+logger = logging.getLogger(__name__)
+
+QUESTION_HEADING_RE = re.compile(r"^#{1,6}[ \t]+(.+\?)[ \t]*$", re.MULTILINE)
+
+
+def mine_heading_questions(docs_path: Path) -> List[str]:
+    """Headings that are phrased as questions ("What is Physical AI?") are likely reader questions"""
+    questions = []
+    for file_path in sorted(docs_path.rglob("*.md")):
+        text = file_path.read_text(encoding='utf-8')
+        questions.extend(match.group(1).strip() for match in QUESTION_HEADING_RE.finditer(text))
+    return questions
+
+
+def dedupe_questions(questions: List[str]) -> List[str]:
+    """Drop questions that normalize to one already in the list, keeping the first wording"""
+    seen = set()
+    unique = []
+    for question in questions:
+        key = normalize_question(question)
+        if key and key not in seen:
+            seen.add(key)
+            unique.append(question)
+    return unique
+
+
+def answer_question(question: str, top_k: int) -> Tuple[str, Optional[Dict]]:
+    """Run the full retrieval + generation pipeline for one question"""
+    try:
+        sources = backend.retrieve_chunks(question, top_k)
+        if not sources:
+            logger.warning(f"No relevant content found for '{question}', skipping")
+            return question, None
+        return question, {"answer": backend.generate_answer(sources, question), "sources": sources}
+    except Exception as e:
+        logger.error(f"Error answering '{question}': {str(e)}")
+        return question, None
+
+
+def precompute(questions: List[str], output_path: Path, top_k: int, concurrency: int, batch_size: int) -> int:
+    """Answer the questions in parallel batches, saving the store after each batch"""
+    store = AnswerStore(backend.COLLECTION_NAME)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start in range(0, len(questions), batch_size):
+            batch = questions[start:start + batch_size]
+            for question, result in executor.map(lambda q: answer_question(q, top_k), batch):
+                if result is not None:
+                    store.add(question, result["answer"], result["sources"])
+            store.save(output_path, top_k)
+            logger.info(f"Answered {min(start + batch_size, len(questions))}/{len(questions)} questions")
+    return len(store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute answers to frequently asked questions")
+    parser.add_argument("--questions", type=Path, default=FAQ_QUESTIONS_PATH,
+                        help="Curated question list, one question per line")
+    parser.add_argument("--mine-headings", action="store_true",
+                        help="Also use doc headings phrased as questions")
+    parser.add_argument("--docs", type=Path, default=Path("./docs"))
+    parser.add_argument("--output", type=Path, default=backend.ANSWER_STORE_PATH)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=4, help="Questions answered in parallel")
+    parser.add_argument("--batch-size", type=int, default=16, help="Questions per saved batch")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions) if args.questions.exists() else []
+    if args.mine_headings:
+        questions.extend(mine_heading_questions(args.docs))
+    questions = dedupe_questions(questions)
+    if not questions:
+        parser.error("No questions to precompute")
+
+    backend.startup_event()
+    count = precompute(questions, args.output, args.top_k, args.concurrency, args.batch_size)
+    logger.info(f"Wrote {count} precomputed answers to {args.output}")
@@ -0,0 +1,122 @@
+import cProfile
+import functools
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from pathlib import Path
+from typing import Callable, List
+
+# Leaf functions of threads that are parked rather than working (thread pool workers waiting
+# for a task, the event loop waiting for I/O); their stacks are left out of CPU profiles
+IDLE_FUNCTIONS = {"wait", "select", "poll", "accept", "_worker", "_wait_for_tstate_lock"}
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(duration: float, interval: float = 0.005, include_idle: bool = False) -> str:
+    """
+    Sample the Python stacks of all other threads for `duration` seconds and return them in
+    the folded format (`thread;outer;...;inner count` per line) read by flamegraph.pl,
+    speedscope and similar tools.
+
+    Sampling only reads `sys._current_frames()`, so the profiled threads are not slowed down.
+    """
+    own_thread = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            if not include_idle and frame.f_code.co_name in IDLE_FUNCTIONS:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {count}" for stack, count in counts.most_common()) + "\n"
+
+
+def allocation_snapshot(duration: float, top_n: int = 30) -> str:
+    """
+    Trace memory allocations for `duration` seconds and report the source lines that
+    allocated the most memory during that window
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+    try:
+        before = tracemalloc.take_snapshot()
+        time.sleep(duration)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    lines = [f"Traced memory: current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB",
+             f"Top {top_n} allocation sites during the last {duration:g}s:"]
+    # Leave out the profiler's own bookkeeping
+    exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(exclude).compare_to(before.filter_traces(exclude), "lineno")
+    lines.extend(str(stat) for stat in stats[:top_n])
+    return "\n".join(lines) + "\n"
+
+
+class RequestProfiler:
+    """
+    Profiles a random sample of requests with cProfile and keeps the most recent results as
+    .pstats files, loadable with `python -m pstats` or snakeviz
+    """
+
+    def __init__(self, sample_rate: float, output_dir: Path, keep: int = 50):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self.keep = keep
+        self._active = threading.Lock()
+
+    def profile(self, name: str) -> Callable:
+        """Decorator profiling a sampled fraction of the calls of an endpoint"""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                    return func(*args, **kwargs)
+                # Only one cProfile profiler can be active per process; skip while one runs
+                if not self._active.acquire(blocking=False):
+                    return func(*args, **kwargs)
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                    try:
+                        return func(*args, **kwargs)
+                    finally:
+                        profiler.disable()
+                        self._save(profiler, name)
+                finally:
+                    self._active.release()
+            return wrapper
+        return decorator
+
+    def list_profiles(self) -> List[str]:
+        """Saved profile file names, newest first"""
+        if not self.output_dir.exists():
+            return []
+        return sorted((path.name for path in self.output_dir.glob("*.pstats")), reverse=True)
+
+    def _save(self, profiler: cProfile.Profile, name: str):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(self.output_dir / f"{time.time_ns()}-{name}.pstats")
+        for stale in self.list_profiles()[self.keep:]:
+            (self.output_dir / stale).unlink(missing_ok=True)
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+from question_keys import question_hash
+
+
+class QueryTrace:
+    """Per-request record of stage durations and cache outcomes"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.outcomes: Dict[str, str] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time a stage in milliseconds; a stage entered twice accumulates"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.stages[name] = round(self.stages.get(name, 0.0) + elapsed, 2)
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 2)
+
+
+def process_log_path(path: Path) -> Path:
+    """The log file of the current process: `query.log` becomes `query.<pid>.log`"""
+    return path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+
+
+class QueryLog:
+    """
+    Structured query log written as JSON lines to rotating files.
+
+    Every worker process writes and rotates its own file (see `process_log_path`); processes
+    rotating one shared file would rename it from under each other and lose records.
+
+    Requests only put the record on an in-memory queue; a background listener thread does the
+    file I/O, so logging never adds disk latency to a request. Questions are logged as hashes
+    unless `include_questions` is set, in which case the text is logged too so the log can be
+    replayed with `replay_queries.py`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 10 * 1024 * 1024, backup_count: int = 5,
+                 include_questions: bool = False):
+        self.include_questions = include_questions
+        self.path = process_log_path(path)
+        file_handler = logging.handlers.RotatingFileHandler(
+            self.path, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+        file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self._queue: "queue.Queue" = queue.Queue(-1)
+        self._listener = logging.handlers.QueueListener(self._queue, file_handler)
+        self._logger = logging.getLogger(f"query_log.{self.path}")
+        self._logger.setLevel(logging.INFO)
+        self._logger.propagate = False
+        self._logger.addHandler(logging.handlers.QueueHandler(self._queue))
+        self._listener.start()
+
+    def record(self, question: str, top_k: int, conditions: Dict[str, str], session_id: Optional[str],
+               trace: QueryTrace, status: int, source_count: int = 0, book: Optional[str] = None):
+        entry = {
+            "ts": round(time.time(), 3),
+            "question_hash": question_hash(question),
+            "question_chars": len(question),
+            "top_k": top_k,
+            "filters": conditions,
+            "book": book,
+            # Hashed, so a replay can keep the turns of one conversation together
+            "session": hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:12] if session_id else None,
+            "status": status,
+            "sources": source_count,
+            "total_ms": trace.total_ms(),
+            "stages": trace.stages,
+            "outcomes": trace.outcomes,
+        }
+        if self.include_questions:
+            entry["question"] = question
+        self._logger.info(json.dumps(entry, ensure_ascii=False))
+
+    def close(self):
+        """Flush queued records and stop the listener thread"""
+        self._listener.stop()
@@ -0,0 +1,39 @@
+import hashlib
+import json
+import re
+from pathlib import Path
+from typing import Dict, List, Optional
+
+FAQ_QUESTIONS_PATH = Path(__file__).parent / "faq_questions.txt"
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Canonical form of a question for cache lookups: case, surrounding whitespace, repeated
+    spaces and trailing punctuation do not change the meaning of the question
+    """
+    return _WHITESPACE_RE.sub(" ", question).strip().rstrip("?!.").strip().lower()
+
+
+def question_hash(question: str) -> str:
+    """Stable short hash of the normalized question"""
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()[:16]
+
+
+def answer_key(question: str, top_k: int, conditions: Optional[Dict[str, str]] = None,
+               book: Optional[str] = None) -> str:
+    """Cache key for a full answer: the question plus everything that changes retrieval"""
+    return json.dumps([normalize_question(question), top_k, conditions or {}, book], sort_keys=True)
+
+
+def load_questions(path: Path) -> List[str]:
+    """Read a question list: one question per line, '#' starts a comment"""
+    questions = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                questions.append(line)
+    return questions
@@ -0,0 +1,529 @@
+import logging
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional
+
+from dotenv import dotenv_values
+
+from query_log import QueryLog, QueryTrace
+from question_keys import normalize_question
+from request_scheduler import BULK, INTERACTIVE, UpstreamScheduler
+from search_filters import to_qdrant_filter
+from shared_cache import SharedCache
+
+logger = logging.getLogger(__name__)
+
+# Stage interfaces. Each deployment plugs in its own implementations:
+#   embedder(question) -> embedding
+#   retriever(embedding, top_k, conditions, book) -> sources
+#   packer(sources) -> context
+#   generator(context, question, history, book) -> answer
+Embedder = Callable[[str], List[float]]
+Retriever = Callable[[List[float], int, Dict[str, str], Optional[str]], List[Dict[str, str]]]
+ContextPacker = Callable[[List[Dict[str, str]]], str]
+Generator = Callable[[str, str, str, Optional[str]], str]
+
+DEFAULT_TITLE = "Physical AI & Humanoid Robotics"
+
+NOT_COVERED_ANSWER = ("The textbook does not seem to cover this question. "
+                      "Try rephrasing it or asking about a topic from the book.")
+
+
+def load_config() -> Mapping[str, str]:
+    """Settings from the .env file, overridden by the process environment (deployment secrets)"""
+    return {**dotenv_values(".env"), **os.environ}
+
+
+# Source fields kept for sessions and caches but never sent to clients
+INTERNAL_SOURCE_FIELDS = {"alternate_sources"}
+
+
+def make_snippet(text: str, limit: int) -> str:
+    """Cut text to at most `limit` characters, at a word boundary where possible"""
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] if " " in text[:limit] else text[:limit]
+    return cut.rstrip() + "…"
+
+
+def shape_sources(sources: List[Dict[str, str]], include_text: bool, snippet_chars: Optional[int],
+                  default_snippet_chars: int = 200) -> List[Dict[str, str]]:
+    """
+    Trim the sources of a response to what the client asked for: the full text, a snippet of
+    `snippet_chars` (`default_snippet_chars` when not given) or, with 0, no text at all
+    """
+    limit = None if include_text and snippet_chars is None else (
+        default_snippet_chars if snippet_chars is None else snippet_chars
+    )
+    shaped = []
+    for source in sources:
+        trimmed = {key: value for key, value in source.items()
+                   if key not in INTERNAL_SOURCE_FIELDS and (limit is None or key != "text")}
+        if limit is not None and limit > 0:
+            trimmed["text"] = make_snippet(source.get("text", ""), limit)
+        shaped.append(trimmed)
+    return shaped
+
+
+def source_from_payload(point_id, payload: Dict, score: Optional[float] = None) -> Dict[str, str]:
+    """Response source for a point stored in the LangChain payload layout"""
+    metadata = payload.get("metadata", {})
+    source = {
+        "id": str(point_id),
+        "text": payload.get("page_content", ""),
+        "source": metadata.get("source", "Unknown"),
+        "relevance_score": f"{score:.4f}" if score is not None else "N/A",
+    }
+    if metadata.get("alternate_sources"):
+        # Files holding duplicates of the chunk; kept so their re-ingestion invalidates it too
+        source["alternate_sources"] = list(metadata["alternate_sources"])
+    return source
+
+
+def pack_context(sources: List[Dict[str, str]], max_chars: Optional[int] = None) -> str:
+    """Join the source texts into the prompt context, dropping whole sources beyond `max_chars`"""
+    parts, total = [], 0
+    for source in sources:
+        if max_chars is not None and parts and total + len(source["text"]) > max_chars:
+            break
+        parts.append(source["text"])
+        total += len(source["text"])
+    return "\n\n".join(parts)
+
+
+def build_prompt(context: str, question: str, history: str = "", title: str = DEFAULT_TITLE) -> str:
+    """Format the prompt for the LLM with context, optional conversation history and question"""
+    history_section = f"""
+        Conversation so far:
+        {history}
+""" if history else ""
+
+    return f"""
+        Based on the following context from the {title} textbook, please answer the question.
+
+        Context:
+        {context}
+{history_section}
+        Question: {question}
+
+        Answer:
+        """
+
+
+def source_score(source: Dict[str, str]) -> Optional[float]:
+    """Retrieval score of a source, or None for sources retrieved without one"""
+    try:
+        return float(source.get("relevance_score", ""))
+    except ValueError:
+        return None
+
+
+def generate_basic_answer(context: str, question: str, title: str = DEFAULT_TITLE) -> str:
+    """
+    Generate an answer based on context and question with a lightweight approach
+    """
+    # Clean up the context
+    clean_context = context.replace('\n', ' ').strip()
+
+    # Extract sentences that seem most relevant to the question
+    sentences = clean_context.split('.')
+    question_lower = question.lower()
+
+    # Find sentences that contain keywords from the question
+    relevant_sentences = []
+    question_words = [word for word in question_lower.split() if len(word) > 3]  # Only longer words
+
+    for sentence in sentences:
+        sentence_lower = sentence.lower()
+        # Count how many question words appear in this sentence
+        matches = sum(1 for word in question_words if word in sentence_lower)
+        if matches > 0:
+            relevant_sentences.append((sentence.strip(), matches))
+
+    # Sort by relevance (number of matches)
+    relevant_sentences.sort(key=lambda x: x[1], reverse=True)
+
+    # Take top sentences that contribute to answering the question
+    top_sentences = [sent[0] for sent in relevant_sentences[:3]]  # Top 3 most relevant
+
+    # If no specific matches, take the first few sentences as a fallback
+    if not top_sentences:
+        top_sentences = [sent.strip() for sent in sentences[:3] if sent.strip()]
+
+    # Join the selected sentences
+    synthesized_content = '. '.join(top_sentences).strip()
+
+    if not synthesized_content:
+        return f"Based on the textbook content, I could not find specific information to answer: '{question}'. Please refer to the textbook for more details."
+
+    # Formulate the response
+    answer = f"Based on the {title} textbook:\n\n{synthesized_content}.\n\nThis information addresses your question: '{question}'."
+    return answer
+
+
+class AnswerRouter:
+    """
+    Decide from the retrieval scores whether a question needs the LLM at all.
+
+    - "not_covered": the best score is below `min_score`, so the book does not cover the
+      question and a fixed answer is returned
+    - "extractive": the best score reaches `extractive_score` and the extractive answer from
+      the confident chunks fits in `extractive_max_chars`, so it is served without the LLM
+    - "llm": everything else, including questions without any scored source
+
+    Only scored sources count: chunks carried over from an earlier turn of a conversation lose
+    their score, which measured how well they matched a different question.
+
+    Decisions are counted per process; `stats()` returns the counters.
+    """
+
+    ROUTES = ("not_covered", "extractive", "llm")
+
+    def __init__(self, min_score: float = 0.2, extractive_score: float = 0.8, extractive_max_chars: int = 600):
+        self.min_score = min_score
+        self.extractive_score = extractive_score
+        self.extractive_max_chars = extractive_max_chars
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def route(self, sources: List[Dict[str, str]]) -> str:
+        scores = [score for score in map(source_score, sources) if score is not None]
+        if not scores:
+            return "llm"
+        best = max(scores)
+        if best < self.min_score:
+            return "not_covered"
+        if best >= self.extractive_score:
+            return "extractive"
+        return "llm"
+
+    def confident_sources(self, sources: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        return [source for source in sources if (source_score(source) or 0.0) >= self.extractive_score]
+
+    def count(self, route: str):
+        with self._lock:
+            self._counts[route] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {route: self._counts[route] for route in self.ROUTES}
+
+
+class QdrantRetriever:
+    """Retriever searching a Qdrant collection directly, without LangChain"""
+
+    def __init__(self, client, collection_name: str, search_params=None, books: Optional[Dict[str, Dict]] = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.search_params = search_params
+        self.books = books or {}
+
+    def __call__(self, embedding: List[float], top_k: int, conditions: Optional[Dict[str, str]] = None,
+                 book: Optional[str] = None) -> List[Dict[str, str]]:
+        collection_name = self.books[book]["collection"] if book in self.books else self.collection_name
+        query_filter = to_qdrant_filter(conditions or {})
+        if hasattr(self.client, "query_points"):
+            # qdrant-client >= 1.10
+            points = self.client.query_points(
+                collection_name=collection_name,
+                query=embedding,
+                query_filter=query_filter,
+                search_params=self.search_params,
+                limit=top_k,
+                with_payload=True,
+            ).points
+        else:
+            points = self.client.search(
+                collection_name=collection_name,
+                query_vector=embedding,
+                query_filter=query_filter,
+                search_params=self.search_params,
+                limit=top_k,
+                with_payload=True,
+            )
+        return [source_from_payload(point.id, point.payload or {}, point.score) for point in points]
+
+
+def router_from_config(config: Mapping[str, str]) -> Optional[AnswerRouter]:
+    """
+    Answer routing by retrieval score: below ROUTE_MIN_SCORE the book does not cover the question
+    and no LLM call is made; from ROUTE_EXTRACTIVE_SCORE on, an extractive answer of at most
+    ROUTE_EXTRACTIVE_MAX_CHARS is served from the best chunks instead. None when ROUTING_ENABLED is false.
+    """
+    if config.get('ROUTING_ENABLED', 'true').lower() != 'true':
+        return None
+    return AnswerRouter(
+        min_score=float(config.get('ROUTE_MIN_SCORE', 0.2)),
+        extractive_score=float(config.get('ROUTE_EXTRACTIVE_SCORE', 0.8)),
+        extractive_max_chars=int(config.get('ROUTE_EXTRACTIVE_MAX_CHARS', 600)),
+    )
+
+
+def scheduler_from_config(config: Mapping[str, str]) -> Optional[UpstreamScheduler]:
+    """
+    Priority scheduling of upstream calls. Each upstream admits at most its *_CONCURRENCY calls per
+    worker; bulk calls hold at most BULK_MAX_CONCURRENCY of them, waiting interactive calls go
+    first, and beyond BULK_MAX_QUEUED waiting bulk calls further ones are refused. With
+    INTERACTIVE_PREEMPT=false the classes share slots by weight instead. None when
+    SCHEDULER_ENABLED is false.
+    """
+    if config.get('SCHEDULER_ENABLED', 'true').lower() != 'true':
+        return None
+    concurrency = {
+        "embed": int(config.get('EMBED_CONCURRENCY', 2)),
+        "search": int(config.get('SEARCH_CONCURRENCY', 8)),
+        "generate": int(config.get('GENERATE_CONCURRENCY', 4)),
+    }
+    return UpstreamScheduler(concurrency, {
+        INTERACTIVE: {
+            "weight": float(config.get('INTERACTIVE_WEIGHT', 4)),
+            "preempt": config.get('INTERACTIVE_PREEMPT', 'true').lower() == 'true',
+        },
+        BULK: {
+            "weight": float(config.get('BULK_WEIGHT', 1)),
+            "max_running": int(config.get('BULK_MAX_CONCURRENCY', 1)),
+            "max_queued": int(config.get('BULK_MAX_QUEUED', 8)),
+        },
+    })
+
+
+def shared_cache_from_config(config: Mapping[str, str], collection_name: str,
+                             default_path: str = '.rag_cache.sqlite') -> Optional[SharedCache]:
+    """
+    Cache of query embeddings and answers shared by all workers on the host (SHARED_CACHE_PATH,
+    SHARED_CACHE_MAX_ENTRIES, SHARED_CACHE_TTL_SECONDS); an empty path disables it
+    """
+    path = config.get('SHARED_CACHE_PATH', default_path)
+    if not path:
+        return None
+    logger.info(f"Opening shared cache at {path}...")
+    return SharedCache(
+        Path(path),
+        collection_name,
+        max_entries=int(config.get('SHARED_CACHE_MAX_ENTRIES', 10000)),
+        ttl_seconds=float(config.get('SHARED_CACHE_TTL_SECONDS', 86400)),
+    )
+
+
+def query_log_from_config(config: Mapping[str, str]) -> Optional[QueryLog]:
+    """
+    Opt-in structured query log (QUERY_LOG_PATH, QUERY_LOG_MAX_BYTES, QUERY_LOG_BACKUP_COUNT);
+    question text is only logged with QUERY_LOG_INCLUDE_QUESTIONS=true, which replay_queries.py
+    needs to re-issue the questions
+    """
+    path = config.get('QUERY_LOG_PATH')
+    if not path:
+        return None
+    query_log = QueryLog(
+        Path(path),
+        max_bytes=int(config.get('QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        backup_count=int(config.get('QUERY_LOG_BACKUP_COUNT', 5)),
+        include_questions=config.get('QUERY_LOG_INCLUDE_QUESTIONS', 'false').lower() == 'true',
+    )
+    logger.info(f"Writing structured query log to {query_log.path}")
+    return query_log
+
+
+class HFInferenceEmbedder:
+    """Embedder calling the Hugging Face Inference API, for deployments without a local model"""
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+
+    def __call__(self, question: str) -> List[float]:
+        result = self.client.feature_extraction(question, model=self.model)
+        vector = result.tolist() if hasattr(result, "tolist") else result
+        # Some models return one vector per token batch; the first row is the sentence embedding
+        return vector[0] if vector and isinstance(vector[0], list) else vector
+
+
+class HFChatGenerator:
+    """Generator using the chat completion API of a Hugging Face InferenceClient"""
+
+    def __init__(self, client, books: Optional[Dict[str, Dict]] = None, max_tokens: int = 512):
+        self.client = client
+        self.books = books or {}
+        self.max_tokens = max_tokens
+
+    def __call__(self, context: str, question: str, history: str = "", book: Optional[str] = None) -> str:
+        title = self.books.get(book, {}).get("title") or DEFAULT_TITLE
+        response = self.client.chat_completion(
+            messages=[{"role": "user", "content": build_prompt(context, question, history, title)}],
+            max_tokens=self.max_tokens,
+        )
+        return response.choices[0].message.content
+
+
+class HFTextGenerator:
+    """
+    Generator using plain text generation, for models without a chat template.
+
+    `prompt_builder` formats the prompt like `build_prompt`; base models often need a shorter,
+    model-specific instruction.
+    """
+
+    def __init__(self, client, model: str, max_new_tokens: int = 300, temperature: float = 0.7,
+                 books: Optional[Dict[str, Dict]] = None,
+                 prompt_builder: Callable[[str, str, str, str], str] = build_prompt):
+        self.client = client
+        self.model = model
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.books = books or {}
+        self.prompt_builder = prompt_builder
+
+    def __call__(self, context: str, question: str, history: str = "", book: Optional[str] = None) -> str:
+        title = self.books.get(book, {}).get("title") or DEFAULT_TITLE
+        return self.client.text_generation(
+            prompt=self.prompt_builder(context, question, history, title),
+            model=self.model,
+            max_new_tokens=self.max_new_tokens,
+            temperature=self.temperature,
+            return_full_text=False,
+        )
+
+
+class RagPipeline:
+    """
+    Embed, retrieve, pack and generate, with pluggable stages shared by every deployment.
+
+    With a cache (a `SharedCache`), query embeddings are cached in the "embedding" namespace
+    and answers in the "answer" namespace. Independent work overlaps: the answer cache lookup
+    runs on a worker thread while the question is embedded (on a cached answer the embedding
+    is normally a cache hit too, since it was stored when the answer was generated), and the
+    answer is written back to the cache after the result has been returned.
+
+    With a router (an `AnswerRouter`), questions the book does not cover and questions with a
+    decisive chunk are answered without calling the generator.
+
+    With a scheduler (an `UpstreamScheduler`), calls to the embedder, retriever and generator
+    wait for a slot of the "embed", "search" and "generate" upstreams in the priority class of
+    the current request.
+
+    Stage durations, cache outcomes and routes are recorded on the request's `QueryTrace`.
+    """
+
+    def __init__(self, embedder: Embedder, retriever: Retriever, generator: Generator,
+                 packer: ContextPacker = pack_context, cache=None, router: Optional[AnswerRouter] = None,
+                 books: Optional[Dict[str, Dict]] = None, scheduler=None, max_workers: int = 4):
+        self.embedder = embedder
+        self.retriever = retriever
+        self.generator = generator
+        self.packer = packer
+        self.cache = cache
+        self.router = router
+        self.books = books or {}
+        self.scheduler = scheduler
+        # Threads are only started on the first submit, so a pipeline created before
+        # gunicorn forks its workers does not carry threads across the fork
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag-pipeline")
+
+    def embed(self, question: str, trace: Optional[QueryTrace] = None) -> List[float]:
+        """Embed a question, going through the cache so each question is embedded once per host"""
+        key = normalize_question(question)
+        if self.cache is not None:
+            cached = self.cache.get_vector("embedding", key)
+            if trace is not None:
+                trace.outcomes["embedding_cache"] = "hit" if cached is not None else "miss"
+            if cached is not None:
+                return cached
+
+        with self._upstream("embed"):
+            embedding = self.embedder(question)
+        if self.cache is not None:
+            self.cache.set_vector("embedding", key, embedding)
+        return embedding
+
+    def retrieve(self, embedding: List[float], top_k: int, conditions: Optional[Dict[str, str]] = None,
+                 book: Optional[str] = None) -> List[Dict[str, str]]:
+        with self._upstream("search"):
+            return self.retriever(embedding, top_k, conditions or {}, book)
+
+    def generate(self, sources: List[Dict[str, str]], question: str, history: str = "",
+                 book: Optional[str] = None) -> str:
+        """Pack the sources into a context and generate the answer"""
+        context = self.packer(sources)
+        with self._upstream("generate"):
+            return self.generator(context, question, history, book)
+
+    def _upstream(self, name: str):
+        return self.scheduler.slot(name) if self.scheduler is not None else nullcontext()
+
+    def respond(self, sources: List[Dict[str, str]], question: str, history: str = "",
+                book: Optional[str] = None, trace: Optional[QueryTrace] = None) -> Dict:
+        """Answer from retrieved sources, taking the route the router picks; returns {"answer", "sources"}"""
+        trace = trace if trace is not None else QueryTrace()
+        route = self.router.route(sources) if self.router is not None else "llm"
+
+        if route == "not_covered":
+            answer, sources = NOT_COVERED_ANSWER, []
+        elif route == "extractive":
+            confident = self.router.confident_sources(sources)
+            with trace.stage("extract"):
+                title = self.books.get(book, {}).get("title") or DEFAULT_TITLE
+                answer = generate_basic_answer(self.packer(confident), question, title)
+            if len(answer) > self.router.extractive_max_chars:
+                route = "llm"
+            else:
+                sources = confident
+
+        if route == "llm":
+            with trace.stage("generate"):
+                answer = self.generate(sources, question, history, book)
+
+        if self.router is not None:
+            self.router.count(route)
+        trace.outcomes["route"] = route
+        trace.outcomes["answer"] = "generated"
+        return {"answer": answer, "sources": sources}
+
+    def run(self, question: str, top_k: int, conditions: Optional[Dict[str, str]] = None,
+            book: Optional[str] = None, cache_key: Optional[str] = None,
+            trace: Optional[QueryTrace] = None, embedding: Optional[List[float]] = None) -> Dict:
+        """
+        Answer a question. Returns {"answer", "sources"}; the answer is None when nothing
+        relevant was found. Answers are cached under `cache_key` when one is given. Callers
+        that already embedded the question pass the `embedding` to skip that stage.
+        """
+        trace = trace if trace is not None else QueryTrace()
+        use_cache = self.cache is not None and cache_key is not None
+
+        pending_answer = None
+        if use_cache:
+            pending_answer = self._executor.submit(self.cache.get_json, "answer", cache_key)
+            # How often a question is asked decides whether it may become a type-ahead suggestion
+            self._executor.submit(self.cache.increment, "answer", cache_key)
+        if embedding is None:
+            with trace.stage("embed"):
+                embedding = self.embed(question, trace)
+        if pending_answer is not None:
+            with trace.stage("answer_cache"):
+                cached = pending_answer.result()
+            if cached is not None:
+                trace.outcomes["answer"] = "cached"
+                return cached
+
+        with trace.stage("retrieve"):
+            sources = self.retrieve(embedding, top_k, conditions, book)
+        if not sources:
+            return {"answer": None, "sources": []}
+
+        result = self.respond(sources, question, book=book, trace=trace)
+        if use_cache:
+            self._executor.submit(self._store_answer, cache_key, result, question, book,
+                                  trace.outcomes.get("route"))
+        return result
+
+    def _store_answer(self, cache_key: str, result: Dict, question: str, book: Optional[str],
+                      route: Optional[str]):
+        try:
+            # The question and route are kept with the answer so well-answered cached questions
+            # can be offered as suggestions
+            self.cache.set_json("answer", cache_key, dict(result, question=question, book=book, route=route))
+        except Exception as e:
+            logger.warning(f"Error caching answer: {str(e)}")
@@ -0,0 +1,163 @@
+import argparse
+import json
+import logging
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from question_keys import FAQ_QUESTIONS_PATH, load_questions, question_hash
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def load_entries(paths: List[Path]) -> List[Dict]:
+    """Read captured query log files (including rotated ones) in time order"""
+    entries = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    entries.append(json.loads(line))
+    entries.sort(key=lambda entry: entry["ts"])
+    return entries
+
+
+def build_question_index(question_files: List[Path], answer_store_path: Optional[Path]) -> Dict[str, str]:
+    """Map question hash -> question text for logs captured without question text"""
+    questions = []
+    for path in question_files:
+        if path.exists():
+            questions.extend(load_questions(path))
+    if answer_store_path is not None and answer_store_path.exists():
+        with open(answer_store_path, 'r', encoding='utf-8') as f:
+            questions.extend(entry["question"] for entry in json.load(f).get("answers", {}).values())
+    return {question_hash(question): question for question in questions}
+
+
+def send_query(url: str, payload: Dict, timeout: float, priority: Optional[str] = None) -> Dict:
+    """Issue one query and measure its client-side latency"""
+    request = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST")
+    request.add_header("Content-Type", "application/json")
+    if priority:
+        request.add_header("X-Request-Priority", priority)
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except Exception as e:
+        logger.warning(f"Request failed: {str(e)}")
+        status = 0
+    return {"status": status, "latency_ms": (time.perf_counter() - start) * 1000}
+
+
+def replay(entries: List[Dict], questions: Dict[str, str], url: str, speed: float,
+           concurrency: int, timeout: float, priority: Optional[str] = None) -> List[Dict]:
+    """
+    Re-issue the captured queries, keeping their original spacing divided by `speed`
+    (speed 0 sends them as fast as the concurrency allows). Each query keeps the priority
+    class it was served with unless `priority` overrides it.
+    """
+    first_ts = entries[0]["ts"]
+    start = time.monotonic()
+    futures = []
+    skipped = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for entry in entries:
+            question = entry.get("question") or questions.get(entry["question_hash"])
+            if question is None:
+                skipped += 1
+                continue
+            payload = {"question": question, "top_k": entry["top_k"], **entry.get("filters", {})}
+            if entry.get("book"):
+                payload["book"] = entry["book"]
+            if entry.get("session"):
+                payload["session_id"] = f"replay-{entry['session']}"
+
+            if speed > 0:
+                delay = (entry["ts"] - first_ts) / speed - (time.monotonic() - start)
+                if delay > 0:
+                    time.sleep(delay)
+            entry_priority = priority or entry.get("outcomes", {}).get("priority")
+            futures.append(executor.submit(send_query, url, payload, timeout, entry_priority))
+    if skipped:
+        logger.warning(f"Skipped {skipped} entries whose question text is unknown "
+                       f"(capture with QUERY_LOG_INCLUDE_QUESTIONS=true or pass --questions)")
+    return [future.result() for future in futures]
+
+
+def summarize(latencies: List[float], statuses: List[int]) -> Dict:
+    """Latency distribution and status counts"""
+    summary: Dict = {"count": len(latencies)}
+    if latencies:
+        values = np.asarray(latencies)
+        summary["mean_ms"] = round(float(values.mean()), 1)
+        for p in PERCENTILES:
+            summary[f"p{p}_ms"] = round(float(np.percentile(values, p)), 1)
+        summary["max_ms"] = round(float(values.max()), 1)
+    summary["status"] = {str(status): statuses.count(status) for status in sorted(set(statuses))}
+    return summary
+
+
+def print_comparison(columns: Dict[str, Dict]):
+    """Print latency summaries side by side"""
+    names = list(columns)
+    rows = ["count", "mean_ms"] + [f"p{p}_ms" for p in PERCENTILES] + ["max_ms"]
+    print(f"{'':>10}" + "".join(f"{name:>16}" for name in names))
+    for row in rows:
+        print(f"{row:>10}" + "".join(f"{str(columns[name].get(row, '-')):>16}" for name in names))
+    for name in names:
+        print(f"{name} status codes: {columns[name]['status']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a captured query log against a backend")
+    parser.add_argument("logs", type=Path, nargs="+", help="Query log files written with QUERY_LOG_PATH, one or more per worker process")
+    parser.add_argument("--url", default="http://localhost:8000", help="Base URL of the backend under test")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay speed relative to the capture (2 = twice as fast, 0 = no delays)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Maximum requests in flight")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--priority", choices=("interactive", "bulk"),
+                        help="Send every query in this priority class instead of the captured one")
+    parser.add_argument("--questions", type=Path, nargs="*", default=[FAQ_QUESTIONS_PATH],
+                        help="Question lists used to resolve hashed questions")
+    parser.add_argument("--answer-store", type=Path, default=Path("precomputed_answers.json"))
+    parser.add_argument("--output", type=Path, help="Write the replay summary to this JSON file")
+    parser.add_argument("--compare", type=Path, nargs="*", default=[],
+                        help="Summaries of earlier replays to compare against")
+    args = parser.parse_args()
+
+    entries = load_entries(args.logs)
+    if not entries:
+        parser.error("The query logs are empty")
+    questions = build_question_index(args.questions, args.answer_store)
+
+    results = replay(entries, questions, args.url.rstrip("/") + "/api/query",
+                     args.speed, args.concurrency, args.timeout, args.priority)
+    replayed = summarize([r["latency_ms"] for r in results], [r["status"] for r in results])
+
+    columns = {
+        # Server-side durations of the original traffic, for reference
+        "captured": summarize([e["total_ms"] for e in entries], [e["status"] for e in entries]),
+    }
+    for path in args.compare:
+        with open(path, 'r', encoding='utf-8') as f:
+            columns[path.stem] = json.load(f)
+    columns["replay"] = replayed
+    print_comparison(columns)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(replayed, f, indent=2)
@@ -0,0 +1,175 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Dict, Optional, Set
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+
+# Priority class of the request being served by the current thread; set by the endpoint and read
+# by the pipeline stages, so the class does not have to be passed through every call
+request_priority: ContextVar[str] = ContextVar("request_priority", default=INTERACTIVE)
+
+
+class QueueFull(Exception):
+    """Raised when a priority class already has its maximum number of calls waiting"""
+
+
+class _Waiter:
+    __slots__ = ("priority", "tag", "enqueued", "granted")
+
+    def __init__(self, priority: str, tag: float):
+        self.priority = priority
+        self.tag = tag
+        self.enqueued = time.perf_counter()
+        self.granted = threading.Event()
+
+
+class FairQueue:
+    """
+    Admission to one upstream (the embedding model, Qdrant, the inference API) with at most
+    `concurrency` calls in flight, shared between priority classes by weighted fair queuing.
+
+    `classes` maps a class name to its settings:
+
+        weight        share of the slots while several classes are waiting
+        max_running   calls of the class in flight at once (None: no limit besides `concurrency`)
+        max_queued    calls of the class allowed to wait; further calls raise QueueFull
+        preempt       waiting calls of the class are granted before those of non-preempting classes
+
+    Every call gets a virtual finish tag: the later of the queue's virtual time and the class's
+    previous tag, plus 1 / weight. Free slots go to the waiting call with the smallest tag, so
+    over time each busy class gets slots in proportion to its weight. Calls of a preempting
+    class skip ahead of all other waiting calls, so weights only apply between classes that
+    preempt alike; a class capped below `concurrency` always leaves slots for the others.
+    Calls already in flight are never interrupted.
+    """
+
+    def __init__(self, name: str, concurrency: int, classes: Dict[str, Dict]):
+        self.name = name
+        self.concurrency = concurrency
+        self.classes = classes
+        self._lock = threading.Lock()
+        self._free = concurrency
+        self._virtual_time = 0.0
+        self._last_tag = {priority: 0.0 for priority in classes}
+        self._waiting = {priority: deque() for priority in classes}
+        self._running = {priority: 0 for priority in classes}
+        self._granted = {priority: 0 for priority in classes}
+        self._rejected = {priority: 0 for priority in classes}
+        self._wait_seconds = {priority: 0.0 for priority in classes}
+
+    @contextmanager
+    def slot(self, priority: str):
+        """Hold one of the upstream's slots for the duration of the block"""
+        waiter = self._enqueue(priority)
+        try:
+            waiter.granted.wait()
+        except BaseException:
+            # Interrupted while waiting: leave the queue, or hand back a slot granted meanwhile
+            self._cancel(waiter)
+            raise
+        try:
+            yield
+        finally:
+            self._release(priority)
+
+    def _enqueue(self, priority: str) -> _Waiter:
+        settings = self.classes[priority]
+        with self._lock:
+            max_queued = settings.get("max_queued")
+            if max_queued is not None and len(self._waiting[priority]) >= max_queued:
+                self._rejected[priority] += 1
+                raise QueueFull(f"Too many {priority} requests waiting for {self.name}")
+            tag = max(self._virtual_time, self._last_tag[priority]) + 1.0 / settings["weight"]
+            self._last_tag[priority] = tag
+            waiter = _Waiter(priority, tag)
+            self._waiting[priority].append(waiter)
+            self._dispatch()
+        return waiter
+
+    def _release(self, priority: str):
+        with self._lock:
+            self._running[priority] -= 1
+            self._free += 1
+            self._dispatch()
+
+    def _cancel(self, waiter: _Waiter):
+        with self._lock:
+            if waiter.granted.is_set():
+                self._running[waiter.priority] -= 1
+                self._free += 1
+                self._dispatch()
+            else:
+                self._waiting[waiter.priority].remove(waiter)
+
+    def _dispatch(self):
+        """Grant free slots to waiting calls; the caller holds the lock"""
+        while self._free > 0:
+            best = None
+            for priority, waiting in self._waiting.items():
+                settings = self.classes[priority]
+                max_running = settings.get("max_running")
+                if not waiting or (max_running is not None and self._running[priority] >= max_running):
+                    continue
+                rank = (not settings.get("preempt", False), waiting[0].tag)
+                if best is None or rank < best[0]:
+                    best = (rank, priority)
+            if best is None:
+                return
+
+            waiter = self._waiting[best[1]].popleft()
+            self._free -= 1
+            self._running[waiter.priority] += 1
+            self._granted[waiter.priority] += 1
+            self._wait_seconds[waiter.priority] += time.perf_counter() - waiter.enqueued
+            self._virtual_time = max(self._virtual_time, waiter.tag)
+            waiter.granted.set()
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                priority: {
+                    "running": self._running[priority],
+                    "waiting": len(self._waiting[priority]),
+                    "granted": self._granted[priority],
+                    "rejected": self._rejected[priority],
+                    "mean_wait_ms": round(self._wait_seconds[priority] * 1000 / self._granted[priority], 2)
+                    if self._granted[priority] else 0.0,
+                }
+                for priority in self.classes
+            }
+
+
+class UpstreamScheduler:
+    """
+    One FairQueue per upstream, used by the pipeline stages as `with scheduler.slot("generate"):`.
+    The priority class is taken from `request_priority`; upstreams without a queue are not limited.
+    Each worker process schedules its own calls.
+    """
+
+    def __init__(self, concurrency: Dict[str, int], classes: Dict[str, Dict]):
+        self.queues = {name: FairQueue(name, limit, classes) for name, limit in concurrency.items()}
+
+    def slot(self, upstream: str):
+        queue = self.queues.get(upstream)
+        if queue is None:
+            return nullcontext()
+        return queue.slot(request_priority.get())
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: queue.stats() for name, queue in self.queues.items()}
+
+
+def classify_request(header_priority: Optional[str], api_key: Optional[str], bulk_api_keys: Set[str]) -> str:
+    """
+    Priority class of a request: callers with a bulk API key are always bulk, anyone else may
+    declare a class with the priority header, and undeclared requests are interactive
+    """
+    if api_key and api_key in bulk_api_keys:
+        return BULK
+    if header_priority and header_priority.strip().lower() in (INTERACTIVE, BULK):
+        return header_priority.strip().lower()
+    return INTERACTIVE
@@ -0,0 +1,58 @@
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from qdrant_client.http import models
+
+# Payload keys (inside the LangChain "metadata" payload) that queries can filter on
+FILTERABLE_FIELDS = ("source", "chapter")
+# Lists of the sources and chapters of near-duplicate chunks merged into a chunk at ingestion;
+# a filter on a field also matches chunks listing the value here
+ALTERNATE_FIELDS = {"source": "alternate_sources", "chapter": "alternate_chapters"}
+
+
+def chapter_from_source(source: str) -> str:
+    """
+    Derive the chapter id from a source file name.
+    The chapter id is the Docusaurus doc id, e.g. 'chapter-02-hardware.md' -> 'chapter-02-hardware'
+    """
+    return Path(source).stem
+
+
+def build_filter_conditions(source: Optional[str] = None, chapter: Optional[str] = None) -> Dict[str, str]:
+    """Collect the requested filters as a mapping of metadata field -> required value"""
+    conditions = {}
+    if source:
+        conditions["source"] = source
+    if chapter:
+        conditions["chapter"] = chapter
+    return conditions
+
+
+def to_qdrant_filter(conditions: Dict[str, str]) -> Optional[models.Filter]:
+    """Turn filter conditions into a Qdrant payload filter backed by the keyword indexes"""
+    if not conditions:
+        return None
+    return models.Filter(
+        must=[
+            models.Filter(should=[
+                models.FieldCondition(key=f"metadata.{key}", match=models.MatchValue(value=value))
+                for key in (field, ALTERNATE_FIELDS[field])
+            ])
+            if field in ALTERNATE_FIELDS else
+            models.FieldCondition(key=f"metadata.{field}", match=models.MatchValue(value=value))
+            for field, value in conditions.items()
+        ]
+    )
+
+
+def source_files(source: Dict) -> Set[str]:
+    """The file a retrieved source chunk was stored for and the files holding duplicates of it"""
+    return {source["source"], *source.get(ALTERNATE_FIELDS["source"], ())}
+
+
+def metadata_matches(metadata: Dict, conditions: Dict[str, str]) -> bool:
+    """Check chunk metadata against filter conditions, for local index backends"""
+    return all(
+        metadata.get(field) == value or value in metadata.get(ALTERNATE_FIELDS.get(field, ""), ())
+        for field, value in conditions.items()
+    )
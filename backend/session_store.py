@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search_filters import source_files
+
+# Rough characters-per-token ratio used to keep the condensed history within budget
+CHARS_PER_TOKEN = 4
+
+
+class ConversationTurn:
+    """One question/answer exchange together with what was retrieved for it"""
+
+    __slots__ = ("question", "embedding", "conditions", "sources", "answer")
+
+    def __init__(self, question: str, embedding: np.ndarray, conditions: Dict[str, str],
+                 sources: List[Dict[str, str]], answer: str):
+        self.question = question
+        self.embedding = embedding
+        self.conditions = conditions
+        self.sources = sources
+        self.answer = answer
+
+
+class ConversationSession:
+    """
+    Bounded history of recent turns for a single chat session.
+    Two requests of one session may overlap, so the turns are only read through a snapshot
+    taken under the session's lock.
+    """
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[ConversationTurn] = deque(maxlen=max_turns)
+        self.last_active = time.monotonic()
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> List[ConversationTurn]:
+        """The current turns, oldest first"""
+        with self._lock:
+            return list(self.turns)
+
+    def most_similar_turn(self, embedding: np.ndarray,
+                          conditions: Dict[str, str]) -> Tuple[Optional[ConversationTurn], float]:
+        """Find the earlier turn whose question is closest to the new one, under the same filters"""
+        best_turn, best_similarity = None, 0.0
+        for turn in self.snapshot():
+            if turn.conditions != conditions:
+                continue
+            # Embeddings are stored normalized, so the dot product is the cosine similarity
+            similarity = float(np.dot(turn.embedding, embedding))
+            if similarity > best_similarity:
+                best_turn, best_similarity = turn, similarity
+        return best_turn, best_similarity
+
+    def add_turn(self, question: str, embedding: np.ndarray, conditions: Dict[str, str],
+                 sources: List[Dict[str, str]], answer: str):
+        """Record a finished turn; the oldest turn is dropped once the session is full"""
+        turn = ConversationTurn(question, embedding, conditions, sources, answer)
+        with self._lock:
+            self.turns.append(turn)
+
+    def condensed_history(self, token_budget: int, answer_chars: int = 300) -> str:
+        """
+        Condense recent turns into a prompt section, newest first, until the token budget is spent
+        """
+        char_budget = token_budget * CHARS_PER_TOKEN
+        lines: List[str] = []
+        for turn in reversed(self.snapshot()):
+            answer = turn.answer if len(turn.answer) <= answer_chars else turn.answer[:answer_chars] + "..."
+            entry = f"User: {turn.question}\nAssistant: {answer}"
+            if len(entry) > char_budget:
+                break
+            lines.append(entry)
+            char_budget -= len(entry)
+        # Present the kept turns in chronological order
+        return "\n\n".join(reversed(lines))
+
+
+class SessionStore:
+    """
+    Thread-safe, bounded store of conversation sessions.
+    Sessions are kept in least-recently-used order; the oldest are evicted when the store is
+    full or when they have been idle for longer than the TTL.
+    """
+
+    def __init__(self, max_sessions: int = 1000, max_turns: int = 5, idle_ttl_seconds: float = 1800):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ConversationSession:
+        """Return the session for an id, creating it if needed"""
+        with self._lock:
+            self._evict_idle()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = ConversationSession(self.max_turns)
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_active = time.monotonic()
+            return session
+
+    def clear(self):
+        """Drop all sessions, e.g. after the collection was re-ingested"""
+        with self._lock:
+            self._sessions.clear()
+
+    def invalidate_sources(self, sources: List[str]):
+        """
+        Forget the chunks of turns that retrieved from any of the given (re-ingested) sources.
+        The question and answer stay in the conversation history.
+        """
+        changed = set(sources)
+        with self._lock:
+            for session in self._sessions.values():
+                for turn in session.snapshot():
+                    if any(source_files(source) & changed for source in turn.sources):
+                        turn.sources = []
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self):
+        """Drop sessions idle for longer than the TTL; the oldest are at the front"""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_active >= cutoff:
+                break
+            del self._sessions[session_id]
+
+
+def normalize_embedding(embedding: List[float]) -> np.ndarray:
+    """Store embeddings as unit-length float32 vectors so comparisons are a single dot product"""
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
@@ -0,0 +1,286 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Trim the cache back to its size limit after this many writes from one process
+TRIM_EVERY_WRITES = 100
+# Lookups refresh an entry's access time at most this often, to keep reads mostly read-only
+TOUCH_INTERVAL_SECONDS = 60
+# Invalidations kept for workers that have not caught up yet; one further behind starts over
+KEPT_INVALIDATIONS = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_versions (
+    collection TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_entries (
+    key TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    value BLOB NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed);
+CREATE TABLE IF NOT EXISTS cache_counters (
+    key TEXT PRIMARY KEY,
+    collection TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_invalidations (
+    collection TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    details TEXT NOT NULL,
+    PRIMARY KEY (collection, version)
+);
+"""
+
+
+class SharedCache:
+    """
+    Cache shared by all worker processes on a host, stored in a local SQLite database.
+
+    SQLite in WAL mode lets every `uvicorn --workers N` process read and write the same file
+    concurrently, and with `mmap_size` set the database pages are memory-mapped, so workers
+    share them through the OS page cache instead of each keeping a private copy.
+
+    Entries are namespaced ("embedding", "answer", ...) and tied to a collection version.
+    `invalidate()` bumps the version, which makes every entry of the collection unreachable
+    for all workers at once. Each invalidation is recorded with its details, so workers can
+    replay the ones they missed against their own in-process caches. Least recently used
+    entries are evicted beyond `max_entries`, and entries older than `ttl_seconds` are ignored.
+
+    Database errors (e.g. "database is locked") are logged and treated as cache misses or
+    failed writes; the cache is never required for a request to succeed.
+    """
+
+    def __init__(self, path: Path, collection_name: str, max_entries: int = 10000,
+                 ttl_seconds: Optional[float] = None, mmap_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.collection_name = collection_name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.mmap_bytes = mmap_bytes
+        self._local = threading.local()
+        # Guards the per-process counters, which the pipeline's worker threads update too
+        self._counter_lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+        connection = self._connection()
+        with connection:
+            connection.executescript(_SCHEMA)
+            connection.execute(
+                "INSERT OR IGNORE INTO cache_versions (collection, version) VALUES (?, 0)",
+                (self.collection_name,),
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections must not be shared between threads"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(str(self.path), timeout=5)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.connection = connection
+        return connection
+
+    def _version(self, connection: sqlite3.Connection) -> int:
+        row = connection.execute(
+            "SELECT version FROM cache_versions WHERE collection = ?", (self.collection_name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def version(self) -> int:
+        """Current version of the collection's entries; changes on every invalidation"""
+        return self._version(self._connection())
+
+    def _key(self, namespace: str, key: str, version: int) -> str:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return f"{self.collection_name}:{version}:{namespace}:{digest}"
+
+    def get(self, namespace: str, key: str) -> Optional[bytes]:
+        """Return the cached bytes for a key, or None"""
+        try:
+            connection = self._connection()
+            version = self._version(connection)
+            cache_key = self._key(namespace, key, version)
+            row = connection.execute(
+                "SELECT value, created, accessed FROM cache_entries WHERE key = ?", (cache_key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            return None
+
+        now = time.time()
+        if row is None or (self.ttl_seconds is not None and now - row[1] > self.ttl_seconds):
+            with self._counter_lock:
+                self.misses += 1
+            return None
+
+        with self._counter_lock:
+            self.hits += 1
+        if now - row[2] > TOUCH_INTERVAL_SECONDS:
+            try:
+                with connection:
+                    connection.execute("UPDATE cache_entries SET accessed = ? WHERE key = ?", (now, cache_key))
+            except sqlite3.Error:
+                # Losing an access-time update only makes eviction slightly less accurate
+                pass
+        return row[0]
+
+    def set(self, namespace: str, key: str, value: bytes):
+        """Store bytes under a key for the current collection version"""
+        try:
+            connection = self._connection()
+            now = time.time()
+            with connection:
+                version = self._version(connection)
+                connection.execute(
+                    "INSERT OR REPLACE INTO cache_entries (key, collection, version, value, created, accessed) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (self._key(namespace, key, version), self.collection_name, version, value, now, now),
+                )
+            with self._counter_lock:
+                self._writes += 1
+                trim_due = self._writes % TRIM_EVERY_WRITES == 0
+            if trim_due:
+                self.trim()
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    def get_json(self, namespace: str, key: str):
+        value = self.get(namespace, key)
+        return json.loads(value) if value is not None else None
+
+    def set_json(self, namespace: str, key: str, value):
+        self.set(namespace, key, json.dumps(value).encode("utf-8"))
+
+    def increment(self, namespace: str, key: str):
+        """Count one use of a key, whether or not a value is cached for it yet"""
+        try:
+            connection = self._connection()
+            with connection:
+                version = self._version(connection)
+                connection.execute(
+                    "INSERT INTO cache_counters (key, collection, version, count) VALUES (?, ?, ?, 1) "
+                    "ON CONFLICT(key) DO UPDATE SET count = count + 1",
+                    (self._key(namespace, key, version), self.collection_name, version),
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache write failed: {str(e)}")
+
+    def iter_json(self, namespace: str, min_count: int = 0) -> Iterator:
+        """
+        Every live JSON value of a namespace for the current collection version whose key was
+        counted at least `min_count` times, in no particular order
+        """
+        connection = self._connection()
+        prefix = f"{self.collection_name}:{self._version(connection)}:{namespace}"
+        oldest = time.time() - self.ttl_seconds if self.ttl_seconds is not None else 0
+        # Keys of the namespace sort between "<prefix>:" and "<prefix>;", so this is a primary key
+        # range scan; LIKE would also treat "_" in collection names as a wildcard
+        rows = connection.execute(
+            "SELECT entries.value FROM cache_entries AS entries "
+            "LEFT JOIN cache_counters AS counters ON counters.key = entries.key "
+            "WHERE entries.key > ? AND entries.key < ? AND entries.created >= ? "
+            "AND COALESCE(counters.count, 0) >= ?",
+            (prefix + ":", prefix + ";", oldest, min_count),
+        )
+        for (value,) in rows:
+            yield json.loads(value)
+
+    def get_vector(self, namespace: str, key: str) -> Optional[List[float]]:
+        value = self.get(namespace, key)
+        return np.frombuffer(value, dtype=np.float32).tolist() if value is not None else None
+
+    def set_vector(self, namespace: str, key: str, vector: List[float]):
+        self.set(namespace, key, np.asarray(vector, dtype=np.float32).tobytes())
+
+    def invalidate(self, details: Optional[Dict] = None) -> bool:
+        """
+        Bump the collection version so every worker stops seeing the current entries, and
+        record `details` (e.g. the changed sources) for `invalidations_since`.
+        Returns False when the database could not be updated.
+        """
+        try:
+            self._invalidate(details)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache invalidation failed: {str(e)}")
+            return False
+        return True
+
+    def _invalidate(self, details: Optional[Dict]):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "UPDATE cache_versions SET version = version + 1 WHERE collection = ?", (self.collection_name,)
+            )
+            version = self._version(connection)
+            for table in ("cache_entries", "cache_counters"):
+                connection.execute(
+                    f"DELETE FROM {table} WHERE collection = ? AND version < ?", (self.collection_name, version)
+                )
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_invalidations (collection, version, details) VALUES (?, ?, ?)",
+                (self.collection_name, version, json.dumps(details or {})),
+            )
+            connection.execute(
+                "DELETE FROM cache_invalidations WHERE collection = ? AND version <= ?",
+                (self.collection_name, version - KEPT_INVALIDATIONS),
+            )
+
+    def invalidations_since(self, version: int) -> Optional[List[Tuple[int, Dict]]]:
+        """
+        (version, details) of every invalidation after `version`, oldest first, or None when
+        some of them are no longer recorded and the caller should assume everything changed
+        """
+        connection = self._connection()
+        rows = connection.execute(
+            "SELECT version, details FROM cache_invalidations WHERE collection = ? AND version > ? ORDER BY version",
+            (self.collection_name, version),
+        ).fetchall()
+        first_missed = rows[0][0] if rows else self._version(connection) + 1
+        if first_missed != version + 1:
+            return None
+        return [(row_version, json.loads(details)) for row_version, details in rows]
+
+    def trim(self):
+        """Evict the least recently used entries beyond the size limit"""
+        connection = self._connection()
+        with connection:
+            count = connection.execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+            excess = count - self.max_entries
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM cache_entries WHERE key IN "
+                    "(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)",
+                    (excess,),
+                )
+            # Counters outlive their entries only until the next trim
+            connection.execute(
+                "DELETE FROM cache_counters WHERE key NOT IN (SELECT key FROM cache_entries)"
+            )
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of this process and the number of entries shared by all workers"""
+        try:
+            entries = self._connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+        except sqlite3.Error as e:
+            logger.warning(f"Shared cache read failed: {str(e)}")
+            entries = None
+        with self._counter_lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": entries}
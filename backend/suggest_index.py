@@ -0,0 +1,147 @@
+import re
+from bisect import bisect_left
+from heapq import nsmallest
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from question_keys import normalize_question
+
+# Suggestions that are already answered rank first: precomputed answers cost nothing to serve,
+# cached answers cost a cache read, headings only point the user at a topic of the book
+KIND_WEIGHTS: Dict[str, int] = {"precomputed": 3, "cached": 2, "heading": 1}
+
+# A suggestion matches a prefix of its text or of any of its first few words onwards, so
+# "sensors" finds "What sensors does a humanoid robot use?"
+MAX_WORD_OFFSET = 6
+# Candidates ranked per kind and lookup; short prefixes such as "wh" match far more keys than
+# this, and scanning them all would cost more than the lookup is worth
+SCAN_LIMIT = 256
+
+HEADING_RE = re.compile(r"^#{1,3}[ \t]+(.+?)[ \t#]*$")
+FENCE_PREFIXES = ("```", "~~~")
+
+# Questions typed by users are only offered to others when they look like an ordinary question
+# about the book: plain words, a sensible length, and phrased as a question. This keeps out
+# junk and most personal details (addresses, numbers, links) that a question may carry.
+QUESTION_WORDS = {"what", "how", "why", "when", "where", "which", "who", "can", "does", "do",
+                  "is", "are", "should", "explain", "describe", "compare"}
+SUGGESTIBLE_RE = re.compile(r"[A-Za-z][A-Za-z0-9 ,'()/+-]*[?.]?")
+MIN_SUGGESTIBLE_WORDS = 3
+MAX_SUGGESTIBLE_WORDS = 20
+MAX_SUGGESTIBLE_CHARS = 120
+
+
+def markdown_headings(text: str) -> List[str]:
+    """Level 1-3 ATX headings of a markdown document, skipping fenced code"""
+    headings = []
+    in_fence = False
+    for line in text.splitlines():
+        stripped = line.lstrip()
+        if stripped.startswith(FENCE_PREFIXES):
+            in_fence = not in_fence
+        elif not in_fence:
+            match = HEADING_RE.match(line)
+            if match:
+                headings.append(match.group(1))
+    return headings
+
+
+def suggestible_question(question: str) -> bool:
+    """Whether a question asked by a user may be offered to other users as a suggestion"""
+    text = " ".join(question.split())
+    words = normalize_question(text).split()
+    if not MIN_SUGGESTIBLE_WORDS <= len(words) <= MAX_SUGGESTIBLE_WORDS or len(text) > MAX_SUGGESTIBLE_CHARS:
+        return False
+    if not SUGGESTIBLE_RE.fullmatch(text) or re.search(r"\d{4,}", text):
+        return False
+    return words[0] in QUESTION_WORDS or text.endswith("?")
+
+
+def suggestible_cached_answer(cached: Dict) -> bool:
+    """
+    Whether a cached answer's question may become a suggestion: the book covered it and the
+    question passes `suggestible_question`. How often it was asked is checked by the cache query.
+    """
+    route = cached.get("route")
+    return route is not None and route != "not_covered" and suggestible_question(cached.get("question") or "")
+
+
+def docs_headings(docs_dir: Optional[str]) -> List[str]:
+    """Headings of every markdown file under a book's docs directory"""
+    if not docs_dir or not Path(docs_dir).is_dir():
+        return []
+    headings = []
+    for path in sorted(Path(docs_dir).rglob("*.md")):
+        headings.extend(markdown_headings(path.read_text(encoding="utf-8", errors="replace")))
+    return headings
+
+
+class SuggestIndex:
+    """
+    Immutable prefix index of suggestion texts.
+
+    Every suggestion is stored under its normalized text and under the suffixes starting at
+    each of its first MAX_WORD_OFFSET words, in one sorted list per kind. A lookup is two binary
+    searches per list for the range of keys starting with the prefix, plus ranking at most
+    SCAN_LIMIT keys of each; keeping the kinds apart means the few precomputed questions are
+    never crowded out by thousands of cached ones. The index is rebuilt rather than updated,
+    so readers never need a lock.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        # One entry per normalized text, keeping the most valuable kind
+        best: Dict[str, Tuple[str, str]] = {}
+        for text, kind in entries:
+            text = " ".join(text.split())
+            normalized = normalize_question(text)
+            if not normalized:
+                continue
+            current = best.get(normalized)
+            if current is None or KIND_WEIGHTS[kind] > KIND_WEIGHTS[current[1]]:
+                best[normalized] = (text, kind)
+
+        self.entries: List[Tuple[str, str]] = []
+        keys: Dict[str, List[Tuple[str, int, int]]] = {kind: [] for kind in KIND_WEIGHTS}
+        for normalized, entry in best.items():
+            entry_id = len(self.entries)
+            self.entries.append(entry)
+            words = normalized.split(" ")
+            for offset in range(min(len(words), MAX_WORD_OFFSET)):
+                keys[entry[1]].append((" ".join(words[offset:]), offset, entry_id))
+
+        # Parallel lists per kind: sorted keys and the (word offset, entry id) each key points to
+        self._tiers: List[Tuple[List[str], List[Tuple[int, int]]]] = []
+        for kind_keys in keys.values():
+            kind_keys.sort()
+            self._tiers.append(([key for key, _, _ in kind_keys],
+                                [(offset, entry_id) for _, offset, entry_id in kind_keys]))
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def count(self, kind: str) -> int:
+        return sum(1 for _, entry_kind in self.entries if entry_kind == kind)
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[Dict[str, str]]:
+        """Up to `limit` suggestions for a typed prefix, best first"""
+        query = normalize_question(prefix)
+        if not query:
+            return []
+        # A trailing space means the last word is complete: "arm " should not match "armature"
+        if prefix[-1:].isspace():
+            query += " "
+        best_offsets: Dict[int, int] = {}
+        for tier_keys, matches in self._tiers:
+            start = bisect_left(tier_keys, query)
+            end = min(bisect_left(tier_keys, query + "\uffff", lo=start), start + SCAN_LIMIT)
+            for offset, entry_id in matches[start:end]:
+                if offset < best_offsets.get(entry_id, MAX_WORD_OFFSET):
+                    best_offsets[entry_id] = offset
+
+        def rank(entry_id: int):
+            text, kind = self.entries[entry_id]
+            # Matches at the start of the text beat matches further in, then answered questions win
+            return best_offsets[entry_id] > 0, -KIND_WEIGHTS[kind], len(text)
+
+        return [{"text": self.entries[entry_id][0], "kind": self.entries[entry_id][1]}
+                for entry_id in nsmallest(limit, best_offsets, key=rank)]
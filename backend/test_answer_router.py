@@ -0,0 +1,73 @@
+import pytest
+
+from rag_pipeline import NOT_COVERED_ANSWER, AnswerRouter, RagPipeline
+
+
+def source(score, text="Robots use sensors to perceive the world."):
+    return {"id": "1", "text": text, "source": "a.md", "relevance_score": score}
+
+
+@pytest.mark.parametrize("scores, route", [
+    ([], "llm"),
+    (["0.1000"], "not_covered"),
+    (["0.1999", "0.0500"], "not_covered"),
+    (["0.2000"], "llm"),
+    (["0.5000", "0.1000"], "llm"),
+    (["0.7999"], "llm"),
+    (["0.8000"], "extractive"),
+    (["0.3000", "0.9500"], "extractive"),
+    # Sources without a score (reused or carried over in a session) do not count
+    (["N/A"], "llm"),
+    (["N/A", "N/A"], "llm"),
+    (["N/A", "0.1000"], "not_covered"),
+    (["N/A", "0.9000"], "extractive"),
+])
+def test_route_by_best_scored_source(scores, route):
+    router = AnswerRouter(min_score=0.2, extractive_score=0.8)
+    assert router.route([source(score) for score in scores]) == route
+
+
+def make_pipeline(router):
+    generated = []
+
+    def generator(context, question, history="", book=None):
+        generated.append(question)
+        return "Generated answer"
+
+    pipeline = RagPipeline(embedder=lambda question: [1.0], retriever=lambda *args: [],
+                           generator=generator, router=router)
+    return pipeline, generated
+
+
+@pytest.mark.parametrize("scores, route, calls_llm", [
+    (["0.1000"], "not_covered", False),
+    (["0.9000", "0.4000"], "extractive", False),
+    (["0.5000"], "llm", True),
+    # Session follow-up: chunks reused from an earlier turn have no fresh score, so the LLM answers
+    (["N/A", "N/A"], "llm", True),
+    # Session follow-up with carried chunks: only the fresh scores decide
+    (["0.1000", "N/A"], "not_covered", False),
+])
+def test_respond_takes_the_route(scores, route, calls_llm):
+    router = AnswerRouter(min_score=0.2, extractive_score=0.8)
+    pipeline, generated = make_pipeline(router)
+
+    result = pipeline.respond([source(score) for score in scores], "Which sensors do robots use?")
+
+    assert bool(generated) == calls_llm
+    assert router.stats()[route] == 1
+    if route == "not_covered":
+        assert result == {"answer": NOT_COVERED_ANSWER, "sources": []}
+    if route == "extractive":
+        # Only the confident chunks are cited
+        assert [s["relevance_score"] for s in result["sources"]] == ["0.9000"]
+
+
+def test_long_extractive_answer_falls_back_to_llm():
+    router = AnswerRouter(min_score=0.2, extractive_score=0.8, extractive_max_chars=20)
+    pipeline, generated = make_pipeline(router)
+
+    result = pipeline.respond([source("0.9500")], "Which sensors do robots use?")
+
+    assert result["answer"] == "Generated answer"
+    assert generated and router.stats() == {"not_covered": 0, "extractive": 0, "llm": 1}
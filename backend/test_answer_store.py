@@ -0,0 +1,51 @@
+import threading
+
+from answer_store import AnswerStore
+
+
+def make_store(count):
+    store = AnswerStore("book")
+    store.top_k = 3
+    for n in range(count):
+        sources = [{"id": str(n), "text": "Text", "source": f"chapter-{n % 10}.md"}]
+        if n % 7 == 0:
+            sources[0]["alternate_sources"] = ["mirror.md"]
+        store.add(f"Question {n}?", f"Answer {n}", sources)
+    return store
+
+
+def test_invalidate_sources_drops_answers_citing_changed_or_alternate_sources():
+    store = make_store(30)
+
+    store.invalidate_sources(["chapter-1.md", "mirror.md"])
+
+    remaining = set(store.questions())
+    assert "Question 1?" not in remaining and "Question 21?" not in remaining
+    assert "Question 7?" not in remaining and "Question 14?" not in remaining
+    assert "Question 2?" in remaining
+    assert store.get("question 2", 3)["answer"] == "Answer 2"
+    assert store.get("Question 1?", 3) is None
+
+
+def test_invalidate_sources_while_reading():
+    """Readers iterate the questions while invalidations delete answers"""
+    store = make_store(5000)
+    errors = []
+
+    def read():
+        try:
+            for _ in range(50):
+                store.questions()
+        except RuntimeError as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for reader in readers:
+        reader.start()
+    for n in range(10):
+        store.invalidate_sources([f"chapter-{n}.md"])
+    for reader in readers:
+        reader.join()
+
+    assert errors == []
+    assert len(store) == 0
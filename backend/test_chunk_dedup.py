@@ -0,0 +1,83 @@
+import numpy as np
+
+from chunk_dedup import ChunkDeduplicator
+
+WORDS = ("robot joint sensor actuator torque balance gait planner camera lidar encoder motor "
+         "controller feedback servo kinematics dynamics trajectory simulation gazebo").split()
+
+
+def paragraph(seed, length=120):
+    rng = np.random.default_rng(seed)
+    return " ".join(rng.choice(WORDS, size=length))
+
+
+def test_exact_duplicate_points_to_first_chunk():
+    deduplicator = ChunkDeduplicator()
+    text = paragraph(0)
+    assert deduplicator.find("a", text) is None
+    assert deduplicator.find("b", text) == "a"
+    # Case and punctuation do not make a chunk different
+    assert deduplicator.find("c", text.upper().replace(" ", ", ")) == "a"
+    assert len(deduplicator) == 1
+
+
+def test_near_duplicate_above_threshold():
+    deduplicator = ChunkDeduplicator(threshold=0.85)
+    words = paragraph(1).split()
+    edited = " ".join(words[:60] + ["humanoid"] + words[61:])
+    assert deduplicator.find("a", " ".join(words)) is None
+    assert deduplicator.find("b", edited) == "a"
+
+
+def test_pairs_below_threshold_are_kept():
+    deduplicator = ChunkDeduplicator(threshold=0.85)
+    words = paragraph(2).split()
+    # Rewriting a third of the chunk leaves well under 85% of the shingles shared
+    rewritten = " ".join(words[:80] + paragraph(3, 40).split())
+    assert deduplicator.find("a", " ".join(words)) is None
+    assert deduplicator.find("b", rewritten) is None
+    assert deduplicator.find("c", paragraph(4)) is None
+    assert len(deduplicator) == 3
+
+
+def test_threshold_decides_between_similar_chunks():
+    words = paragraph(5).split()
+    # Every twentieth word changed: about three quarters of the shingles are still shared
+    edited = " ".join("humanoid" if n % 20 == 0 else word for n, word in enumerate(words))
+    strict, loose = ChunkDeduplicator(threshold=0.95), ChunkDeduplicator(threshold=0.5)
+    for deduplicator in (strict, loose):
+        deduplicator.find("a", " ".join(words))
+    assert strict.find("b", edited) is None
+    assert loose.find("b", edited) == "a"
+
+
+def test_signature_round_trip():
+    deduplicator = ChunkDeduplicator()
+    signature = deduplicator.signature(paragraph(6))
+    encoded = deduplicator.encode_signature(signature)
+    assert np.array_equal(ChunkDeduplicator().decode_signature(encoded), signature)
+    # Signatures computed another way are not reused
+    assert ChunkDeduplicator(num_perm=32).decode_signature(encoded) is None
+    assert ChunkDeduplicator(seed=2).decode_signature(encoded) is None
+    for broken in (None, "", "garbage", encoded[:-8], encoded.split(":")[0] + ":!!"):
+        assert deduplicator.decode_signature(broken) is None
+
+
+def test_registered_signature_matches_like_text():
+    deduplicator = ChunkDeduplicator()
+    text = paragraph(7)
+    deduplicator.add_signature("a", deduplicator.signature(text))
+    assert deduplicator.find("b", text) == "a"
+
+
+def test_removed_chunk_is_no_longer_matched():
+    deduplicator = ChunkDeduplicator()
+    text = paragraph(8)
+    deduplicator.add("a", text)
+    deduplicator.remove("a")
+    deduplicator.remove("unknown")
+    assert len(deduplicator) == 0
+    assert deduplicator.find("b", text) is None
+    # Registering a key again replaces its signature
+    deduplicator.add("b", paragraph(9))
+    assert deduplicator.find("c", text) is None
@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+from chunk_dedup import ChunkDeduplicator
+from collection_dedup import SIGNATURE_FIELD, CollectionDeduplicator, alternates_operations
+from ingest_checkpoint import IngestCheckpoint
+
+COLLECTION = "book"
+SHARED = "The robot keeps its balance by shifting weight between the feet while the planner adjusts each step."
+
+
+class FakeClient:
+    """Qdrant client over an in-memory list of points, answering scrolls by source one page at a time"""
+
+    def __init__(self, points, page_size=2):
+        self.points = points
+        self.page_size = page_size
+        self.scrolled_payloads = []
+        self.retrieved = []
+
+    def scroll(self, collection_name, scroll_filter, with_payload, with_vectors, limit, offset):
+        assert collection_name == COLLECTION
+        self.scrolled_payloads.append(with_payload)
+        points = self.points
+        if scroll_filter is not None:
+            sources = set(scroll_filter.must[0].match.any)
+            points = [point for point in points if point.payload["metadata"]["source"] in sources]
+        start = offset or 0
+        end = start + self.page_size
+        page = [SimpleNamespace(id=point.id, payload={key: point.payload[key] for key in with_payload})
+                for point in points[start:end]]
+        return page, end if end < len(points) else None
+
+    def retrieve(self, collection_name, ids, with_payload):
+        self.retrieved.extend(ids)
+        return [SimpleNamespace(id=point.id, payload={key: point.payload[key] for key in with_payload})
+                for point in self.points if point.id in ids]
+
+
+def stored_point(point_id, source, text, alternates=(), signed=True):
+    metadata = {"source": source, "alternate_sources": list(alternates)}
+    if signed:
+        deduplicator = ChunkDeduplicator()
+        metadata[SIGNATURE_FIELD] = deduplicator.encode_signature(deduplicator.signature(text))
+    return SimpleNamespace(id=point_id, payload={"page_content": text, "metadata": metadata})
+
+
+def make_checkpoint(tmp_path, sources):
+    checkpoint = IngestCheckpoint(tmp_path / "checkpoint.json", COLLECTION)
+    for source in sources:
+        checkpoint.begin_file(source, "fingerprint")
+        checkpoint.mark_complete(source)
+    return checkpoint
+
+
+def test_seeds_from_stored_signatures_without_reading_text(tmp_path):
+    client = FakeClient([stored_point("a1", "a.md", SHARED), stored_point("b1", "b.md", "Lidar maps the room.")])
+    deduplicator = CollectionDeduplicator(client, COLLECTION, ChunkDeduplicator())
+
+    assert deduplicator.prepare({"c.md"}, make_checkpoint(tmp_path, ["a.md", "b.md"])) == set()
+
+    assert all(payload == ["metadata"] for payload in client.scrolled_payloads)
+    assert client.retrieved == []
+    metadata = {}
+    assert deduplicator.find("c1", SHARED, metadata) == "a1"
+    assert metadata[SIGNATURE_FIELD] == client.points[0].payload["metadata"][SIGNATURE_FIELD]
+
+
+def test_chunks_without_signature_are_hashed_from_text(tmp_path):
+    client = FakeClient([stored_point("a1", "a.md", SHARED, signed=False), stored_point("b1", "b.md", "Lidar.")])
+    deduplicator = CollectionDeduplicator(client, COLLECTION, ChunkDeduplicator())
+
+    deduplicator.prepare(set(), make_checkpoint(tmp_path, ["a.md", "b.md"]))
+
+    assert client.retrieved == ["a1"]
+    assert deduplicator.find("c1", SHARED, {}) == "a1"
+
+
+def test_files_holding_duplicates_are_reingested(tmp_path):
+    # b.md's copy of a1 was dropped, and c.md's copy of b2 too; d.md is unrelated
+    client = FakeClient([
+        stored_point("a1", "a.md", SHARED, alternates=["b.md"]),
+        stored_point("b2", "b.md", "Servo torque limits.", alternates=["c.md"]),
+        stored_point("d1", "d.md", "Gazebo simulates sensors.", alternates=["a.md"]),
+    ])
+    checkpoint = make_checkpoint(tmp_path, ["a.md", "b.md", "c.md", "d.md"])
+    deduplicator = CollectionDeduplicator(client, COLLECTION, ChunkDeduplicator())
+    pending = {"a.md"}
+
+    trimmed = deduplicator.prepare(pending, checkpoint)
+
+    assert pending == {"a.md", "b.md", "c.md"}
+    assert not checkpoint.is_complete("b.md", "fingerprint") and not checkpoint.is_complete("c.md", "fingerprint")
+    assert checkpoint.is_complete("a.md", "fingerprint") and checkpoint.is_complete("d.md", "fingerprint")
+    # Only d.md is still registered, and its recorded copy in a.md is re-ingested
+    assert len(deduplicator.deduplicator) == 1
+    assert trimmed == {"d1"}
+    assert deduplicator.alternates == {"d1": set()}
+
+
+def test_long_lived_deduplicator_is_updated_without_reading_the_collection(tmp_path):
+    client = FakeClient([
+        stored_point("a1", "a.md", SHARED, alternates=["b.md"]),
+        stored_point("c1", "c.md", "Encoders measure joint angles."),
+    ])
+    checkpoint = make_checkpoint(tmp_path, ["a.md", "b.md", "c.md"])
+    deduplicator = CollectionDeduplicator(client, COLLECTION, ChunkDeduplicator())
+    deduplicator.prepare({"c.md"}, checkpoint)
+    seeding_scrolls = len(client.scrolled_payloads)
+
+    # c.md is edited again: only its own points are read, and its stored chunk is dropped
+    assert deduplicator.prepare({"c.md"}, checkpoint) == set()
+    assert len(client.scrolled_payloads) == seeding_scrolls + 1
+    assert deduplicator.find("c1", "Encoders measure joint angles.", {}) is None
+
+    # b.md is edited: the chunk kept for its copy loses the recorded alternate
+    assert deduplicator.prepare({"b.md"}, checkpoint) == {"a1"}
+    assert deduplicator.alternates["a1"] == set()
+    deduplicator.record("a1", "b.md")
+    assert deduplicator.alternates["a1"] == {"b.md"}
+
+    # a.md is edited: its chunk is forgotten and b.md is re-ingested with it
+    pending = {"a.md"}
+    client.points[0].payload["metadata"]["alternate_sources"] = ["b.md"]
+    deduplicator.prepare(pending, checkpoint)
+    assert pending == {"a.md", "b.md"}
+    assert "a1" not in deduplicator.alternates
+    assert deduplicator.find("b1", SHARED, {}) is None
+
+
+def test_reset_seeds_again(tmp_path):
+    client = FakeClient([stored_point("a1", "a.md", SHARED)])
+    checkpoint = make_checkpoint(tmp_path, ["a.md"])
+    deduplicator = CollectionDeduplicator(client, COLLECTION, ChunkDeduplicator())
+    deduplicator.prepare(set(), checkpoint)
+    deduplicator.find("b1", "Something ingested before a failure.", {})
+
+    deduplicator.reset()
+    deduplicator.prepare(set(), checkpoint)
+
+    assert len(deduplicator.deduplicator) == 1
+    assert deduplicator.find("c1", SHARED, {}) == "a1"
+
+
+def test_alternates_operations_group_chunks_with_the_same_alternates():
+    alternates = {"k1": {"b.md", "mirror/a.md"}, "k2": {"mirror/a.md", "b.md"}, "k3": {"b.md"}}
+    operations = alternates_operations(["k1", "k2", "k3", "k4"], alternates)
+
+    updates = {tuple(op.set_payload.points): op.set_payload for op in operations}
+    assert set(updates) == {("k1", "k2"), ("k3",), ("k4",)}
+    assert all(update.key == "metadata" for update in updates.values())
+    assert updates[("k1", "k2")].payload["alternate_sources"] == ["b.md", "mirror/a.md"]
+    assert updates[("k4",)].payload == {"alternate_sources": [], "alternate_chapters": []}
+    assert alternates_operations([], alternates) == []
@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import numpy as np
+
+from index_artifact import index_path, model_path, read_manifest, verify_artifact, write_artifact
+from local_index import LocalIndex
+
+
+class StubModel:
+    """Stands in for a SentenceTransformer: saving writes the model files"""
+
+    def save(self, path):
+        Path(path).mkdir(parents=True)
+        (Path(path) / "config.json").write_text('{"dimension": 8}')
+
+
+def make_index(texts):
+    rng = np.random.default_rng(0)
+    payloads = [{"page_content": text, "metadata": {"source": "a.md"}} for text in texts]
+    return LocalIndex.build([str(n) for n in range(len(texts))], rng.standard_normal((len(texts), 8)),
+                            payloads, mode="exact")
+
+
+def test_export_verify_serve(tmp_path):
+    path = tmp_path / "index_artifact"
+    index = make_index(["First chunk", "Second chunk", "Third chunk"])
+
+    manifest = write_artifact(path, index, StubModel(), "book", "all-MiniLM-L6-v2", title="Book")
+
+    assert read_manifest(path) == manifest
+    assert (manifest["collection"], manifest["count"], manifest["dimension"]) == ("book", 3, 8)
+    assert verify_artifact(path) == []
+    assert (model_path(path) / "config.json").exists()
+    served = LocalIndex.load(index_path(path))
+    assert served.search(index.vectors[1], 1)[0][0] == 1
+    assert served.payload_by_id("2")["page_content"] == "Third chunk"
+
+
+def test_verify_reports_corrupt_files(tmp_path):
+    path = tmp_path / "index_artifact"
+    write_artifact(path, make_index(["First chunk", "Second chunk"]), StubModel(), "book", "model")
+    (index_path(path) / "payloads.json").write_text("{}")
+    (model_path(path) / "config.json").unlink()
+
+    assert sorted(verify_artifact(path)) == ["checksum mismatch for index/payloads.json", "missing model/config.json"]
+
+
+def test_rewrite_switches_versions_without_a_gap(tmp_path):
+    path = tmp_path / "index_artifact"
+    first = write_artifact(path, make_index(["Old chunk"]), StubModel(), "book", "model")
+    reader = path.resolve()
+
+    second = write_artifact(path, make_index(["New chunk", "Another chunk"]), StubModel(), "book", "model")
+
+    assert first["version"] != second["version"]
+    assert path.is_symlink() and read_manifest(path)["version"] == second["version"]
+    # A reader that resolved the link before the switch still finds its complete artifact
+    assert verify_artifact(reader) == []
+
+    third = write_artifact(path, make_index(["Newest chunk"]), StubModel(), "book", "model")
+    versions = sorted(p.name for p in tmp_path.iterdir() if p.name != "index_artifact")
+    assert versions == sorted([f"index_artifact.{second['version']}", f"index_artifact.{third['version']}"])
+
+
+def test_rewrite_replaces_an_unversioned_artifact(tmp_path):
+    path = tmp_path / "index_artifact"
+    path.mkdir()
+    (path / "manifest.json").write_text("{}")
+
+    manifest = write_artifact(path, make_index(["Chunk"]), StubModel(), "book", "model")
+
+    assert read_manifest(path)["version"] == manifest["version"]
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["index_artifact", f"index_artifact.{manifest['version']}"]
@@ -0,0 +1,22 @@
+import os
+
+import pytest
+
+pytest.importorskip("langchain_huggingface")
+pytest.importorskip("qdrant_client")
+
+# ingest_backend reads its settings at import time
+for name in ("COLLECTION_NAME", "QDRANT_URL", "QDRANT_API_KEY", "HF_API_TOKEN", "EMBEDDING_MODEL_NAME"):
+    os.environ.setdefault(name, "test")
+
+from ingest_backend import MIN_DOC_BYTES, iter_doc_paths  # noqa: E402
+
+
+def test_iter_doc_paths_skips_broken_symlinks(tmp_path):
+    """Editor lock files such as Emacs' .#chapter.md are dangling symlinks and must not stop discovery"""
+    chapter = tmp_path / "chapter.md"
+    chapter.write_text("# Chapter\n\n" + "Some content. " * MIN_DOC_BYTES)
+    (tmp_path / "short.md").write_text("# Short\n")
+    (tmp_path / ".#chapter.md").symlink_to(tmp_path / "missing-target")
+
+    assert list(iter_doc_paths(tmp_path)) == [chapter]
@@ -0,0 +1,35 @@
+import pytest
+
+from ingest_pipeline import StagedPipeline, batched
+
+
+def test_stages_run_in_order():
+    """Every stage gets its own function, applied after the stages before it"""
+    stages = [
+        lambda item: item + ["read"],
+        lambda item: item + ["chunk"],
+        lambda item: item + ["embed"],
+    ]
+    results = list(StagedPipeline(([n] for n in range(20)), stages, queue_size=2))
+    assert results == [[n, "read", "chunk", "embed"] for n in range(20)]
+
+
+def test_stages_of_different_types():
+    """A stage receives the output type of the previous stage, not its own input type"""
+    stages = [str.split, len, lambda count: count * 10]
+    assert list(StagedPipeline(["a b", "c d e", ""], stages)) == [20, 30, 0]
+
+
+def test_stage_error_is_raised_to_caller():
+    def fail_on_three(item):
+        if item == 3:
+            raise ValueError("bad item")
+        return item
+
+    with pytest.raises(ValueError, match="bad item"):
+        list(StagedPipeline(range(100), [fail_on_three, lambda item: item]))
+
+
+def test_batched():
+    assert list(batched(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(batched([], 3)) == []
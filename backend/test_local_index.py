@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from local_index import LocalIndex
+
+
+def make_corpus(size=200, dimension=64, seed=0):
+    """Clustered unit vectors, like sentence embeddings of book chunks, and queries near them"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((8, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(0, 8, size)] + 0.6 * rng.standard_normal((size, dimension)).astype(np.float32)
+    ids = [f"id-{row}" for row in range(size)]
+    payloads = [{"page_content": f"Chunk {row}",
+                 "metadata": {"source": f"chapter-{row % 4}.md", "chapter": f"chapter-{row % 4}",
+                              "alternate_sources": ["mirror.md"] if row % 10 == 0 else []}}
+                for row in range(size)]
+    queries = vectors[rng.integers(0, size, 20)] + 0.1 * rng.standard_normal((20, dimension)).astype(np.float32)
+    return ids, vectors, payloads, queries
+
+
+def exact_top(index, query, k, conditions=None):
+    return [row for row, _ in LocalIndex("exact", index.ids, index.vectors, index.payloads).search(query, k, conditions)]
+
+
+@pytest.mark.parametrize("mode", ["pca", "binary"])
+def test_recall_at_k(mode):
+    ids, vectors, payloads, queries = make_corpus()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode, pca_dims=16, oversampling=10.0)
+
+    found = [len(set(row for row, _ in index.search(query, 5)) & set(exact_top(index, query, 5)))
+             for query in queries]
+
+    assert sum(found) / (5 * len(queries)) >= 0.95
+
+
+@pytest.mark.parametrize("mode", ["exact", "pca", "binary"])
+def test_rescoring_is_exact_when_the_shortlist_covers_the_corpus(mode):
+    ids, vectors, payloads, queries = make_corpus()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode, pca_dims=16, oversampling=40.0)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    for query in queries:
+        results = index.search(query, 5)
+        assert [row for row, _ in results] == exact_top(index, query, 5)
+        expected = normalized[[row for row, _ in results]] @ (query / np.linalg.norm(query))
+        np.testing.assert_allclose([score for _, score in results], expected, rtol=1e-5)
+
+
+@pytest.mark.parametrize("mode", ["exact", "pca", "binary"])
+def test_filters_are_applied(mode):
+    ids, vectors, payloads, queries = make_corpus()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode, pca_dims=16)
+
+    for query in queries[:5]:
+        results = index.search(query, 5, {"chapter": "chapter-2"})
+        assert len(results) == 5
+        assert all(payloads[row]["metadata"]["chapter"] == "chapter-2" for row, _ in results)
+        assert [row for row, _ in results] == exact_top(index, query, 5, {"chapter": "chapter-2"})
+
+        # Chunks kept for duplicates match a filter on any of their alternate sources
+        mirrored = index.search(query, 50, {"source": "mirror.md"})
+        assert sorted(row for row, _ in mirrored) == list(range(0, 200, 10))
+
+
+def test_filter_without_matches_returns_nothing():
+    ids, vectors, payloads, queries = make_corpus()
+    index = LocalIndex.build(ids, vectors, payloads, mode="binary")
+    assert index.search(queries[0], 5, {"chapter": "missing"}) == []
+
+
+@pytest.mark.parametrize("mode", ["pca", "binary"])
+def test_save_and_mmap_load_round_trip(tmp_path, mode):
+    ids, vectors, payloads, queries = make_corpus()
+    index = LocalIndex.build(ids, vectors, payloads, mode=mode, pca_dims=16, oversampling=10.0)
+    index.save(tmp_path / "index")
+
+    loaded = LocalIndex.load(tmp_path / "index", mmap=True)
+
+    assert isinstance(loaded.vectors, np.memmap)
+    assert (loaded.mode, loaded.ids, loaded.payloads, loaded.oversampling) == (mode, ids, payloads, 10.0)
+    assert loaded.payload_by_id("id-7") == payloads[7]
+    assert loaded.payload_by_id("unknown") is None
+    for query in queries:
+        assert loaded.search(query, 5) == index.search(query, 5)
@@ -0,0 +1,125 @@
+import pytest
+
+from markdown_chunker import chunk_markdown, chunk_markdown_lines, chunk_markdown_stream, get_chunker
+
+DOCUMENT = """---
+title: "Humanoid Robots"
+sidebar_position: 2
+---
+Intro paragraph before any heading.
+
+# Hardware
+
+Actuators move the joints.
+
+## Sensors
+
+Robots sense the world with cameras and lidar.
+
+```python
+# not a heading
+read_sensors()
+```
+
+### Cameras ###
+
+Stereo cameras estimate depth.
+
+## Power
+
+Batteries limit the runtime.
+"""
+
+
+def texts(chunks):
+    return [chunk["text"] for chunk in chunks]
+
+
+def test_frontmatter_is_skipped_and_its_title_is_the_root_heading():
+    chunks = chunk_markdown(DOCUMENT)
+    assert chunks[0] == {"text": "Intro paragraph before any heading.", "heading_path": ["Humanoid Robots"],
+                         "start_line": 5}
+    assert not any("sidebar_position" in text for text in texts(chunks))
+
+
+def test_heading_paths_and_start_lines():
+    chunks = chunk_markdown(DOCUMENT)
+    assert [(chunk["heading_path"], chunk["start_line"]) for chunk in chunks] == [
+        (["Humanoid Robots"], 5),
+        (["Hardware"], 7),
+        (["Hardware", "Sensors"], 11),
+        (["Hardware", "Sensors", "Cameras"], 20),
+        (["Hardware", "Power"], 24),
+    ]
+
+
+def test_code_fences_stay_whole_and_hide_headings():
+    sensors = chunk_markdown(DOCUMENT)[2]["text"]
+    assert sensors.endswith("```python\n# not a heading\nread_sensors()\n```")
+
+
+def test_oversized_code_is_split_by_lines():
+    code = "```\n" + "\n".join(f"line_{n} = {n}" for n in range(60)) + "\n```\n"
+    chunks = texts(chunk_markdown("# Code\n\n" + code, chunk_size=200, overlap=20))
+    assert len(chunks) > 1 and all(len(chunk) <= 200 for chunk in chunks)
+    # Code lines are never cut, and code chunks do not overlap
+    lines = [line for chunk in chunks for line in chunk.split("\n") if line.startswith("line_")]
+    assert lines == [f"line_{n} = {n}" for n in range(60)]
+
+
+def test_overlap_stays_inside_a_section():
+    sentences = " ".join(f"Sentence number {n} about walking robots." for n in range(20))
+    chunks = chunk_markdown(f"# One\n\n{sentences}\n\n# Two\n\nShort text.\n", chunk_size=200, overlap=40)
+    first_section = [chunk for chunk in chunks if chunk["heading_path"] == ["One"]]
+    assert len(first_section) > 2 and all(len(chunk["text"]) <= 200 for chunk in chunks)
+    overlapping = 0
+    for previous, current in zip(first_section, first_section[1:]):
+        # Where it fits, a chunk starts with a word-aligned tail of the one before it
+        if not current["text"].startswith("Sentence"):
+            overlap = current["text"].split("\n\n")[0]
+            assert previous["text"].endswith(" " + overlap) and len(overlap) <= 40
+            overlapping += 1
+    assert overlapping > 0
+    assert chunks[-1] == {"text": "# Two\n\nShort text.", "heading_path": ["Two"], "start_line": 5}
+
+
+def test_no_overlap_when_disabled():
+    sentences = " ".join(f"Sentence number {n} about walking robots." for n in range(20))
+    chunks = texts(chunk_markdown(f"# One\n\n{sentences}\n", chunk_size=200, overlap=0))
+    assert " ".join(chunk.replace("# One\n\n", "") for chunk in chunks) == sentences
+
+
+def test_unclosed_frontmatter_is_text():
+    chunks = chunk_markdown("---\ntitle: X\n\nNo closing line.\n")
+    assert texts(chunks) == ["---\ntitle: X\n\nNo closing line."]
+
+
+@pytest.mark.parametrize("document", [
+    DOCUMENT,
+    "---\ntitle: X\n---\nIntro para.\n\n# H1\n\nText.\n",
+    "---\r\ntitle: X\r\n---\r\nIntro para.\r\n\r\n# H1\r\n\r\nText.",
+    "---\ntitle: X\n\nnever closed\n# H1\n\nText.\n",
+    "----\nNot frontmatter.\n# H1\n\n```\n# code\n",
+])
+def test_any_split_of_the_input_gives_the_same_chunks(document):
+    expected = chunk_markdown(document, chunk_size=60, overlap=10)
+    for offset in range(len(document) + 1):
+        pieces = [document[:offset], document[offset:]]
+        assert list(chunk_markdown_stream(pieces, chunk_size=60, overlap=10)) == expected, offset
+    for size in (1, 2, 3, 4, 8):
+        pieces = [document[i:i + size] for i in range(0, len(document), size)]
+        assert list(chunk_markdown_stream(pieces, chunk_size=60, overlap=10)) == expected, size
+    assert list(chunk_markdown_lines(document.splitlines(keepends=True), chunk_size=60, overlap=10)) == expected
+
+
+def test_recursive_fallback_chunker():
+    pytest.importorskip("langchain_text_splitters")
+    chunks = list(get_chunker("recursive")([DOCUMENT], chunk_size=200, overlap=20))
+    assert all(len(chunk["text"]) <= 200 and chunk["heading_path"] == [] for chunk in chunks)
+    assert "Batteries limit the runtime." in chunks[-1]["text"]
+
+
+def test_unknown_chunker():
+    assert get_chunker(None) is chunk_markdown_stream
+    with pytest.raises(ValueError, match="Unknown chunker"):
+        get_chunker("sentences")
@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+
+import request_scheduler
+from request_scheduler import BULK, INTERACTIVE, FairQueue, QueueFull
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """Fake clock, so the recorded waits are deterministic"""
+    now = [10.0]
+    monkeypatch.setattr(request_scheduler.time, "perf_counter", lambda: now[0])
+    return now
+
+
+def make_queue(concurrency=1, preempt=False, **bulk):
+    return FairQueue("search", concurrency, {
+        INTERACTIVE: {"weight": 4, "preempt": preempt},
+        BULK: dict({"weight": 1}, **bulk),
+    })
+
+
+def grant_order(queue, calls):
+    """Enqueue the calls behind one held slot, then release slot after slot and record who got it"""
+    holder = queue._enqueue(INTERACTIVE)
+    waiters = [(name, queue._enqueue(priority)) for name, priority in calls]
+    held, order = holder, []
+    while True:
+        queue._release(INTERACTIVE if held is holder else held.priority)
+        granted = [(name, waiter) for name, waiter in waiters if waiter.granted.is_set() and name not in order]
+        if not granted:
+            return order
+        order.append(granted[0][0])
+        held = granted[0][1]
+
+
+def test_weighted_fair_queuing_between_classes():
+    """
+    Interactive calls (weight 4) get four slots for every slot of a bulk call (weight 1); on equal
+    finish tags the class listed first wins
+    """
+    calls = [(f"b{n}", BULK) for n in range(3)] + [(f"i{n}", INTERACTIVE) for n in range(10)]
+    assert grant_order(make_queue(), calls) == [
+        "i0", "i1", "i2", "i3", "b0", "i4", "i5", "i6", "i7", "b1", "i8", "i9", "b2",
+    ]
+
+
+def test_preempting_class_is_granted_first():
+    calls = [(f"b{n}", BULK) for n in range(3)] + [(f"i{n}", INTERACTIVE) for n in range(3)]
+    assert grant_order(make_queue(preempt=True), calls) == ["i0", "i1", "i2", "b0", "b1", "b2"]
+
+
+def test_capped_class_leaves_slots_for_others():
+    queue = make_queue(concurrency=2, max_running=1)
+    first, second = queue._enqueue(BULK), queue._enqueue(BULK)
+    interactive = queue._enqueue(INTERACTIVE)
+
+    assert first.granted.is_set() and not second.granted.is_set()
+    assert interactive.granted.is_set()
+
+
+def test_max_queued_rejects_further_waiting_calls():
+    queue = make_queue(max_queued=2)
+    running = queue._enqueue(BULK)
+    queue._enqueue(BULK)
+    queue._enqueue(BULK)
+
+    with pytest.raises(QueueFull):
+        queue._enqueue(BULK)
+    # Interactive calls are not limited by the bulk queue
+    queue._enqueue(INTERACTIVE)
+    assert running.granted.is_set()
+    assert queue.stats()[BULK] == {"running": 1, "waiting": 2, "granted": 1, "rejected": 1, "mean_wait_ms": 0.0}
+
+
+def test_slot_is_released_when_the_call_fails():
+    queue = make_queue()
+    with pytest.raises(ValueError):
+        with queue.slot(INTERACTIVE):
+            raise ValueError("upstream error")
+
+    with queue.slot(BULK):
+        assert queue.stats()[BULK]["running"] == 1
+    assert queue.stats()[INTERACTIVE]["running"] == 0
+    assert queue._free == 1
+
+
+class InterruptedEvent(threading.Event):
+    """Event whose wait is interrupted, like a cancelled worker thread"""
+
+    def wait(self, timeout=None):
+        raise KeyboardInterrupt
+
+
+def test_waiting_call_leaves_the_queue_when_interrupted(monkeypatch):
+    queue = make_queue()
+    holder = queue._enqueue(INTERACTIVE)
+    monkeypatch.setattr(request_scheduler.threading, "Event", InterruptedEvent)
+
+    with pytest.raises(KeyboardInterrupt):
+        with queue.slot(BULK):
+            pass
+
+    assert queue.stats()[BULK]["waiting"] == 0
+    queue._release(holder.priority)
+    assert queue._free == 1
+
+
+def test_mean_wait_uses_the_time_until_granted(clock):
+    queue = make_queue()
+    holder = queue._enqueue(INTERACTIVE)
+    queue._enqueue(BULK)
+
+    clock[0] += 0.5
+    queue._release(holder.priority)
+
+    assert queue.stats()[BULK]["mean_wait_ms"] == 500.0
+    assert queue.stats()[INTERACTIVE]["mean_wait_ms"] == 0.0
+
+
+def test_blocked_call_runs_once_the_slot_is_free():
+    queue = make_queue()
+    release, started, done = threading.Event(), threading.Event(), []
+
+    def blocking_call():
+        with queue.slot(INTERACTIVE):
+            started.set()
+            release.wait(5)
+
+    def waiting_call():
+        with queue.slot(BULK):
+            done.append(BULK)
+
+    holder = threading.Thread(target=blocking_call)
+    holder.start()
+    started.wait(5)
+    waiter = threading.Thread(target=waiting_call)
+    waiter.start()
+    waiter.join(0.1)
+    assert done == [] and queue.stats()[BULK]["waiting"] == 1
+
+    release.set()
+    for thread in (holder, waiter):
+        thread.join(5)
+    assert done == [BULK]
+    assert queue._free == 1
@@ -0,0 +1,31 @@
+import numpy as np
+
+from rag_pipeline import shape_sources, source_from_payload
+from session_store import SessionStore
+
+
+def add_turn(store, session_id, sources):
+    store.get(session_id).add_turn("question", np.ones(2, dtype=np.float32), {}, sources, "answer")
+
+
+def test_invalidate_sources_checks_alternate_sources():
+    """A chunk kept as the representative of a duplicate goes stale when the duplicate's file changes"""
+    store = SessionStore()
+    representative = source_from_payload(
+        1, {"page_content": "Text", "metadata": {"source": "a.md", "alternate_sources": ["b.md"]}}, 0.9
+    )
+    add_turn(store, "mirrored", [representative])
+    add_turn(store, "unrelated", [source_from_payload(2, {"page_content": "Text", "metadata": {"source": "c.md"}})])
+
+    store.invalidate_sources(["b.md"])
+
+    assert store.get("mirrored").snapshot()[0].sources == []
+    assert len(store.get("unrelated").snapshot()[0].sources) == 1
+
+
+def test_alternate_sources_are_not_sent_to_clients():
+    source = source_from_payload(
+        1, {"page_content": "Text", "metadata": {"source": "a.md", "alternate_sources": ["b.md"]}}, 0.9
+    )
+    assert "alternate_sources" not in shape_sources([source], True, None)[0]
+    assert "alternate_sources" not in shape_sources([source], False, 10)[0]
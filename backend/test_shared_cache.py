@@ -0,0 +1,126 @@
+import threading
+
+import shared_cache
+from shared_cache import SharedCache
+
+
+def open_workers(tmp_path, **kwargs):
+    """Two caches on one database file, like two worker processes on a host"""
+    path = tmp_path / "cache.sqlite"
+    return SharedCache(path, "book", **kwargs), SharedCache(path, "book", **kwargs)
+
+
+def test_values_are_shared_between_connections(tmp_path):
+    first, second = open_workers(tmp_path)
+    first.set_json("answer", "what is ros?", {"answer": "A robot framework"})
+    first.set_vector("embedding", "what is ros?", [0.5, 0.25])
+
+    assert second.get_json("answer", "what is ros?") == {"answer": "A robot framework"}
+    assert second.get_vector("embedding", "what is ros?") == [0.5, 0.25]
+    assert second.get_json("answer", "unknown") is None
+    assert second.stats() == {"hits": 2, "misses": 1, "entries": 2}
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    first, second = open_workers(tmp_path, ttl_seconds=60)
+    now = 1000.0
+    monkeypatch.setattr(shared_cache.time, "time", lambda: now)
+    first.set("answer", "question", b"value")
+
+    now = 1059.0
+    assert second.get("answer", "question") == b"value"
+    now = 1061.0
+    assert second.get("answer", "question") is None
+
+
+def test_invalidation_hides_entries_from_every_connection(tmp_path):
+    first, second = open_workers(tmp_path)
+    first.set("answer", "question", b"old")
+    version = second.version()
+
+    assert first.invalidate({"sources": ["a.md"]})
+
+    assert second.version() == version + 1
+    assert second.get("answer", "question") is None
+    second.set("answer", "question", b"new")
+    assert first.get("answer", "question") == b"new"
+
+
+def test_invalidations_since_replays_missed_invalidations(tmp_path):
+    first, second = open_workers(tmp_path)
+    version = second.version()
+    first.invalidate({"sources": ["a.md"]})
+    first.invalidate({"sources": ["b.md"], "book": "other"})
+
+    assert second.invalidations_since(version) == [
+        (version + 1, {"sources": ["a.md"]}),
+        (version + 2, {"sources": ["b.md"], "book": "other"}),
+    ]
+    assert second.invalidations_since(version + 2) == []
+
+
+def test_invalidations_since_gives_up_on_pruned_invalidations(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared_cache, "KEPT_INVALIDATIONS", 2)
+    first, second = open_workers(tmp_path)
+    for n in range(4):
+        first.invalidate({"sources": [f"{n}.md"]})
+
+    assert second.invalidations_since(0) is None
+    assert [version for version, _ in second.invalidations_since(2)] == [3, 4]
+
+
+def test_counters_are_counted_per_version(tmp_path):
+    first, second = open_workers(tmp_path)
+    first.set_json("answer", "question", {"answer": "A"})
+    for _ in range(3):
+        second.increment("answer", "question")
+
+    assert list(first.iter_json("answer", min_count=3)) == [{"answer": "A"}]
+    assert list(first.iter_json("answer", min_count=4)) == []
+    first.invalidate()
+    first.set_json("answer", "question", {"answer": "B"})
+    assert list(second.iter_json("answer", min_count=1)) == []
+
+
+def test_trim_evicts_least_recently_used_entries(tmp_path, monkeypatch):
+    first, _ = open_workers(tmp_path, max_entries=2)
+    now = 1000.0
+    monkeypatch.setattr(shared_cache.time, "time", lambda: now)
+    for key in ("a", "b", "c"):
+        now += 1
+        first.set("answer", key, key.encode())
+
+    first.trim()
+
+    assert first.get("answer", "a") is None
+    assert first.get("answer", "c") == b"c"
+
+
+def test_hit_counters_are_exact_across_threads(tmp_path):
+    cache, _ = open_workers(tmp_path)
+    cache.set("answer", "question", b"value")
+
+    def read():
+        for _ in range(200):
+            cache.get("answer", "question")
+            cache.get("answer", "missing")
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1600, 1600)
+
+
+def test_database_errors_do_not_raise(tmp_path):
+    cache, _ = open_workers(tmp_path)
+    # A closed connection fails every statement with a sqlite3.Error, like a locked database
+    cache._connection().close()
+
+    assert cache.get("answer", "question") is None
+    cache.set("answer", "question", b"value")
+    assert cache.invalidate({"sources": ["a.md"]}) is False
+    assert cache.stats()["entries"] is None
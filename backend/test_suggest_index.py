@@ -0,0 +1,113 @@
+import pytest
+
+import suggest_index
+from shared_cache import SharedCache
+from suggest_index import (
+    SuggestIndex,
+    markdown_headings,
+    suggestible_cached_answer,
+    suggestible_question,
+)
+
+
+def texts(suggestions):
+    return [suggestion["text"] for suggestion in suggestions]
+
+
+def test_prefix_matches_start_of_text():
+    index = SuggestIndex([("What is ROS 2?", "precomputed"), ("What is a humanoid robot?", "cached"),
+                          ("Why use simulation?", "heading")])
+    assert texts(index.suggest("what is r")) == ["What is ROS 2?"]
+    assert texts(index.suggest("WHAT IS")) == ["What is ROS 2?", "What is a humanoid robot?"]
+    assert index.suggest("") == [] and index.suggest("?!") == []
+
+
+def test_prefix_matches_later_words_after_matches_at_the_start():
+    index = SuggestIndex([("What sensors does a humanoid robot use?", "precomputed"),
+                          ("Sensors and actuators", "heading")])
+    assert texts(index.suggest("sensors")) == ["Sensors and actuators", "What sensors does a humanoid robot use?"]
+    assert texts(index.suggest("humanoid rob")) == ["What sensors does a humanoid robot use?"]
+
+
+def test_only_the_first_words_are_matched():
+    index = SuggestIndex([("one two three four five six seven eight", "heading")])
+    assert texts(index.suggest("six")) == ["one two three four five six seven eight"]
+    assert index.suggest("seven") == []
+
+
+def test_trailing_space_completes_the_word():
+    index = SuggestIndex([("Robot arm kinematics", "heading"), ("Robot armature", "heading")])
+    assert texts(index.suggest("robot arm ")) == ["Robot arm kinematics"]
+    assert len(index.suggest("robot arm")) == 2
+
+
+def test_answered_kinds_rank_first_and_duplicates_keep_the_best_kind():
+    index = SuggestIndex([("How do robots walk?", "heading"), ("How do robots see?", "cached"),
+                          ("How do robots balance?", "precomputed"), ("how do robots walk", "cached")])
+    assert index.suggest("how do") == [
+        {"text": "How do robots balance?", "kind": "precomputed"},
+        {"text": "How do robots see?", "kind": "cached"},
+        {"text": "how do robots walk", "kind": "cached"},
+    ]
+    assert len(index) == 3 and index.count("heading") == 0
+
+
+def test_scan_limit_keeps_each_kind_reachable(monkeypatch):
+    monkeypatch.setattr(suggest_index, "SCAN_LIMIT", 5)
+    cached = [(f"What is topic {n:03d}?", "cached") for n in range(50)]
+    index = SuggestIndex(cached + [("What is ROS 2?", "precomputed")])
+
+    suggestions = index.suggest("what", limit=10)
+
+    assert suggestions[0] == {"text": "What is ROS 2?", "kind": "precomputed"}
+    # Only SCAN_LIMIT keys of the cached kind are ranked
+    assert len(suggestions) == 6
+
+
+def test_markdown_headings_skip_code():
+    text = "# Title\n\nText\n\n## Section ##\n\n```bash\n# not a heading\n```\n\n#### Too deep\n"
+    assert markdown_headings(text) == ["Title", "Section"]
+
+
+@pytest.mark.parametrize("question, suggestible", [
+    ("What is ROS 2?", True),
+    ("explain inverse kinematics", True),
+    ("Humanoid robots and their sensors?", True),
+    ("Humanoid robots and their sensors", False),
+    ("What is", False),
+    ("What is " + "very " * 20 + "long?", False),
+    ("Call me at 5551234567, what is ROS?", False),
+    ("What is https://example.com about?", False),
+    ("What is <script>?", False),
+])
+def test_suggestible_question(question, suggestible):
+    assert suggestible_question(question) == suggestible
+
+
+@pytest.mark.parametrize("cached, suggestible", [
+    ({"question": "What is ROS 2?", "route": "llm"}, True),
+    ({"question": "What is ROS 2?", "route": "extractive"}, True),
+    ({"question": "What is ROS 2?", "route": "not_covered"}, False),
+    # Answers cached before routing was recorded
+    ({"question": "What is ROS 2?"}, False),
+    ({"question": "asdf", "route": "llm"}, False),
+    ({"route": "llm"}, False),
+])
+def test_suggestible_cached_answer(cached, suggestible):
+    assert suggestible_cached_answer(cached) == suggestible
+
+
+def test_cached_questions_need_enough_asks(tmp_path):
+    """Only questions asked SUGGEST_MIN_ASKS times and answered from the book are suggested"""
+    cache = SharedCache(tmp_path / "cache.sqlite", "book")
+    asked = {"What is ROS 2?": 3, "What is a humanoid robot?": 2, "What is the weather today?": 5}
+    for question, asks in asked.items():
+        route = "not_covered" if "weather" in question else "llm"
+        cache.set_json("answer", question, {"question": question, "route": route})
+        for _ in range(asks):
+            cache.increment("answer", question)
+
+    index = SuggestIndex((cached["question"], "cached") for cached in cache.iter_json("answer", min_count=3)
+                         if suggestible_cached_answer(cached))
+
+    assert texts(index.suggest("what")) == ["What is ROS 2?"]
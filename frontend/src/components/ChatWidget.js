@@ -1,6 +1,20 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import './ChatWidget.css';
 
+// --- UPDATED URLS ---
+const LOCAL_API_BASE = 'http://127.0.0.1:7860';
+const PROD_API_BASE = 'https://mohammadtouqeer-physical-ai-chatbot-new.hf.space';
+
+const apiBase = () => (
+  window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
+    ? LOCAL_API_BASE
+    : PROD_API_BASE
+);
+
+// Wait this long after the last keystroke before asking for suggestions
+const SUGGEST_DEBOUNCE_MS = 150;
+const SUGGEST_MIN_CHARS = 2;
+
 const ChatWidget = () => {
   const [isOpen, setIsOpen] = useState(false);
   const [messages, setMessages] = useState([
@@ -8,35 +22,78 @@ const ChatWidget = () => {
   ]);
   const [userInput, setUserInput] = useState('');
   const [loading, setLoading] = useState(false);
+  const [chapterOnly, setChapterOnly] = useState(false);
+  const [suggestions, setSuggestions] = useState([]);
+  // One conversation session per widget instance so follow-up questions keep their context
+  const sessionId = useRef(
+    window.crypto && window.crypto.randomUUID
+      ? window.crypto.randomUUID()
+      : `${Date.now()}-${Math.random().toString(36).slice(2)}`
+  );
+
+  // The last path segment of a docs page is its Docusaurus doc id, which the backend uses as chapter id
+  const currentChapter = () => {
+    const segments = window.location.pathname.split('/').filter(Boolean);
+    const last = segments[segments.length - 1];
+    return last && last.startsWith('chapter-') ? last : null;
+  };
+
+  // Type-ahead: already answered questions come first, so picking one is usually answered from cache
+  useEffect(() => {
+    if (userInput.trim().length < SUGGEST_MIN_CHARS) {
+      setSuggestions([]);
+      return undefined;
+    }
+    const controller = new AbortController();
+    const timer = setTimeout(async () => {
+      try {
+        const response = await fetch(
+          `${apiBase()}/api/suggest?q=${encodeURIComponent(userInput)}&limit=5`,
+          { signal: controller.signal }
+        );
+        const data = await response.json();
+        setSuggestions(data.suggestions || []);
+      } catch (error) {
+        // Suggestions are optional; a failed or aborted request just shows none
+        if (error.name !== 'AbortError') setSuggestions([]);
+      }
+    }, SUGGEST_DEBOUNCE_MS);
+    return () => {
+      clearTimeout(timer);
+      controller.abort();
+    };
+  }, [userInput]);
 
   const toggleChat = () => {
     setIsOpen(!isOpen);
   };
 
-  const handleSendMessage = async () => {
-    if (!userInput.trim()) return;
+  // `suggested` marks a picked suggestion, which the backend answers from its caches on any turn
+  const handleSendMessage = async (text = userInput, suggested = false) => {
+    if (!text.trim()) return;
 
-    const userMsg = { id: Date.now(), text: userInput, sender: 'user' };
+    const userMsg = { id: Date.now(), text, sender: 'user' };
     setMessages(prev => [...prev, userMsg]);
     
-    const queryToSend = userInput;
+    const queryToSend = text;
     setUserInput('');
+    setSuggestions([]);
     setLoading(true);
 
     try {
-        // --- UPDATED URLS ---
-        const LOCAL_API_URL = 'http://127.0.0.1:7860/api/query';
-        const PROD_API_URL = 'https://mohammadtouqeer-physical-ai-chatbot-new.hf.space/api/query';
-
-        const API_URL = window.location.hostname === 'localhost' || window.location.hostname === '127.0.0.1'
-            ? LOCAL_API_URL
-            : PROD_API_URL;
-
-        const response = await fetch(API_URL, {
+        const response = await fetch(`${apiBase()}/api/query`, {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             // Backend "question" field mang raha hai
-            body: JSON.stringify({ question: queryToSend }), 
+            body: JSON.stringify({
+                question: queryToSend,
+                session_id: sessionId.current,
+                suggested,
+                // Only snippets are shown; the full chunk is available from /api/chunk/{id}
+                include_source_text: false,
+                snippet_chars: 120,
+                ...(chapterOnly && currentChapter() ? { chapter: currentChapter() } : {}),
+            }), 
         });
 
         const data = await response.json();
@@ -95,6 +152,27 @@ const ChatWidget = () => {
             ))}
             {loading && <div className="message bot"><div className="thinking">Thinking...</div></div>}
           </div>
+          {currentChapter() && (
+            <label className="chat-scope">
+              <input
+                type="checkbox"
+                checked={chapterOnly}
+                onChange={(e) => setChapterOnly(e.target.checked)}
+              />
+              Search this chapter only
+            </label>
+          )}
+          {suggestions.length > 0 && !loading && (
+            <ul className="chat-suggestions">
+              {suggestions.map((suggestion) => (
+                <li key={suggestion.text}>
+                  <button type="button" onClick={() => handleSendMessage(suggestion.text, true)}>
+                    {suggestion.text}
+                  </button>
+                </li>
+              ))}
+            </ul>
+          )}
           <div className="chat-input-area">
             <input
               type="text"
@@ -104,7 +182,7 @@ const ChatWidget = () => {
               onChange={(e) => setUserInput(e.target.value)}
               onKeyDown={(e) => e.key === 'Enter' && handleSendMessage()}
             />
-            <button className="send-button" onClick={handleSendMessage} disabled={loading}>
+            <button className="send-button" onClick={() => handleSendMessage()} disabled={loading}>
               Send
             </button>
           </div>